@@ -0,0 +1,154 @@
+"""
+Interned component vocabulary and the normalized composition representation.
+
+Component names are interned once (after the same lowercasing that
+`matcher._normalize_comp` applies) so compositions can be stored as
+integer column ids instead of repeated string keys. Each `Material`
+normalizes its composition once into a `NormalizedComposition` that the
+matching engine and the Gemini prompt builder consume directly.
+
+Only stored records (`Material.intern`, called when a facility or company is
+indexed) add names to the vocabulary. A request payload is normalized against
+it read-only: components it does not know are kept by name in `extra`, count
+towards the total and can never overlap an interned matrix row.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .matcher import _normalize_comp
+
+# (lowercased name, display name, proportion) of a component missing from the vocabulary
+ExtraComponent = Tuple[str, str, float]
+
+
+class ComponentVocabulary:
+    """Bidirectional mapping between component names and dense integer ids."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._display: List[str] = []
+
+    def intern(self, name: str) -> int:
+        """Return the id for `name`, assigning the next free id if it is new."""
+        key = name.lower()
+        idx = self._ids.get(key)
+        if idx is None:
+            idx = len(self._names)
+            self._ids[key] = idx
+            self._names.append(key)
+            # Keep the first spelling seen (CaO, SiO2...) for human-facing output
+            self._display.append(name)
+        return idx
+
+    def lookup(self, name: str) -> Optional[int]:
+        """Return the id for `name` without interning it."""
+        return self._ids.get(name.lower())
+
+    def name(self, idx: int) -> str:
+        return self._names[idx]
+
+    def display(self, idx: int) -> str:
+        return self._display[idx]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+VOCAB = ComponentVocabulary()
+
+
+class NormalizedComposition:
+    """Immutable normalized composition: sorted component ids, proportions and their total.
+
+    `extra` holds the components the vocabulary did not know when it was built
+    (request payloads only), sorted by name; `total` includes them.
+    """
+
+    __slots__ = ("ids", "values", "total", "extra")
+
+    def __init__(self, ids: np.ndarray, values: np.ndarray, extra: Tuple[ExtraComponent, ...] = ()) -> None:
+        ids.flags.writeable = False
+        values.flags.writeable = False
+        object.__setattr__(self, "ids", ids)
+        object.__setattr__(self, "values", values)
+        object.__setattr__(self, "extra", extra)
+        object.__setattr__(self, "total", float(values.sum()) + sum(v for _, _, v in extra))
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError("NormalizedComposition is immutable")
+
+    @classmethod
+    def from_mapping(
+        cls, comp: Dict[str, float], vocab: ComponentVocabulary = VOCAB, intern: bool = False
+    ) -> "NormalizedComposition":
+        """Normalize exactly like `weighted_jaccard` does.
+
+        With `intern`, new component names are added to the vocabulary; otherwise
+        they go to `extra` and the vocabulary is left untouched.
+        """
+        display: Dict[str, str] = {}
+        for key in comp:
+            if intern:
+                vocab.intern(key)
+            display.setdefault(key.lower(), key)
+        norm = _normalize_comp(comp)
+        known, extra = [], []
+        for k, v in norm.items():
+            idx = vocab.lookup(k)
+            if idx is None:
+                extra.append((k, display[k], v))
+            else:
+                known.append((idx, v))
+        known.sort()
+        extra.sort()
+        ids = np.fromiter((i for i, _ in known), dtype=np.int64, count=len(known))
+        values = np.fromiter((v for _, v in known), dtype=np.float64, count=len(known))
+        return cls(ids, values, tuple(extra))
+
+    def __len__(self) -> int:
+        return int(self.ids.size) + len(self.extra)
+
+    def items(self, vocab: ComponentVocabulary = VOCAB) -> Iterator[Tuple[str, float]]:
+        """(display name, proportion) pairs in component id order, then the extra components."""
+        for idx, value in zip(self.ids.tolist(), self.values.tolist()):
+            yield vocab.display(idx), value
+        for _, name, value in self.extra:
+            yield name, value
+
+    def _by_name(self, vocab: ComponentVocabulary) -> Dict[str, float]:
+        named = {vocab.name(idx): value for idx, value in zip(self.ids.tolist(), self.values.tolist())}
+        named.update((key, value) for key, _, value in self.extra)
+        return named
+
+    def weighted_jaccard(self, other: "NormalizedComposition", vocab: ComponentVocabulary = VOCAB) -> float:
+        """Sum of mins over sum of maxes, without re-normalizing either side."""
+        if not len(self) or not len(other):
+            return 0.0
+        if self.extra or other.extra:
+            # A name may have been interned between the two normalizations: compare by name
+            a, b = self._by_name(vocab), other._by_name(vocab)
+            inter = sum(min(value, b[key]) for key, value in a.items() if key in b)
+            union = self.total + other.total - inter
+            return inter / union if union > 0 else 0.0
+        # Two-pointer merge over the sorted ids; cheaper than NumPy set ops at this size
+        a_ids, a_vals = self.ids.tolist(), self.values.tolist()
+        b_ids, b_vals = other.ids.tolist(), other.values.tolist()
+        i = j = 0
+        inter = 0.0
+        while i < len(a_ids) and j < len(b_ids):
+            if a_ids[i] == b_ids[j]:
+                inter += min(a_vals[i], b_vals[j])
+                i += 1
+                j += 1
+            elif a_ids[i] < b_ids[j]:
+                i += 1
+            else:
+                j += 1
+        union = self.total + other.total - inter
+        return inter / union if union > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return f"NormalizedComposition({dict(self.items())!r})"
@@ -0,0 +1,204 @@
+"""
+Cached demo dataset (fakeData.json) with pre-serialized responses.
+
+The file is parsed once and re-read only when its mtime or size changes. Each
+version is kept as a `DatasetSnapshot` that already holds the response bytes
+for `/companies/demo` and for every `/companies/demo/{id}`, plain and gzipped,
+with a strong ETag. A hot read is then one `stat` plus a dict lookup; clients
+that send `If-None-Match` get a 304 without a body.
+
+Records are indexed by the string form of their id, the key `InMemoryStore`
+uses for the same companies, so `1` and `"1"` find the same record in O(1).
+Facet bodies (`facets_body`) are built from a `RecordIndex` and kept until it
+changes; their ETag is a hash of the body, so it survives restarts.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+
+from .record_index import ListingQuery, RecordIndex, project
+
+DEFAULT_DATASET_PATH = Path(__file__).parent.parent / "fakeData.json"
+
+
+def serialize(value: Any) -> bytes:
+    """JSON bytes in the same form FastAPI's JSONResponse produces."""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    """One response body, plain and gzipped, with its strong ETag."""
+
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+    @classmethod
+    def build(cls, body: bytes, version: str) -> "CachedBody":
+        # mtime=0 keeps the gzip bytes identical across reloads of the same content
+        return cls(body, gzip.compress(body, compresslevel=6, mtime=0), f'"{version}"')
+
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    """One parsed version of the dataset file."""
+
+    data: Dict[str, Any]
+    companies: List[Dict[str, Any]]
+    by_id: Dict[str, Dict[str, Any]]
+    version: str
+    companies_body: CachedBody
+    company_bodies: Dict[str, CachedBody] = field(repr=False)
+    # Filter/pagination index over `companies`, sequence number = position
+    index: RecordIndex = field(repr=False)
+
+    def select(self, ids: List[str], fields: Optional[List[str]] = None) -> Tuple[CachedBody, List[str]]:
+        """Pre-serialized bodies of `ids` joined into one array (or their `fields`), plus the ids not found."""
+        bodies = [self.company_bodies.get(cid) for cid in ids]
+        missing = [cid for cid, b in zip(ids, bodies) if b is None]
+        if fields is None:
+            body = b"[" + b",".join(b.body for b in bodies if b is not None) + b"]"
+        else:
+            body = serialize([project(self.by_id[cid], fields) for cid in ids if cid in self.by_id])
+        key = hashlib.sha256(f"{','.join(ids)};{','.join(fields or [])}".encode("utf-8")).hexdigest()[:12]
+        return CachedBody.build(body, f"{self.version}-ids-{key}"), missing
+
+    def page(self, query: ListingQuery) -> Tuple[CachedBody, Dict[str, str]]:
+        """One filtered/paginated/projected listing page and its pagination headers.
+
+        Without `fields` the page is the pre-serialized records joined together;
+        with it only the page's records are projected and serialized.
+        """
+        page = self.index.query(query)
+        if query.fields is None:
+            body = b"[" + b",".join(self.company_bodies[str(r["id"])].body for r in page.records) + b"]"
+        else:
+            body = serialize([project(r, query.fields) for r in page.records])
+        key = hashlib.sha256(query.canonical().encode("utf-8")).hexdigest()[:12]
+        return CachedBody.build(body, f"{self.version}-q-{key}"), page.headers()
+
+
+class JsonFileDataset:
+    """A JSON file parsed once and reloaded when its mtime/size changes."""
+
+    def __init__(self, path: Path = DEFAULT_DATASET_PATH) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[DatasetSnapshot] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self.loads = 0
+
+    def snapshot(self) -> DatasetSnapshot:
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        snapshot = self._snapshot
+        if snapshot is not None and stamp == self._stamp:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or stamp != self._stamp:
+                self._snapshot = self._load()
+                self._stamp = stamp
+            return self._snapshot
+
+    def _load(self) -> DatasetSnapshot:
+        raw = self.path.read_bytes()
+        data = json.loads(raw)
+        companies = data.get("companies", [])
+        # The ETag follows the content: touching the file without changing it keeps
+        # clients' cached copies valid
+        version = hashlib.sha256(raw).hexdigest()[:20]
+        by_id = {str(c["id"]): c for c in companies if "id" in c}
+        index = RecordIndex()
+        for position, company in enumerate(by_id.values()):
+            index.put(position, company)
+        self.loads += 1
+        return DatasetSnapshot(
+            data=data,
+            companies=companies,
+            by_id=by_id,
+            version=version,
+            companies_body=CachedBody.build(serialize(companies), version),
+            company_bodies={
+                cid: CachedBody.build(serialize(c), f"{version}-{cid}") for cid, c in by_id.items()
+            },
+            index=index,
+        )
+
+
+def facets_body(index: RecordIndex, fields: List[str]) -> CachedBody:
+    """`index.facets(fields)` serialized, rebuilt only after the index changes."""
+    def build() -> CachedBody:
+        body = serialize(index.facets(fields))
+        return CachedBody.build(body, "f-" + hashlib.sha256(body).hexdigest()[:20])
+
+    return index.memo(("facets", tuple(fields)), build)
+
+
+def parse_ids(ids: str, limit: int = 1000) -> List[str]:
+    """`ids=1,5,9` -> ["1", "5", "9"]: blanks and repeats dropped, order kept."""
+    parsed = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if len(parsed) > limit:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {limit} ids per request")
+    return parsed
+
+
+def _etag_matches(if_none_match: str, etags: Tuple[str, ...]) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in candidates for etag in etags)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        if coding.strip() in ("gzip", "*"):
+            q = params.strip()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:] or 0) != 0
+            except ValueError:
+                # Malformed q-value (e.g. "q=abc"): treat the coding as not acceptable
+                return False
+    return False
+
+
+def cached_response(
+    request: Request,
+    cached: CachedBody,
+    media_type: str = "application/json",
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Serve `cached`: 304 on a matching If-None-Match, gzipped when the client accepts it."""
+    gzip_etag = cached.etag[:-1] + '-gz"'
+    accepts_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = gzip_etag if accepts_gzip else cached.etag
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        # Clients may keep the body but must revalidate (cheap: a 304)
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, (cached.etag, gzip_etag)):
+        return Response(status_code=304, headers=headers)
+    if accepts_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(cached.gzipped, media_type=media_type, headers=headers)
+    return Response(cached.body, media_type=media_type, headers=headers)
+
+
+DEMO_DATASET = JsonFileDataset()
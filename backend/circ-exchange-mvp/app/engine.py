@@ -0,0 +1,345 @@
+"""
+Batched composition matching over a NumPy composition matrix.
+
+Every facility need is stored as a row of a dense matrix over the interned
+component vocabulary, so a source waste stream can be scored against all
+needs with a handful of vector operations instead of one `weighted_jaccard`
+call per waste x need pair.
+"""
+
+from typing import Any, Collection, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .composition import VOCAB, NormalizedComposition
+from .lsh import MinHashLSH
+from .models import Facility
+
+# (facility_id, composition_similarity, waste_index, need_index)
+BestMatch = Tuple[str, float, int, int]
+
+# component id -> facility id -> number of that facility's materials containing it
+Postings = Dict[int, Dict[str, int]]
+
+
+def _post(
+    postings: Postings, facility_id: str, rows: List[NormalizedComposition], delta: int
+) -> None:
+    """Add (delta=1) or remove (delta=-1) a facility's materials from a posting map."""
+    for comp in rows:
+        # Zero-weight components can never contribute overlap
+        for cid in comp.ids[comp.values > 0].tolist():
+            bucket = postings.setdefault(cid, {})
+            count = bucket.get(facility_id, 0) + delta
+            if count > 0:
+                bucket[facility_id] = count
+            else:
+                bucket.pop(facility_id, None)
+                if not bucket:
+                    del postings[cid]
+
+
+def _dense_rows(comps: List[NormalizedComposition], width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(dense matrix, totals) of normalized compositions, one row each."""
+    matrix = np.zeros((len(comps), width), dtype=np.float64)
+    totals = np.zeros(len(comps), dtype=np.float64)
+    for r, comp in enumerate(comps):
+        matrix[r, comp.ids] = comp.values
+        totals[r] = comp.total
+    return matrix, totals
+
+
+def _block_similarities(
+    wastes: List[NormalizedComposition],
+    matrix: np.ndarray,
+    totals: np.ndarray,
+    rows: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Weighted Jaccard of each waste against the need rows of a dense matrix.
+
+    Only the columns present in a waste are gathered; `rows` selects a subset
+    of the matrix rows (all of them by default).
+    """
+    if rows is not None:
+        totals = totals[rows]
+    sims = np.zeros((len(wastes), totals.size), dtype=np.float64)
+    for w, comp in enumerate(wastes):
+        if not len(comp):
+            continue
+        block = matrix[:, comp.ids] if rows is None else matrix[np.ix_(rows, comp.ids)]
+        inter = np.minimum(block, comp.values).sum(axis=1)
+        union = comp.total + totals - inter
+        np.divide(inter, union, out=sims[w], where=union > 0)
+    return sims
+
+
+class _CompiledNeeds:
+    """Dense need matrix plus the bookkeeping to map rows back to facilities.
+
+    Upserts patch it instead of rebuilding it: a facility keeps its rows when
+    its number of needs is unchanged and otherwise gets fresh rows at the end
+    (its old ones are zeroed and counted as `stale`). Positions follow store
+    insertion order, so a facility keeps its position across updates.
+    """
+
+    def __init__(self, needs: Dict[str, List[NormalizedComposition]], width: int) -> None:
+        self.owners: List[str] = list(needs)
+        self.positions: Dict[str, int] = {fid: i for i, fid in enumerate(self.owners)}
+        lengths = np.array([len(needs[fid]) for fid in self.owners], dtype=np.int64)
+        self.ends = np.cumsum(lengths).astype(np.int64)
+        self.starts = self.ends - lengths
+        rows = [comp for encoded in needs.values() for comp in encoded]
+        self.matrix, self.totals = _dense_rows(rows, width)
+        # Rows handed out so far (live or stale) and the stale ones among them
+        self.used = len(rows)
+        self.stale = 0
+
+    def _grow(self, n_rows: int, width: int) -> None:
+        """Make room for `n_rows` rows and `width` columns, doubling to amortize copies."""
+        rows, cols = self.matrix.shape
+        if n_rows <= rows and width <= cols:
+            return
+        new_rows = rows if n_rows <= rows else max(n_rows, 2 * rows)
+        new_cols = cols if width <= cols else max(width, 2 * cols)
+        matrix = np.zeros((new_rows, new_cols), dtype=np.float64)
+        matrix[:rows, :cols] = self.matrix
+        totals = np.zeros(matrix.shape[0], dtype=np.float64)
+        totals[:rows] = self.totals
+        self.matrix, self.totals = matrix, totals
+
+    def widen(self, width: int) -> None:
+        self._grow(self.matrix.shape[0], width)
+
+    def _drop_rows(self, pos: int) -> None:
+        start, end = int(self.starts[pos]), int(self.ends[pos])
+        self.matrix[start:end] = 0.0
+        self.totals[start:end] = 0.0
+        self.stale += end - start
+
+    def put(self, facility_id: str, encoded: List[NormalizedComposition], width: int) -> None:
+        pos = self.positions.get(facility_id)
+        if pos is None:
+            pos = len(self.owners)
+            self.owners.append(facility_id)
+            self.positions[facility_id] = pos
+            self.starts = np.append(self.starts, 0)
+            self.ends = np.append(self.ends, 0)
+        elif self.ends[pos] - self.starts[pos] == len(encoded):
+            start = int(self.starts[pos])
+            self.widen(width)
+            self.matrix[start:start + len(encoded)] = 0.0
+            self._fill(start, encoded)
+            return
+        else:
+            self._drop_rows(pos)
+        start = self.used
+        self.used += len(encoded)
+        self._grow(self.used, width)
+        self.starts[pos], self.ends[pos] = start, self.used
+        self._fill(start, encoded)
+
+    def remove(self, facility_id: str) -> None:
+        pos = self.positions.pop(facility_id, None)
+        if pos is not None:
+            self._drop_rows(pos)
+
+    def _fill(self, start: int, encoded: List[NormalizedComposition]) -> None:
+        for r, comp in enumerate(encoded, start):
+            self.matrix[r, comp.ids] = comp.values
+            self.totals[r] = comp.total
+
+
+class MatchEngine:
+    """Keeps facility compositions as matrix rows and scores them in batches.
+
+    Rows are the `Material.intern` compositions computed at ingest, so
+    nothing is re-normalized on the query path.
+    """
+
+    def __init__(self) -> None:
+        self.vocab = VOCAB
+        self._wastes: Dict[str, List[NormalizedComposition]] = {}
+        self._needs: Dict[str, List[NormalizedComposition]] = {}
+        self._compiled: Optional[_CompiledNeeds] = None
+        # Inverted index: component -> facilities whose wastes / needs contain it
+        self._waste_postings: Postings = {}
+        self._need_postings: Postings = {}
+        # Weighted MinHash signatures + LSH buckets for the approximate match mode
+        self.lsh = MinHashLSH()
+
+    def upsert(self, facility: Facility) -> None:
+        # Overwrite in place (rather than remove + add) to keep store insertion order
+        _post(self._waste_postings, facility.id, self._wastes.get(facility.id, []), -1)
+        _post(self._need_postings, facility.id, self._needs.get(facility.id, []), -1)
+        # Stored facilities are what the vocabulary is built from
+        self._wastes[facility.id] = [m.intern() for m in facility.waste_streams]
+        self._needs[facility.id] = [m.intern() for m in facility.needs]
+        _post(self._waste_postings, facility.id, self._wastes[facility.id], 1)
+        _post(self._need_postings, facility.id, self._needs[facility.id], 1)
+        self.lsh.upsert(facility.id, self._wastes[facility.id], self._needs[facility.id])
+        if self._compiled is not None:
+            self._compiled.put(facility.id, self._needs[facility.id], len(self.vocab))
+            self._compact()
+
+    def remove(self, facility_id: str) -> None:
+        if facility_id not in self._wastes:
+            return
+        _post(self._waste_postings, facility_id, self._wastes.pop(facility_id), -1)
+        _post(self._need_postings, facility_id, self._needs.pop(facility_id), -1)
+        self.lsh.remove(facility_id)
+        if self._compiled is not None:
+            self._compiled.remove(facility_id)
+            self._compact()
+
+    def clear(self) -> None:
+        self._wastes.clear()
+        self._needs.clear()
+        self._waste_postings.clear()
+        self._need_postings.clear()
+        self.lsh.clear()
+        self._compiled = None
+
+    def _compact(self) -> None:
+        """Drop the compiled matrix once stale rows outnumber live ones.
+
+        It is rebuilt on the next query; as that takes as many upserts as there
+        are live rows, the rebuild cost is amortized over them.
+        """
+        compiled = self._compiled
+        if compiled is not None and compiled.stale > max(compiled.used - compiled.stale, 64):
+            self._compiled = None
+
+    def _need_matrix(self) -> _CompiledNeeds:
+        if self._compiled is None:
+            self._compiled = _CompiledNeeds(self._needs, len(self.vocab))
+        else:
+            # Components may have been interned since (by another facility's wastes)
+            self._compiled.widen(len(self.vocab))
+        return self._compiled
+
+    def overlapping_facilities(self, source_id: str) -> Set[str]:
+        """Facilities with at least one need sharing a component with the source's wastes."""
+        found: Set[str] = set()
+        for comp in self._wastes.get(source_id) or []:
+            for cid in comp.ids[comp.values > 0].tolist():
+                found.update(self._need_postings.get(cid, ()))
+        found.discard(source_id)
+        return found
+
+    def component_stats(self) -> List[Dict[str, Any]]:
+        """Posting-list sizes per component, most widespread first.
+
+        `selectivity` is the share of indexed facilities with a need containing the
+        component, i.e. the fraction of candidates a source waste with it pulls in.
+        """
+        n_facilities = len(self._needs)
+        stats = []
+        for cid in set(self._waste_postings) | set(self._need_postings):
+            wastes = self._waste_postings.get(cid, {})
+            needs = self._need_postings.get(cid, {})
+            stats.append({
+                "component": self.vocab.name(cid),
+                "waste_materials": sum(wastes.values()),
+                "need_materials": sum(needs.values()),
+                "waste_facilities": len(wastes),
+                "need_facilities": len(needs),
+                "selectivity": len(needs) / n_facilities if n_facilities else 0.0,
+            })
+        stats.sort(key=lambda s: (-(s["waste_facilities"] + s["need_facilities"]), s["component"]))
+        return stats
+
+    def similarity_matrix(
+        self, wastes: List[NormalizedComposition], rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Weighted Jaccard of each waste (rows) against compiled needs (columns).
+
+        `rows` restricts the comparison to a subset of need rows. Both sides are
+        normalized, so sum(max) = total_a + total_b - sum(min) and only the columns
+        present in the waste need to be gathered from the matrix. That sums in
+        another order than `weighted_jaccard`, so values may differ from it in the
+        last bits; `rank_candidates` settles the winners pair by pair.
+        """
+        needs = self._need_matrix()
+        if rows is None:
+            rows = np.arange(needs.used)
+        return _block_similarities(wastes, needs.matrix, needs.totals, rows)
+
+    def similarities(
+        self, source_id: str, candidate_ids: Optional[Collection[str]] = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """Best waste->need similarity for every facility that overlaps the source's wastes.
+
+        Returns facility ids in store insertion order with their best similarity;
+        facilities whose best similarity is zero are dropped. Only facilities
+        sharing a component with the source (per the inverted index) are scored,
+        further restricted to `candidate_ids` when given. The matched pair is
+        resolved separately with `best_pair`, so callers only pay for it on the
+        results they keep.
+        """
+        wastes = self._wastes.get(source_id) or []
+        needs = self._need_matrix()
+        if not wastes or not needs.owners:
+            return [], np.zeros(0)
+
+        overlap = self.overlapping_facilities(source_id)
+        if candidate_ids is not None:
+            if len(candidate_ids) < len(overlap):
+                overlap = {c for c in candidate_ids if c in overlap}
+            else:
+                overlap = {c for c in overlap if c in candidate_ids}
+        positions = np.array(sorted(needs.positions[c] for c in overlap), dtype=np.int64)
+        if positions.size == 0:
+            return [], np.zeros(0)
+
+        # Gather the need rows of the selected facilities into one contiguous block
+        lengths = needs.ends[positions] - needs.starts[positions]
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        rows = np.repeat(needs.starts[positions] - starts, lengths) + np.arange(lengths.sum())
+
+        sims = self.similarity_matrix(wastes, rows)
+        best_per_facility = np.maximum.reduceat(sims.max(axis=0), starts)
+        keep = np.flatnonzero(best_per_facility > 0)
+        return [needs.owners[p] for p in positions[keep].tolist()], best_per_facility[keep]
+
+    def reverse_similarities(self, target_id: str, source_ids: Collection[str]) -> Dict[str, float]:
+        """Best similarity of each source's wastes against the target's needs.
+
+        The reverse direction of `similarities`, used to rescore only the pairs that
+        point at a changed facility. Values are computed with the same operations as
+        `similarity_matrix`, so they are bit-for-bit equal to a forward query.
+        """
+        target_needs = self._needs.get(target_id) or []
+        if not target_needs:
+            return {}
+        matrix, totals = _dense_rows(target_needs, len(self.vocab))
+
+        found: Dict[str, float] = {}
+        for source_id in source_ids:
+            if source_id == target_id:
+                continue
+            wastes = self._wastes.get(source_id) or []
+            best = float(_block_similarities(wastes, matrix, totals).max(initial=0.0))
+            if best > 0:
+                found[source_id] = best
+        return found
+
+    def best_pair(self, source_id: str, facility_id: str) -> Tuple[int, int]:
+        """(waste index, need index) of the best pair: the first maximum when iterating
+        source wastes, then candidate needs, as in the original pure-Python loop.
+
+        Only the two facilities' own rows are used, so this never touches the
+        compiled need matrix."""
+        matrix, totals = _dense_rows(self._needs[facility_id], len(self.vocab))
+        sims = _block_similarities(self._wastes[source_id], matrix, totals)
+        w_idx, n_idx = divmod(int(sims.argmax()), matrix.shape[0])
+        return w_idx, n_idx
+
+    def best_matches(
+        self, source_id: str, candidate_ids: Optional[Collection[str]] = None
+    ) -> List[BestMatch]:
+        """`similarities` with the best pair resolved for every facility."""
+        ids, sims = self.similarities(source_id, candidate_ids)
+        return [
+            (facility_id, sim) + self.best_pair(source_id, facility_id)
+            for facility_id, sim in zip(ids, sims.tolist())
+        ]
@@ -0,0 +1,135 @@
+"""
+Weighted MinHash (ICWS) signatures and banded LSH buckets for approximate matching.
+
+Each normalized composition gets a signature from Ioffe's Improved Consistent
+Weighted Sampling: two compositions agree on any one hash with probability
+equal to their weighted Jaccard similarity. Need signatures are split into
+`bands` bands of `n_hashes // bands` rows; a source waste's candidates are the
+facilities sharing at least one band bucket with it. Fewer rows per band
+means more candidates (higher recall, slower re-rank) and vice versa.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .composition import NormalizedComposition
+
+# band index -> bucket key -> facility ids whose need signature falls in it
+BandTables = List[Dict[bytes, Set[str]]]
+
+
+class WeightedMinHasher:
+    """ICWS hash family with per-component random parameters derived from a seed."""
+
+    def __init__(self, n_hashes: int = 64, seed: int = 1) -> None:
+        self.n_hashes = n_hashes
+        self.seed = seed
+        self._params: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def _component_params(self, cid: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        params = self._params.get(cid)
+        if params is None:
+            # Seeded per component id so signatures do not depend on ingest order
+            rng = np.random.default_rng([self.seed, cid])
+            params = (
+                rng.gamma(2.0, 1.0, self.n_hashes),  # r
+                rng.gamma(2.0, 1.0, self.n_hashes),  # c
+                rng.uniform(0.0, 1.0, self.n_hashes),  # beta
+            )
+            self._params[cid] = params
+        return params
+
+    def signature(self, comp: NormalizedComposition) -> Optional[np.ndarray]:
+        """One int64 per hash packing the sampled (component id, t); None if empty."""
+        positive = comp.values > 0
+        ids, weights = comp.ids[positive], comp.values[positive]
+        if ids.size == 0:
+            return None
+        params = [self._component_params(cid) for cid in ids.tolist()]
+        r = np.stack([p[0] for p in params])
+        c = np.stack([p[1] for p in params])
+        beta = np.stack([p[2] for p in params])
+
+        t = np.floor(np.log(weights)[:, None] / r + beta)
+        ln_a = np.log(c) - r * (t - beta) - r  # log of c / (y * e^r), y = e^(r(t - beta))
+        winner = ln_a.argmin(axis=0)
+        cols = np.arange(self.n_hashes)
+        return (ids[winner].astype(np.int64) << 32) ^ (t[winner, cols].astype(np.int64) & 0xFFFFFFFF)
+
+
+class MinHashLSH:
+    """Waste/need signatures per facility plus lazily built band tables over needs."""
+
+    def __init__(self, n_hashes: int = 64, seed: int = 1) -> None:
+        self.hasher = WeightedMinHasher(n_hashes, seed)
+        self._waste_sigs: Dict[str, List[np.ndarray]] = {}
+        self._need_sigs: Dict[str, List[np.ndarray]] = {}
+        self._tables: Dict[int, BandTables] = {}
+
+    @property
+    def n_hashes(self) -> int:
+        return self.hasher.n_hashes
+
+    def _signatures(self, comps: Iterable[NormalizedComposition]) -> List[np.ndarray]:
+        sigs = (self.hasher.signature(comp) for comp in comps)
+        return [sig for sig in sigs if sig is not None]
+
+    def _band_keys(self, sig: np.ndarray, bands: int) -> Iterable[Tuple[int, bytes]]:
+        rows = self.n_hashes // bands
+        for band in range(bands):
+            yield band, sig[band * rows:(band + 1) * rows].tobytes()
+
+    def upsert(
+        self,
+        facility_id: str,
+        wastes: List[NormalizedComposition],
+        needs: List[NormalizedComposition],
+    ) -> None:
+        self.remove(facility_id)
+        self._waste_sigs[facility_id] = self._signatures(wastes)
+        self._need_sigs[facility_id] = self._signatures(needs)
+        # Keep already-built band tables current instead of rebuilding them
+        for bands, tables in self._tables.items():
+            for sig in self._need_sigs[facility_id]:
+                for band, key in self._band_keys(sig, bands):
+                    tables[band].setdefault(key, set()).add(facility_id)
+
+    def remove(self, facility_id: str) -> None:
+        self._waste_sigs.pop(facility_id, None)
+        for sig in self._need_sigs.pop(facility_id, []):
+            for bands, tables in self._tables.items():
+                for band, key in self._band_keys(sig, bands):
+                    bucket = tables[band].get(key)
+                    if bucket is not None:
+                        bucket.discard(facility_id)
+                        if not bucket:
+                            del tables[band][key]
+
+    def clear(self) -> None:
+        self._waste_sigs.clear()
+        self._need_sigs.clear()
+        self._tables.clear()
+
+    def _band_tables(self, bands: int) -> BandTables:
+        tables = self._tables.get(bands)
+        if tables is None:
+            tables = [{} for _ in range(bands)]
+            for facility_id, sigs in self._need_sigs.items():
+                for sig in sigs:
+                    for band, key in self._band_keys(sig, bands):
+                        tables[band].setdefault(key, set()).add(facility_id)
+            self._tables[bands] = tables
+        return tables
+
+    def candidates(self, source_id: str, bands: int) -> Set[str]:
+        """Facilities with a need sharing at least one band bucket with a source waste."""
+        if not 1 <= bands <= self.n_hashes:
+            raise ValueError(f"bands must be between 1 and {self.n_hashes}")
+        tables = self._band_tables(bands)
+        found: Set[str] = set()
+        for sig in self._waste_sigs.get(source_id, []):
+            for band, key in self._band_keys(sig, bands):
+                found.update(tables[band].get(key, ()))
+        found.discard(source_id)
+        return found
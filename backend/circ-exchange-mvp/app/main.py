@@ -1,31 +1,69 @@
+import json
 import os
-from typing import List, Tuple, Optional
-from fastapi import FastAPI, HTTPException, Query, status
+from contextlib import asynccontextmanager
+from typing import Dict, List, Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
-from .models import Facility, Material, Candidate, MatchResponse, ExplainRequest
-from .store import STORE
-from .matcher import haversine_km, weighted_jaccard, score_match
-from .routes import analyze, companies, ask
+from .models import Facility, Candidate, MatchResponse, BatchMatchRequest, ExplainRequest
+from .dataset import parse_ids
+from .store import STORE, StoreSyncMiddleware
+from .match_view import SEARCH_RADIUS_FACTOR, Ranked, rank_candidates
+from .routes import analyze, companies, ask, jobs
+from .match_jobs import MATCH_JOBS
 from .sample_data import load_sample_data
 from .sample_data_new import load_fake_data
+from .services.gemini_client import (
+    CLIENT_STATS, GeminiClient, close_gemini_client, configure_genai, gemini_client_dependency,
+)
+from .services.llm_cache import ANALYSIS_CACHE
+from .services.llm_executor import LLM_EXECUTOR
+from .services.llm_metrics import LLM_METRICS, EndpointMiddleware
+from .services.resilience import LLM_GUARD
+from .services.single_flight import SINGLE_FLIGHT
+from .services.sse import sse_response
 
 # Load .env for GOOGLE_API_KEY (Gemini)
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The shared Gemini client is created lazily on first use (the key may be absent)
+    if MATCH_JOBS.workers > 0:
+        # Pick up match jobs interrupted by the last shutdown or crash
+        MATCH_JOBS.resume()
+    yield
+    MATCH_JOBS.shutdown()
+    STORE.close()
+    close_gemini_client()
+    LLM_EXECUTOR.shutdown()
+    ANALYSIS_CACHE.close()
+
+
 app = FastAPI(
     title="Industrial Symbiosis Waste Stream Matchmaker", 
     version="1.0.0",
-    description="AI-powered API backend for waste stream matching using Google Gemini"
+    description="AI-powered API backend for waste stream matching using Google Gemini",
+    lifespan=lifespan,
 )
 
+# Cached Gemini analyses involving a company are dropped when it is upserted
+STORE.company_listeners.append(ANALYSIS_CACHE.invalidate_company)
+
 # CORS for local dev and production
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost", "http://localhost:3000", "http://localhost:3001", "http://localhost:5173"],
-    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
+# Lets LLM metrics attribute each provider call to the endpoint that made it
+app.add_middleware(EndpointMiddleware)
+if STORE.shared:
+    # Picks up companies/facilities written by other workers (STORE_BACKEND=sqlite)
+    app.add_middleware(StoreSyncMiddleware, store=STORE)
 
 
 @app.get("/")
@@ -37,6 +75,25 @@ def root():
     }
 
 
+@app.get("/llm/stats")
+def llm_stats():
+    """Shared client setup, concurrency, coalescing, rate limiting/breaker, cache and per-endpoint usage."""
+    return {
+        "client": CLIENT_STATS,
+        "executor": {"max_concurrency": LLM_EXECUTOR.max_concurrency, "in_flight": LLM_EXECUTOR.in_flight},
+        "single_flight": SINGLE_FLIGHT.stats(),
+        "guard": LLM_GUARD.stats(),
+        "cache": ANALYSIS_CACHE.stats(),
+        "usage": LLM_METRICS.rollups(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """LLM latency, token, cost, cache and fallback metrics (Prometheus text format)."""
+    return PlainTextResponse(LLM_METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/load-sample-data")
 def load_sample_data_endpoint():
     """Load sample companies from fakeData.json into the database."""
@@ -60,66 +117,151 @@ def add_facility(facility: Facility):
 
 @app.post("/facilities/bulk")
 def add_facilities_bulk(facilities: List[Facility]):
-    count = 0
-    for f in facilities:
-        STORE.upsert_facility(f)
-        count += 1
-    return {"inserted": count}
+    STORE.upsert_facilities(facilities)
+    return {"inserted": len(facilities)}
 
 
 @app.get("/facilities", response_model=List[Facility])
-def list_facilities():
-    return STORE.list_facilities()
+def list_facilities(
+    response: Response,
+    ids: Optional[str] = Query(None, description="Comma-separated ids: only these facilities, in this order"),
+):
+    if ids is None:
+        return STORE.list_facilities()
+    found = [(fid, STORE.get_facility(fid)) for fid in parse_ids(ids)]
+    missing = [fid for fid, facility in found if facility is None]
+    if missing:
+        response.headers["X-Missing-Ids"] = ",".join(missing)
+    return [facility for _, facility in found if facility is not None]
+
+
+@app.get("/facilities/{facility_id}", response_model=Facility)
+def get_facility(facility_id: str):
+    facility = STORE.get_facility(facility_id)
+    if facility is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Facility {facility_id} not found")
+    return facility
+
+
+@app.post("/match/batch")
+def match_batch(req: BatchMatchRequest):
+    """Match many source facilities in one pass, streamed back as NDJSON.
+
+    Each line is {"facility_id": ..., "candidates": [...]} with the same candidates
+    GET /match/{facility_id} would return, or {"facility_id": ..., "error": ...} for
+    unknown ids. Sources are visited in spatial order so the distance work done for
+    one source is reused by its neighbours; lines are not in request order.
+    """
+    facility_ids = list(STORE.facilities) if req.facility_ids == "all" else req.facility_ids
+    factor = req.radius_factor or SEARCH_RADIUS_FACTOR
+
+    def lines():
+        for facility_id in facility_ids:
+            if STORE.get_facility(facility_id) is None:
+                yield json.dumps({"facility_id": facility_id, "error": f"Facility {facility_id} not found"}) + "\n"
+
+        pairs = STORE.facility_grid.within_many(facility_ids, req.radius_km * factor)
+        for facility_id, nearby in pairs:
+            source = STORE.get_facility(facility_id)
+            candidates = top_candidates(source, nearby, req.radius_km, req.top_k)
+            yield json.dumps({
+                "facility_id": facility_id,
+                "candidates": [c.model_dump(mode="json") for c in candidates],
+            }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/match/view/status")
+def match_view_status():
+    """Version and freshness of the materialized top-K match lists."""
+    return STORE.match_view.status()
 
 
 @app.get("/match/{facility_id}", response_model=MatchResponse)
 def match_facility(
     facility_id: str,
+    response: Response,
     radius_km: float = Query(500.0, ge=1.0, le=2000.0),
     top_k: int = Query(5, ge=1, le=50),
+    radius_factor: float = Query(
+        SEARCH_RADIUS_FACTOR, ge=1.0, le=10.0,
+        description="Only candidates within radius_km * radius_factor are considered",
+    ),
+    mode: Literal["exact", "approx"] = Query(
+        "exact", description="approx: re-rank only MinHash LSH candidates"
+    ),
+    bands: int = Query(
+        16, ge=1, le=64,
+        description="LSH bands in approx mode; more bands = higher recall, slower queries",
+    ),
 ):
     source = STORE.get_facility(facility_id)
     if not source:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Facility {facility_id} not found")
 
-    candidates: List[Candidate] = []
-    for cand in STORE.list_facilities():
-        if cand.id == source.id:
-            continue
+    view = STORE.match_view
+    if mode == "exact" and view.covers(radius_km, radius_factor, top_k):
+        # Default query: served from the materialized top-K list (rebuilt first if stale)
+        response.headers["X-Match-View"] = "fresh" if view.is_fresh(source.id) else "refreshed"
+        ranked = view.lookup(source.id, top_k)
+    else:
+        response.headers["X-Match-View"] = "bypass"
+        # Spatial pre-filter: only facilities inside the search radius are scored
+        nearby = STORE.facilities_within(source.latitude, source.longitude, radius_km * radius_factor)
+        ranked = rank_candidates(
+            STORE, source.id, nearby, radius_km, top_k, bands if mode == "approx" else None
+        )
 
-        dist = haversine_km(source.latitude, source.longitude, cand.latitude, cand.longitude)
+    return MatchResponse(source_facility=source, candidates=build_candidates(source, ranked))
 
-        best_sim = 0.0
-        best_pair: Tuple[Optional[Material], Optional[Material]] = (None, None)
 
-        # Compare every source waste to every candidate need and pick best matching pair
-        for w in source.waste_streams:
-            for n in cand.needs:
-                sim = weighted_jaccard(w.composition, n.composition)
-                if sim > best_sim:
-                    best_sim = sim
-                    best_pair = (w, n)
+def top_candidates(
+    source: Facility, nearby: Dict[str, float], radius_km: float, top_k: int
+) -> List[Candidate]:
+    """Rank nearby facilities for `source` and build Candidate records for the top_k only."""
+    return build_candidates(source, rank_candidates(STORE, source.id, nearby, radius_km, top_k))
 
-        if best_sim <= 0:
-            # no chemical overlap, skip candidate
-            continue
 
-        score = score_match(best_sim, dist, radius_km)
-        # Construct Candidate record
+def build_candidates(source: Facility, ranked: List[Ranked]) -> List[Candidate]:
+    """Materialize Candidate records from the matched pairs recorded while ranking."""
+    candidates: List[Candidate] = []
+    for neg_score, dist, _, cand_id, sim, waste_idx, need_idx in ranked:
+        cand = STORE.get_facility(cand_id)
         candidates.append(
             Candidate(
-                facility_id=cand.id,
+                facility_id=cand_id,
                 distance_km=dist,
-                composition_similarity=best_sim,
-                score=score,
-                matched_waste=best_pair[0],
-                matched_need=best_pair[1],
+                composition_similarity=sim,
+                score=-neg_score,
+                matched_waste=source.waste_streams[waste_idx],
+                matched_need=cand.needs[need_idx],
             )
         )
+    return candidates
 
-    # Sort by score desc, then distance asc and return top_k
-    candidates.sort(key=lambda c: (-c.score, c.distance_km))
-    return MatchResponse(source_facility=source, candidates=candidates[:top_k])
+
+@app.get("/components/stats")
+def component_stats():
+    """Posting-list sizes of the inverted component index used by /match."""
+    return {
+        "facilities": len(STORE.facilities),
+        "components": STORE.engine.component_stats(),
+    }
+
+
+def explain_prompt(req: ExplainRequest) -> str:
+    """Prompt shared by /explain and /explain/stream."""
+    return (
+        "You are an industrial symbiosis expert. Explain briefly why this waste->need match is promising, "
+        "note 1-2 risks, and propose 2 concrete next steps. Keep it concise.\n\n"
+        f"Source: {req.source.name} (lat={req.source.latitude}, lon={req.source.longitude})\n"
+        f"Candidate: {req.candidate.name} (lat={req.candidate.latitude}, lon={req.candidate.longitude})\n"
+        f"Distance km: {req.distance_km:.1f}\n"
+        f"Matched waste: {req.matched_waste.name} comp={req.matched_waste.composition}\n"
+        f"Matched need: {req.matched_need.name} comp={req.matched_need.composition}\n"
+        f"Score: {req.score:.2f}\n"
+    )
 
 
 @app.post("/explain")
@@ -139,18 +281,9 @@ def explain_match(req: ExplainRequest):
         # Per spec, return 400 when the key is missing
         raise HTTPException(status_code=400, detail="Missing GOOGLE_API_KEY in environment; set it in .env or env vars to enable /explain")
 
-    genai.configure(api_key=api_key)
+    configure_genai(api_key)
 
-    prompt = (
-        "You are an industrial symbiosis expert. Explain briefly why this waste->need match is promising, "
-        "note 1-2 risks, and propose 2 concrete next steps. Keep it concise.\n\n"
-        f"Source: {req.source.name} (lat={req.source.latitude}, lon={req.source.longitude})\n"
-        f"Candidate: {req.candidate.name} (lat={req.candidate.latitude}, lon={req.candidate.longitude})\n"
-        f"Distance km: {req.distance_km:.1f}\n"
-        f"Matched waste: {req.matched_waste.name} comp={req.matched_waste.composition}\n"
-        f"Matched need: {req.matched_need.name} comp={req.matched_need.composition}\n"
-        f"Score: {req.score:.2f}\n"
-    )
+    prompt = explain_prompt(req)
 
     # Use the simple higher-level generate API; model choice per spec.
     model = "gemini-1.5-flash"
@@ -163,7 +296,18 @@ def explain_match(req: ExplainRequest):
     return {"explanation": text}
 
 
+@app.post("/explain/stream")
+async def explain_match_stream(
+    req: ExplainRequest, gemini_client: GeminiClient = Depends(gemini_client_dependency)
+):
+    """Same explanation as /explain, streamed as server-sent events as Gemini writes it."""
+    return sse_response(
+        gemini_client.stream_text(explain_prompt(req), output_tokens=300, operation="explain_stream")
+    )
+
+
 # Include new API routes
 app.include_router(analyze.router)
 app.include_router(companies.router)
 app.include_router(ask.router)
+app.include_router(jobs.router)
@@ -0,0 +1,429 @@
+"""
+Background jobs for full-catalog company matching.
+
+`/companies/matches` answers inside one HTTP request, which is too slow once
+many pairs go to Gemini. Creating a match job only records it; a pool of
+worker threads then ranks the company pairs and snapshots them into SQLite,
+and scores them in chunks (the first `shortlist` pairs with Gemini, `batch_size` per prompt, the
+rest with the local score). Each chunk's results and progress are committed
+in one transaction, so a restarted process resumes every unfinished job from
+the pairs that have no result yet. A job interrupted before its pairs were
+snapshotted cannot be resumed and is marked failed.
+
+Jobs are run by the process that owns the database file; run one API worker
+with jobs enabled (`MATCH_JOB_WORKERS=0` disables them in the others).
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .models import Company, MatchResult
+from .prefilter import PairScore, local_analysis, local_score, rank_company_pairs
+from .services.gemini_client import get_gemini_client
+from .services.llm_metrics import LLM_METRICS, metrics_endpoint
+
+DEFAULT_JOBS_PATH = Path(__file__).parent.parent / "match_jobs.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_companies (
+    job_id TEXT NOT NULL,
+    company_id TEXT NOT NULL,
+    company TEXT NOT NULL,
+    PRIMARY KEY (job_id, company_id)
+);
+CREATE TABLE IF NOT EXISTS job_pairs (
+    job_id TEXT NOT NULL,
+    pair_index INTEGER NOT NULL,
+    producer_id TEXT NOT NULL,
+    consumer_id TEXT NOT NULL,
+    distance_km REAL NOT NULL,
+    PRIMARY KEY (job_id, pair_index)
+);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    pair_index INTEGER NOT NULL,
+    compatibility_score INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, pair_index)
+);
+CREATE INDEX IF NOT EXISTS job_results_rank ON job_results (job_id, compatibility_score DESC, pair_index);
+"""
+
+UNFINISHED = ("queued", "running")
+
+# Results read per query by `results`
+_RESULTS_PAGE = 500
+
+
+class MatchJobManager:
+    """SQLite-checkpointed match jobs processed by a pool of worker threads."""
+
+    def __init__(self, path: str = str(DEFAULT_JOBS_PATH), workers: int = 2) -> None:
+        self.path = path
+        self.workers = workers
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # (job id, pair indices to score), or (job id, None) to rank and snapshot its pairs
+        self._queue: "queue.Queue[Optional[Tuple[str, Optional[List[int]]]]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        # job id -> (monotonic time, pairs done) when this process started working on it
+        self._progress_start: Dict[str, Tuple[float, int]] = {}
+        # job id -> pairs (rebuilt from the checkpoint after a restart)
+        self._pairs: Dict[str, List[PairScore]] = {}
+        # job id -> companies of a job whose pairs are not snapshotted yet
+        self._pending: Dict[str, Sequence[Company]] = {}
+
+    @classmethod
+    def from_env(cls) -> "MatchJobManager":
+        return cls(
+            path=os.getenv("MATCH_JOBS_PATH", str(DEFAULT_JOBS_PATH)),
+            workers=int(os.getenv("MATCH_JOB_WORKERS", "2")),
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # ---------- Lifecycle ----------
+
+    def _ensure_workers(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"match-job-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def resume(self) -> int:
+        """Re-queue the unfinished pairs of every queued/running job; returns the jobs resumed."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", UNFINISHED
+            ).fetchall()
+        resumed = 0
+        for (job_id,) in rows:
+            if job_id in self._pending:
+                continue  # still waiting for its pairs in this process
+            with self._lock:
+                snapshotted = self._db().execute(
+                    "SELECT 1 FROM job_pairs WHERE job_id = ? LIMIT 1", (job_id,)
+                ).fetchone()
+                if snapshotted is None:
+                    # Interrupted before the pairs were ranked: the companies are gone
+                    self._db().execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        ("interrupted before its pairs were ranked; create the job again",
+                         time.time(), job_id),
+                    )
+                    continue
+            self._enqueue(job_id)
+            resumed += 1
+        return resumed
+
+    def shutdown(self) -> None:
+        """Stop the workers after their current chunk; unfinished jobs resume on next start."""
+        threads, self._threads = self._threads, []
+        # Drop queued chunks first; resume() re-queues whatever has no result yet
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=5.0)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._pairs.clear()
+            self._pending.clear()
+            self._progress_start.clear()
+
+    # ---------- Jobs ----------
+
+    def create(
+        self,
+        companies: Sequence[Company],
+        shortlist: Optional[int],
+        batch_size: int,
+    ) -> str:
+        """Record a new queued job over `companies` and start it.
+
+        Returns right away: ranking the pairs is O(N^2), so a worker does it and
+        snapshots them (`_prepare`) before scoring. `total` is 0 until then.
+        """
+        job_id = uuid.uuid4().hex
+        max_cost = max((c.disposal_cost or 0.0 for c in companies), default=0.0)
+        params = {"shortlist": shortlist, "batch_size": batch_size, "max_disposal_cost": max_cost}
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO jobs (id, status, params, total, created_at) VALUES (?, 'queued', ?, 0, ?)",
+                (job_id, json.dumps(params), time.time()),
+            )
+            self._pending[job_id] = list(companies)
+        self._queue.put((job_id, None))
+        self._ensure_workers()
+        return job_id
+
+    def _prepare(self, job_id: str) -> None:
+        """Rank the pending job's pairs, snapshot them and queue their chunks."""
+        companies = self._pending.get(job_id)
+        if companies is None:
+            return
+        with self._lock:
+            row = self._db().execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[0] not in UNFINISHED:
+            self._pending.pop(job_id, None)
+            return  # cancelled before it started
+
+        pairs = rank_company_pairs(companies)
+        producers = {p.producer.id: p.producer for p in pairs}
+        producers.update({p.consumer.id: p.consumer for p in pairs})
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            db.execute("UPDATE jobs SET total = ? WHERE id = ?", (len(pairs), job_id))
+            db.executemany(
+                "INSERT INTO job_companies VALUES (?, ?, ?)",
+                [(job_id, cid, c.model_dump_json()) for cid, c in producers.items()],
+            )
+            db.executemany(
+                "INSERT INTO job_pairs VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, p.producer.id, p.consumer.id, p.distance_km) for i, p in enumerate(pairs)],
+            )
+            if not pairs:
+                db.execute(
+                    "UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                    (time.time(), job_id, *UNFINISHED),
+                )
+            db.execute("COMMIT")
+            self._pairs[job_id] = pairs
+            del self._pending[job_id]
+        if pairs:
+            self._enqueue(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            cur = self._db().execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                (time.time(), job_id, *UNFINISHED),
+            )
+            return cur.rowcount > 0
+
+    def _load_pairs(self, job_id: str) -> Tuple[List[PairScore], Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            params = json.loads(db.execute("SELECT params FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+            pairs = self._pairs.get(job_id)
+            if pairs is None:
+                companies = {
+                    cid: Company.model_validate_json(data)
+                    for cid, data in db.execute(
+                        "SELECT company_id, company FROM job_companies WHERE job_id = ?", (job_id,)
+                    )
+                }
+                rows = db.execute(
+                    "SELECT producer_id, consumer_id, distance_km FROM job_pairs "
+                    "WHERE job_id = ? ORDER BY pair_index", (job_id,)
+                ).fetchall()
+                # The local score is deterministic, so it is recomputed rather than stored
+                pairs = [
+                    local_score(companies[a], companies[b], dist, params["max_disposal_cost"])
+                    for a, b, dist in rows
+                ]
+                self._pairs[job_id] = pairs
+        return pairs, params
+
+    def _enqueue(self, job_id: str) -> None:
+        pairs, params = self._load_pairs(job_id)
+        with self._lock:
+            done = {
+                i for (i,) in self._db().execute(
+                    "SELECT pair_index FROM job_results WHERE job_id = ?", (job_id,)
+                )
+            }
+            self._progress_start[job_id] = (time.monotonic(), len(done))
+        shortlist = len(pairs) if params["shortlist"] is None else params["shortlist"]
+        remaining = [i for i in range(len(pairs)) if i not in done]
+        # LLM pairs go batch_size per chunk; locally scored pairs in larger chunks
+        llm = [i for i in remaining if i < shortlist]
+        local = [i for i in remaining if i >= shortlist]
+        size = max(params["batch_size"], 1)
+        for start in range(0, len(llm), size):
+            self._queue.put((job_id, llm[start:start + size]))
+        for start in range(0, len(local), 500):
+            self._queue.put((job_id, local[start:start + 500]))
+        self._ensure_workers()
+
+    # ---------- Workers ----------
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, indices = item
+            try:
+                if indices is None:
+                    self._prepare(job_id)
+                else:
+                    self._run_chunk(job_id, indices)
+            except Exception as e:
+                self._pending.pop(job_id, None)
+                with self._lock:
+                    self._db().execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                        "WHERE id = ? AND status IN (?, ?)",
+                        (str(e), time.time(), job_id, *UNFINISHED),
+                    )
+
+    def _run_chunk(self, job_id: str, indices: List[int]) -> None:
+        with self._lock:
+            row = self._db().execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[0] not in UNFINISHED:
+                return  # cancelled or already failed
+            self._db().execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (time.time(), job_id),
+            )
+        pairs, params = self._load_pairs(job_id)
+        shortlist = len(pairs) if params["shortlist"] is None else params["shortlist"]
+
+        analyses: List[Optional[Any]] = [None] * len(indices)
+        llm = [k for k, i in enumerate(indices) if i < shortlist]
+        if llm:
+            with metrics_endpoint("job /companies/matches/jobs"):
+                answers = get_gemini_client().analyze_batch(
+                    [(pairs[indices[k]].producer, pairs[indices[k]].consumer) for k in llm],
+                    params["batch_size"],
+                )
+                LLM_METRICS.record_fallback("local_score", sum(a is None for a in answers))
+            for k, answer in zip(llm, answers):
+                analyses[k] = answer
+
+        rows = []
+        for i, analysis in zip(indices, analyses):
+            pair = pairs[i]
+            scored_by = "llm"
+            if analysis is None:
+                # Not shortlisted, or Gemini unavailable: keep the local score
+                analysis, scored_by = local_analysis(pair), "local"
+            result = MatchResult(
+                company_a=pair.producer,
+                company_b=pair.consumer,
+                compatibility_score=analysis.compatibility_score,
+                distance_km=pair.distance_km,
+                chemical_notes=analysis.chemical_notes,
+                co2_reduction_tons=analysis.co2_reduction_tons,
+                cost_savings_usd=analysis.cost_savings_usd,
+                regulatory_notes=analysis.regulatory_notes,
+                scored_by=scored_by,
+                local_score=pair.score,
+            )
+            rows.append((job_id, i, result.compatibility_score, result.model_dump_json()))
+
+        # Results and progress commit together: this is the checkpoint
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            inserted = 0
+            for row in rows:
+                inserted += db.execute("INSERT OR IGNORE INTO job_results VALUES (?, ?, ?, ?)", row).rowcount
+            db.execute("UPDATE jobs SET done = done + ? WHERE id = ?", (inserted, job_id))
+            db.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ? "
+                "WHERE id = ? AND done >= total AND status = 'running'",
+                (time.time(), job_id),
+            )
+            db.execute("COMMIT")
+
+    # ---------- Queries ----------
+
+    def status(self, job_id: str, top: int = 10) -> Optional[Dict[str, Any]]:
+        """Progress, ETA and the current top results of a job; None if unknown."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT status, params, total, done, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            status, params, total, done, error, created_at, started_at, finished_at = row
+            eta = None
+            start = self._progress_start.get(job_id)
+            if status == "running" and start is not None and done > start[1]:
+                elapsed = time.monotonic() - start[0]
+                eta = elapsed / (done - start[1]) * (total - done)
+            params = json.loads(params)
+            params.pop("max_disposal_cost", None)
+            return {
+                "id": job_id,
+                "status": status,
+                "params": params,
+                "total": total,
+                "done": done,
+                "progress": done / total if total else float(status == "completed"),
+                "eta_seconds": eta,
+                "error": error,
+                "created_at": created_at,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "top": list(self.results(job_id, limit=top)),
+            }
+
+    def results(self, job_id: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Results so far, best compatibility first (ties in local-score order).
+
+        Read in pages along the `job_results_rank` index, so a long result list is
+        never held in memory and the lock is only taken per page.
+        """
+        remaining = -1 if limit is None else limit
+        after: Optional[Tuple[int, int]] = None
+        while remaining != 0:
+            page = _RESULTS_PAGE if remaining < 0 else min(remaining, _RESULTS_PAGE)
+            where, params = "job_id = ?", [job_id]
+            if after is not None:
+                where += " AND (compatibility_score < ? OR (compatibility_score = ? AND pair_index > ?))"
+                params += [after[0], after[0], after[1]]
+            with self._lock:
+                rows = self._db().execute(
+                    f"SELECT compatibility_score, pair_index, result FROM job_results WHERE {where} "
+                    "ORDER BY compatibility_score DESC, pair_index LIMIT ?",
+                    (*params, page),
+                ).fetchall()
+            for _, _, result in rows:
+                yield json.loads(result)
+            if len(rows) < page:
+                return
+            after = rows[-1][:2]
+            remaining = remaining - len(rows) if remaining > 0 else remaining
+
+    def exists(self, job_id: str) -> bool:
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+
+MATCH_JOBS = MatchJobManager.from_env()
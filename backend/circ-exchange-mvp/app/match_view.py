@@ -0,0 +1,229 @@
+"""
+Materialized top-K candidate lists for the default /match query.
+
+`MatchView` keeps, per source facility, the ranked top-K candidates for the
+default radius and search factor. Facility upserts only rescore the pairs
+involving the changed facility and patch the lists of the sources that
+could hold it; a list is only marked stale (and recomputed on its next
+read) when a patch cannot be applied exactly.
+"""
+
+import heapq
+import os
+from bisect import insort
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from .matcher import haversine_km, score_match
+from .models import Facility
+
+if TYPE_CHECKING:
+    from .store import InMemoryStore
+
+# /match only scores candidates within radius_km times this factor (override per request)
+SEARCH_RADIUS_FACTOR = float(os.getenv("MATCH_SEARCH_RADIUS_FACTOR", "2.0"))
+
+# (-score, distance_km, store order, facility_id, composition_similarity,
+#  matched waste index, matched need index); sorts best first
+Ranked = Tuple[float, float, int, str, float, int, int]
+
+# The batched similarities sum in another order than the per-pair
+# `weighted_jaccard`, so they can differ from it in the last bits. Candidates
+# scoring within this of the k-th are settled with the per-pair functions.
+TIE_EPS = 1e-9
+
+
+def loop_best_pair(source: Facility, cand: Facility) -> Tuple[float, int, int]:
+    """(similarity, waste index, need index) of the best pair, as the original
+    /match loop picks it: the first strict maximum of `weighted_jaccard`.
+
+    Compares the compositions normalized at ingest, so nothing is re-normalized.
+    """
+    best = (0.0, 0, 0)
+    for w_idx, waste in enumerate(source.waste_streams):
+        normalized = waste.normalized
+        for n_idx, need in enumerate(cand.needs):
+            sim = normalized.weighted_jaccard(need.normalized)
+            if sim > best[0]:
+                best = (sim, w_idx, n_idx)
+    return best
+
+
+def exact_ranked(store: "InMemoryStore", source: Facility, cand_id: str, radius_km: float) -> Optional[Ranked]:
+    """A candidate's rank key with the per-pair similarity and distance, and its matched pair."""
+    cand = store.get_facility(cand_id)
+    sim, waste_idx, need_idx = loop_best_pair(source, cand)
+    if sim <= 0:
+        return None
+    dist = haversine_km(source.latitude, source.longitude, cand.latitude, cand.longitude)
+    return (-score_match(sim, dist, radius_km), dist, store.facility_order[cand_id], cand_id, sim,
+            waste_idx, need_idx)
+
+
+def rank_candidates(
+    store: "InMemoryStore",
+    source_id: str,
+    nearby: Dict[str, float],
+    radius_km: float,
+    k: int,
+    bands: Optional[int] = None,
+) -> List[Ranked]:
+    """Top-k candidates for a source among `nearby` (id -> distance), best first.
+
+    Scores stream through a bounded heap, ordered by score desc, distance asc,
+    then store insertion order. The winners, and anything within `TIE_EPS` of
+    the k-th, are then rescored pair by pair, so values and order equal the
+    original loop's; each result also carries its matched (waste, need) indices. With `bands`, only the facilities the MinHash
+    LSH index returns for that band count are re-ranked exactly (approximate mode).
+    """
+    if bands is not None:
+        approx = store.engine.lsh.candidates(source_id, bands)
+        nearby = {c: nearby[c] for c in approx if c in nearby}
+    # The engine scores the source's wastes against the nearby needs in one batch
+    # and only returns facilities with a non-zero best waste->need similarity
+    cand_ids, sims = store.engine.similarities(source_id, nearby)
+    ranked = [
+        (-score_match(sim, nearby[cand_id], radius_km), nearby[cand_id],
+         store.facility_order[cand_id], cand_id)
+        for cand_id, sim in zip(cand_ids, sims.tolist())
+    ]
+    top = heapq.nsmallest(k, ranked)
+    if not top:
+        return top
+    bound = top[-1][0] + TIE_EPS
+    source = store.get_facility(source_id)
+    exact = (exact_ranked(store, source, item[3], radius_km) for item in ranked if item[0] <= bound)
+    return heapq.nsmallest(k, (item for item in exact if item is not None))
+
+
+class MatchView:
+    """Per-facility top-K lists kept in sync with facility upserts."""
+
+    def __init__(
+        self,
+        store: "InMemoryStore",
+        radius_km: float = 500.0,
+        radius_factor: float = SEARCH_RADIUS_FACTOR,
+        k: int = 50,
+    ) -> None:
+        self.store = store
+        self.radius_km = radius_km
+        self.radius_factor = radius_factor
+        self.k = k
+        # Bumped on every facility upsert; entries remember the version they reflect
+        self.version = 0
+        self._entries: Dict[str, List[Ranked]] = {}
+        self._versions: Dict[str, int] = {}
+        # candidate id -> sources whose list currently holds it
+        self._holders: Dict[str, Set[str]] = {}
+        self._stale: Set[str] = set()
+
+    def covers(self, radius_km: float, radius_factor: float, top_k: int) -> bool:
+        """Whether a /match query can be answered from the view."""
+        return radius_km == self.radius_km and radius_factor == self.radius_factor and top_k <= self.k
+
+    def is_fresh(self, source_id: str) -> bool:
+        return source_id in self._entries and source_id not in self._stale
+
+    def lookup(self, source_id: str, top_k: int) -> List[Ranked]:
+        """The source's best `top_k` candidates, recomputing its list first if needed."""
+        if not self.is_fresh(source_id):
+            self._refresh(source_id)
+        return self._entries[source_id][:top_k]
+
+    def status(self) -> Dict[str, float]:
+        return {
+            "version": self.version,
+            "radius_km": self.radius_km,
+            "radius_factor": self.radius_factor,
+            "k": self.k,
+            "entries": len(self._entries),
+            "fresh": len(self._entries) - len(self._stale),
+            "stale": len(self._stale),
+        }
+
+    def clear(self) -> None:
+        self.version += 1
+        self._entries.clear()
+        self._versions.clear()
+        self._holders.clear()
+        self._stale.clear()
+
+    def _refresh(self, source_id: str) -> None:
+        source = self.store.get_facility(source_id)
+        nearby = self.store.facilities_within(
+            source.latitude, source.longitude, self.radius_km * self.radius_factor
+        )
+        self._set_entry(source_id, rank_candidates(self.store, source_id, nearby, self.radius_km, self.k))
+
+    def _set_entry(self, source_id: str, ranked: List[Ranked]) -> None:
+        self._drop_entry(source_id)
+        self._entries[source_id] = ranked
+        self._versions[source_id] = self.version
+        for item in ranked:
+            self._holders.setdefault(item[3], set()).add(source_id)
+
+    def _drop_entry(self, source_id: str) -> None:
+        for item in self._entries.pop(source_id, []):
+            self._release(item[3], source_id)
+        self._versions.pop(source_id, None)
+        self._stale.discard(source_id)
+
+    def _release(self, cand_id: str, source_id: str) -> None:
+        holders = self._holders.get(cand_id)
+        if holders is not None:
+            holders.discard(source_id)
+            if not holders:
+                del self._holders[cand_id]
+
+    def on_upsert(self, facility: Facility) -> None:
+        """Patch the view after `facility` was (re)indexed by the store."""
+        self.version += 1
+        changed = facility.id
+        # The changed facility's own candidates all need rescoring: rebuild on next read
+        self._drop_entry(changed)
+        if not self._entries:
+            return
+
+        # Sources that may list the changed facility: current holders plus anyone in range
+        nearby = self.store.facilities_within(
+            facility.latitude, facility.longitude, self.radius_km * self.radius_factor
+        )
+        affected = set(self._holders.get(changed, ()))
+        affected.update(s for s in nearby if s in self._entries)
+        affected.discard(changed)
+        affected.difference_update(self._stale)
+        if not affected:
+            return
+
+        sims = self.store.engine.reverse_similarities(changed, [s for s in affected if s in nearby])
+        for source_id in affected:
+            entry = self._entries[source_id]
+            was_full = len(entry) >= self.k
+            old_last = entry[-1] if entry else None
+            held = [item for item in entry if item[3] == changed]
+            for item in held:
+                entry.remove(item)
+                self._release(changed, source_id)
+
+            item = None
+            if sims.get(source_id, 0.0) > 0:
+                # Same values as a fresh rank_candidates would list
+                item = exact_ranked(self.store, self.store.get_facility(source_id), changed, self.radius_km)
+
+            if held and was_full:
+                # A candidate truncated from the list may now belong in it unless the new
+                # item still ranks ahead of the old K-th entry
+                if item is None or item >= old_last:
+                    self._stale.add(source_id)
+                    continue
+                insort(entry, item)
+            elif item is not None and (len(entry) < self.k or item < entry[-1]):
+                insort(entry, item)
+                if len(entry) > self.k:
+                    self._release(entry.pop()[3], source_id)
+            else:
+                item = None
+
+            if item is not None:
+                self._holders.setdefault(changed, set()).add(source_id)
+            self._versions[source_id] = self.version
@@ -1,6 +1,8 @@
 from typing import Dict, Tuple, Optional
 from math import radians, sin, cos, sqrt, atan2
 
+import numpy as np
+
 # ---------- Geo ----------
 def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     R = 6371.0  # Earth radius km
@@ -10,6 +12,52 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     return R * c
 
+# NumPy's sin/arctan2 may round differently from `math` in the last bit, so the
+# vectorized versions agree with `haversine_km` to this tolerance, not bit for bit
+HAVERSINE_RTOL = 1e-12
+HAVERSINE_ATOL_KM = 1e-9
+
+def haversine_km_many(
+    lat1: float, lon1: float, lats: np.ndarray, lons: np.ndarray,
+    cos_lats: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """One-to-many `haversine_km` over coordinate arrays (degrees).
+
+    `cos_lats` may pass the cached cos(radians(lats)) of the targets.
+    Results match calling `haversine_km(lat1, lon1, lat, lon)` per target within
+    `HAVERSINE_RTOL` / `HAVERSINE_ATOL_KM`.
+    """
+    R = 6371.0
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    if cos_lats is None:
+        cos_lats = np.cos(np.radians(lats))
+    sin_dlat = np.sin(np.radians(lats - lat1) / 2)
+    sin_dlon = np.sin(np.radians(lons - lon1) / 2)
+    a = sin_dlat * sin_dlat + cos(radians(lat1)) * cos_lats * (sin_dlon * sin_dlon)
+    return R * (2 * np.arctan2(np.sqrt(a), np.sqrt(1-a)))
+
+def haversine_matrix(
+    lats1: np.ndarray, lons1: np.ndarray, lats2: np.ndarray, lons2: np.ndarray,
+    cos_lats1: Optional[np.ndarray] = None, cos_lats2: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Many-to-many `haversine_km`: result[i, j] is the distance from site i to site j,
+    within `HAVERSINE_RTOL` / `HAVERSINE_ATOL_KM` of the scalar function.
+
+    Allocates len(lats1) x len(lats2) float64 temporaries; chunk the rows for very
+    large inputs.
+    """
+    R = 6371.0
+    lats1, lons1 = np.asarray(lats1, dtype=float), np.asarray(lons1, dtype=float)
+    lats2, lons2 = np.asarray(lats2, dtype=float), np.asarray(lons2, dtype=float)
+    if cos_lats1 is None:
+        cos_lats1 = np.cos(np.radians(lats1))
+    if cos_lats2 is None:
+        cos_lats2 = np.cos(np.radians(lats2))
+    sin_dlat = np.sin(np.radians(lats2[None, :] - lats1[:, None]) / 2)
+    sin_dlon = np.sin(np.radians(lons2[None, :] - lons1[:, None]) / 2)
+    a = sin_dlat * sin_dlat + cos_lats1[:, None] * cos_lats2[None, :] * (sin_dlon * sin_dlon)
+    return R * (2 * np.arctan2(np.sqrt(a), np.sqrt(1-a)))
+
 # ---------- Chemistry similarity ----------
 def _normalize_comp(comp: Dict[str, float]) -> Dict[str, float]:
     if not comp:
@@ -1,5 +1,6 @@
-from typing import Dict, List, Optional
-from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, PrivateAttr
+from .composition import NormalizedComposition
 
 
 class Material(BaseModel):
@@ -11,6 +12,34 @@ class Material(BaseModel):
         description="Map of component -> proportion (0..1 or 0..100).",
     )
 
+    # Normalized once, on first use; keyed on the composition dict it was built from
+    _normalized: Optional[NormalizedComposition] = PrivateAttr(default=None)
+    _normalized_from: Optional[Dict[str, float]] = PrivateAttr(default=None)
+
+    @property
+    def normalized(self) -> NormalizedComposition:
+        """Normalized composition, recomputed only if `composition` is replaced."""
+        # Read the private slots directly: BaseModel.__getattr__ is slow on the match path
+        private = self.__pydantic_private__
+        cached = private["_normalized"]
+        if cached is None or private["_normalized_from"] is not self.composition:
+            cached = NormalizedComposition.from_mapping(self.composition)
+            private["_normalized"] = cached
+            private["_normalized_from"] = self.composition
+        return cached
+
+    def intern(self) -> NormalizedComposition:
+        """`normalized`, with its component names added to the shared vocabulary.
+
+        Called when a facility or company is stored, so that only stored records
+        grow the vocabulary; request payloads keep unknown names in `extra`.
+        """
+        cached = self.normalized
+        if cached.extra:
+            cached = NormalizedComposition.from_mapping(self.composition, intern=True)
+            self.__pydantic_private__["_normalized"] = cached
+        return cached
+
 
 class Company(BaseModel):
     """Company with location, waste streams, and needs."""
@@ -57,6 +86,10 @@ class MatchResult(BaseModel):
     co2_reduction_tons: float = Field(..., description="CO₂ reduction potential in tons/year")
     cost_savings_usd: float = Field(..., description="Cost savings estimate in USD")
     regulatory_notes: str = Field(..., description="Regulatory or safety considerations")
+    scored_by: Literal["llm", "local"] = Field(
+        "llm", description="llm: analyzed by Gemini; local: deterministic pre-filter score only"
+    )
+    local_score: Optional[float] = Field(None, description="Pre-filter score 0..1")
 
 
 class AskRequest(BaseModel):
@@ -101,6 +134,19 @@ class MatchResponse(BaseModel):
     candidates: List[Candidate]
 
 
+class BatchMatchRequest(BaseModel):
+    """Request for matching many source facilities in one pass."""
+
+    facility_ids: Union[Literal["all"], List[str]] = Field(
+        "all", description='Source facility ids, or "all" for every facility'
+    )
+    radius_km: float = Field(500.0, ge=1.0, le=2000.0)
+    top_k: int = Field(5, ge=1, le=50)
+    radius_factor: Optional[float] = Field(
+        None, ge=1.0, le=10.0, description="Defaults to the server's search radius factor"
+    )
+
+
 class ExplainRequest(BaseModel):
     source: Facility
     candidate: Facility
@@ -0,0 +1,132 @@
+"""
+Deterministic pre-filter for company pair matching.
+
+`/companies/matches` used to send every company pair to Gemini. Pairs are now
+ranked by a cheap local score first (composition overlap, distance, quantity
+fit and disposal cost, oriented producer -> consumer) and only the top-M
+shortlist is sent to the LLM; the remaining pairs keep their local score.
+"""
+
+import os
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .matcher import haversine_km, haversine_matrix
+from .models import AnalyzeResponse, Company, Material
+
+# Number of best locally scored pairs sent to Gemini (override per request)
+LLM_SHORTLIST_SIZE = int(os.getenv("COMPANY_MATCH_SHORTLIST", "20"))
+# Distance at which the proximity term of the local score reaches zero
+LOCAL_RADIUS_KM = 500.0
+
+# Blend weights of the local score; composition overlap dominates like score_match
+W_SIMILARITY = 0.6
+W_PROXIMITY = 0.2
+W_QUANTITY = 0.1
+W_COST = 0.1
+
+
+class PairScore(NamedTuple):
+    """Local score of a producer -> consumer pair, best material pair included."""
+
+    score: float
+    producer: Company
+    consumer: Company
+    distance_km: float
+    similarity: float
+    waste: Optional[Material]
+    need: Optional[Material]
+
+
+def best_material_pair(
+    producer: Company, consumer: Company
+) -> Tuple[float, Optional[Material], Optional[Material]]:
+    """Highest weighted Jaccard between the producer's wastes and the consumer's needs."""
+    best: Tuple[float, Optional[Material], Optional[Material]] = (0.0, None, None)
+    for waste in producer.waste_streams:
+        for need in consumer.needs:
+            sim = waste.normalized.weighted_jaccard(need.normalized)
+            if sim > best[0]:
+                best = (sim, waste, need)
+    return best
+
+
+def quantity_fit(supply: Optional[float], demand: Optional[float]) -> float:
+    """1.0 when the tonnages agree, shrinking with their ratio; neutral if unknown."""
+    if not supply or not demand or supply <= 0 or demand <= 0:
+        return 0.5
+    return min(supply, demand) / max(supply, demand)
+
+
+def local_score(
+    producer: Company, consumer: Company, distance_km: float, max_disposal_cost: float
+) -> PairScore:
+    sim, waste, need = best_material_pair(producer, consumer)
+    proximity = 1.0 - min(distance_km / LOCAL_RADIUS_KM, 1.0)
+    if producer.disposal_cost is not None and max_disposal_cost > 0:
+        cost = max(producer.disposal_cost, 0.0) / max_disposal_cost
+    else:
+        cost = 0.5
+    raw = (
+        W_SIMILARITY * sim
+        + W_PROXIMITY * proximity
+        + W_QUANTITY * quantity_fit(producer.quantity, consumer.quantity)
+        + W_COST * cost
+    )
+    return PairScore(max(0.0, min(1.0, raw)), producer, consumer, distance_km, sim, waste, need)
+
+
+def score_pair(producer: Company, consumer: Company) -> PairScore:
+    """Local score of a single producer -> consumer pair (e.g. when Gemini is unavailable)."""
+    distance = haversine_km(producer.latitude, producer.longitude, consumer.latitude, consumer.longitude)
+    return local_score(producer, consumer, distance, max(producer.disposal_cost or 0.0, 0.0))
+
+
+def rank_company_pairs(companies: Sequence[Company]) -> List[PairScore]:
+    """Every unordered pair with a waste -> need direction, best local score first.
+
+    Each pair is oriented as producer -> consumer using whichever direction scores
+    higher; pairs where neither company has a waste the other could take are
+    dropped. Ties keep the store order of the pair.
+    """
+    if len(companies) < 2:
+        return []
+    lats = [c.latitude for c in companies]
+    lons = [c.longitude for c in companies]
+    distances = haversine_matrix(lats, lons, lats, lons)
+    max_cost = max((c.disposal_cost or 0.0 for c in companies), default=0.0)
+
+    pairs: List[PairScore] = []
+    for i, a in enumerate(companies):
+        for j in range(i + 1, len(companies)):
+            b = companies[j]
+            dist = float(distances[i, j])
+            options = []
+            if a.waste_streams and b.needs:
+                options.append(local_score(a, b, dist, max_cost))
+            if b.waste_streams and a.needs:
+                options.append(local_score(b, a, dist, max_cost))
+            if options:
+                pairs.append(max(options, key=lambda p: p.score))
+    # Stable sort: equal scores stay in pair order
+    pairs.sort(key=lambda p: p.score, reverse=True)
+    return pairs
+
+
+def local_analysis(pair: PairScore) -> AnalyzeResponse:
+    """AnalyzeResponse for a pair that was not sent to the LLM."""
+    if pair.waste is not None:
+        notes = (
+            f"Locally scored: {pair.waste.name} -> {pair.need.name} "
+            f"composition overlap {pair.similarity:.2f}"
+        )
+    else:
+        notes = "Locally scored: no overlapping components between waste streams and needs"
+    supply, demand = pair.producer.quantity, pair.consumer.quantity
+    tons = min(supply, demand) if supply and demand else 0.0
+    return AnalyzeResponse(
+        compatibility_score=min(100, max(0, round(pair.score * 100))),
+        chemical_notes=notes,
+        co2_reduction_tons=0.0,
+        cost_savings_usd=float(tons * (pair.producer.disposal_cost or 0.0)),
+        regulatory_notes="Not assessed (local pre-filter score)",
+    )
@@ -0,0 +1,301 @@
+"""
+Secondary indexes, cursor pagination and sparse fieldsets for company listings.
+
+`RecordIndex` keeps records by a monotonic sequence number (dataset position or
+store insertion order) with one sorted posting list per filter value. A query
+walks the posting lists from the cursor: the requested values of one field are
+alternatives, and the fields leapfrog each other with bisects (the smallest
+field leads) until the page is full. A page therefore costs O(page x fields x
+log n), whatever the catalog size. `X-Total-Count` needs the full match count;
+it is computed once per filter set and cached until the index changes.
+Serialization then only touches the records of the page.
+
+The same posting lists give the facets (distinct values with counts) for free:
+they change with every `put`, so a facet request never looks at the records.
+"""
+
+import base64
+import binascii
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException, Query, status
+
+FILTER_FIELDS = ("type", "industry", "city", "state", "category", "material")
+FACET_FIELDS = ("type", "material", "industry", "city", "state", "location", "category")
+MAX_PAGE_SIZE = 1000
+
+
+def company_index_values(company: Any) -> Dict[str, List[str]]:
+    """Indexed values of a fakeData-style dict or a Company model (`RecordIndex` case-folds them)."""
+    if isinstance(company, dict):
+        location = company.get("location") or {}
+        streams = [company.get(key) or {} for key in ("waste_stream", "material_needs")]
+        city, state = location.get("city"), location.get("state")
+        values = {
+            "structure": ["new"],
+            "type": [company.get("type")],
+            "industry": [company.get("industry")],
+            "city": [city],
+            "state": [state],
+            "location": [f"{city}, {state}" if city and state else None],
+            "category": [stream.get("category") for stream in streams],
+            "material": [stream.get("material") for stream in streams],
+        }
+    else:
+        # Company models carry no metadata; their role follows from what they list
+        kind = "producer" if company.waste_streams else "consumer" if company.needs else None
+        values = {
+            "structure": ["model"],
+            "type": [kind],
+            "material": [m.name for m in company.waste_streams + company.needs],
+        }
+    return {
+        name: list(dict.fromkeys(str(v) for v in vals if v not in (None, "")))
+        for name, vals in values.items()
+    }
+
+
+@dataclass
+class ListingQuery:
+    """Parsed pagination, filter and projection parameters of a listing request."""
+
+    limit: Optional[int] = None
+    after: Optional[int] = None
+    filters: Dict[str, List[str]] = field(default_factory=dict)
+    fields: Optional[List[str]] = None
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None or self.after is not None
+
+    def is_plain(self) -> bool:
+        """No pagination, filters or projection: the full listing."""
+        return not self.paginated and not self.filters and self.fields is None
+
+    def canonical(self) -> str:
+        """Stable text form of the query (for ETags)."""
+        filters = ";".join(f"{k}={','.join(v)}" for k, v in sorted(self.filters.items()))
+        return f"limit={self.limit};after={self.after};{filters};fields={','.join(self.fields or [])}"
+
+
+def encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(f"s{seq}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not text.startswith("s"):
+            raise ValueError(cursor)
+        return int(text[1:])
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def listing_query(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (default: everything)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    type_: Optional[str] = Query(None, alias="type", description="producer and/or consumer, comma-separated"),
+    industry: Optional[str] = Query(None, description="Industry, exact and case-insensitive; comma = any of"),
+    city: Optional[str] = Query(None),
+    state: Optional[str] = Query(None),
+    category: Optional[str] = Query(None, description="Waste stream / material need category"),
+    material: Optional[str] = Query(None, description="Waste stream / material need material name"),
+    fields: Optional[str] = Query(None, description="Sparse fieldset, e.g. id,name,location.coordinates"),
+) -> ListingQuery:
+    """FastAPI dependency shared by the company listing endpoints."""
+    raw = {"type": type_, "industry": industry, "city": city, "state": state, "category": category,
+           "material": material}
+    filters = {name: [v.casefold() for v in _split(value)] for name, value in raw.items() if value}
+    projection = _split(fields) if fields is not None else None
+    if projection == []:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="fields must name at least one field")
+    return ListingQuery(
+        limit=limit,
+        after=decode_cursor(cursor) if cursor else None,
+        filters={k: v for k, v in filters.items() if v},
+        fields=projection,
+    )
+
+
+def project(record: Dict[str, Any], paths: Iterable[str]) -> Dict[str, Any]:
+    """Copy only the dotted `paths` of `record`, keeping their nesting; missing paths are skipped."""
+    out: Dict[str, Any] = {}
+    for path in paths:
+        parts = path.split(".")
+        value: Any = record
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = out
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return out
+
+
+@dataclass
+class Page:
+    seqs: List[int]
+    records: List[Any]
+    next_cursor: Optional[str]
+    total: int
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"X-Total-Count": str(self.total)}
+        if self.next_cursor is not None:
+            headers["X-Next-Cursor"] = self.next_cursor
+        return headers
+
+
+class RecordIndex:
+    """Records by sequence number with sorted posting lists per indexed value."""
+
+    def __init__(self, index_values: Callable[[Any], Dict[str, List[str]]] = company_index_values) -> None:
+        self._index_values = index_values
+        self.clear()
+
+    def clear(self) -> None:
+        self._records: Dict[int, Any] = {}
+        self._order: List[int] = []
+        self._values: Dict[int, Dict[str, List[str]]] = {}
+        self._postings: Dict[str, Dict[str, List[int]]] = {}
+        # Case-folded value -> the spelling it was first indexed with (facet labels)
+        self._labels: Dict[str, Dict[str, str]] = {}
+        self._derived: Dict[Hashable, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def put(self, seq: int, record: Any) -> None:
+        """Insert or replace the record at `seq`."""
+        if seq in self._records:
+            for name, values in self._values[seq].items():
+                for value in values:
+                    postings = self._postings[name][value]
+                    postings.pop(bisect_right(postings, seq) - 1)
+                    if not postings:
+                        del self._postings[name][value]
+                        del self._labels[name][value]
+        elif not self._order or seq > self._order[-1]:
+            self._order.append(seq)
+        else:
+            insort(self._order, seq)
+        self._records[seq] = record
+        self._derived.clear()
+        values = {}
+        for name, vals in self._index_values(record).items():
+            labels = self._labels.setdefault(name, {})
+            folded = values[name] = list(dict.fromkeys(v.casefold() for v in vals))
+            for label in vals:
+                labels.setdefault(label.casefold(), label)
+            for value in folded:
+                postings = self._postings.setdefault(name, {}).setdefault(value, [])
+                if not postings or seq > postings[-1]:
+                    postings.append(seq)
+                else:
+                    insort(postings, seq)
+        self._values[seq] = values
+
+    def _field_postings(self, filters: Dict[str, List[str]]) -> List[List[List[int]]]:
+        """Per field, the posting lists of its requested values, smallest field first."""
+        fields = [[self._postings.get(name, {}).get(v, []) for v in values] for name, values in filters.items()]
+        fields.sort(key=lambda lists: sum(map(len, lists)))
+        return fields
+
+    @staticmethod
+    def _next(lists: List[List[int]], seq: int) -> Optional[int]:
+        """Smallest sequence number >= `seq` in any of the lists (values of a field are ORed)."""
+        best = None
+        for postings in lists:
+            i = bisect_left(postings, seq)
+            if i < len(postings) and (best is None or postings[i] < best):
+                best = postings[i]
+        return best
+
+    def _walk(self, fields: List[List[List[int]]], seq: int, limit: Optional[int]) -> List[int]:
+        """Up to `limit` sequence numbers >= `seq` matching every field, in order."""
+        found: List[int] = []
+        while limit is None or len(found) < limit:
+            for lists in fields:
+                nxt = self._next(lists, seq)
+                if nxt is None:
+                    return found
+                if nxt != seq:
+                    # This field skips ahead; the others have to catch up with it
+                    seq = nxt
+                    break
+            else:
+                found.append(seq)
+                seq += 1
+        return found
+
+    def _count(self, filters: Dict[str, List[str]], fields: List[List[List[int]]]) -> int:
+        if len(fields) == 1 and len(fields[0]) == 1:
+            return len(fields[0][0])
+        key = ("count",) + tuple(sorted((name, tuple(sorted(set(v)))) for name, v in filters.items()))
+        return self.memo(key, lambda: len(self._walk(fields, self._order[0] if self._order else 0, None)))
+
+    def query(self, query: ListingQuery, extra_filters: Optional[Dict[str, List[str]]] = None) -> Page:
+        filters = {**query.filters, **(extra_filters or {})}
+        if not filters:
+            start = bisect_right(self._order, query.after) if query.after is not None else 0
+            end = len(self._order) if query.limit is None else start + query.limit
+            seqs = self._order[start:end]
+            more, total = end < len(self._order), len(self._order)
+        else:
+            fields = self._field_postings(filters)
+            start = query.after + 1 if query.after is not None else (self._order[0] if self._order else 0)
+            seqs = self._walk(fields, start, None if query.limit is None else query.limit + 1)
+            more = query.limit is not None and len(seqs) > query.limit
+            seqs = seqs[:query.limit] if more else seqs
+            total = self._count(filters, fields)
+        next_cursor = encode_cursor(seqs[-1]) if seqs and more else None
+        return Page(seqs, [self._records[s] for s in seqs], next_cursor, total)
+
+    def facets(self, fields: Sequence[str] = FACET_FIELDS) -> Dict[str, List[Dict[str, Any]]]:
+        """Distinct values of `fields` with the number of records holding each, sorted by value."""
+        out = {}
+        for name in fields:
+            labels = self._labels.get(name, {})
+            postings = self._postings.get(name, {})
+            out[name] = [
+                {"value": labels[value], "count": len(postings[value])} for value in sorted(postings)
+            ]
+        return out
+
+    def memo(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """`build()`, cached until the next change to the index."""
+        if key not in self._derived:
+            self._derived[key] = build()
+        return self._derived[key]
+
+
+def facet_fields(fields: Optional[str] = Query(
+    None, description=f"Comma-separated, any of {', '.join(FACET_FIELDS)} (default: all)"
+)) -> List[str]:
+    """FastAPI dependency: the requested facet fields, validated."""
+    names = list(dict.fromkeys(_split(fields))) if fields is not None else list(FACET_FIELDS)
+    unknown = [name for name in names if name not in FACET_FIELDS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Facet fields must be among {', '.join(FACET_FIELDS)}",
+        )
+    return names
+
+
+def paged_records(
+    page: Page, fields: Optional[List[str]], to_dict: Callable[[Any], Dict[str, Any]] = lambda r: r
+) -> List[Dict[str, Any]]:
+    """The page's records as dicts, projected to `fields` when given."""
+    records = [to_dict(r) for r in page.records]
+    return records if fields is None else [project(r, fields) for r in records]
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from ..models import AnalyzeRequest, AnalyzeResponse
-from ..services.gemini_client import GeminiClient
+from ..services.gemini_client import GeminiClient, gemini_client_dependency
+from ..services.llm_cache import ANALYSIS_CACHE
+from ..services.llm_metrics import LLM_METRICS
+from ..services.resilience import LLMUnavailableError
+from ..prefilter import local_analysis, score_pair
 from ..store import STORE
 
 router = APIRouter(prefix="/analyze", tags=["analysis"])
 
 
 @router.post("/", response_model=AnalyzeResponse)
-async def analyze_waste_compatibility(request: AnalyzeRequest):
+async def analyze_waste_compatibility(
+    request: AnalyzeRequest,
+    response: Response,
+    gemini_client: GeminiClient = Depends(gemini_client_dependency),
+):
     """
     Analyze compatibility between two companies' waste streams using Gemini AI.
     
@@ -16,14 +24,21 @@ async def analyze_waste_compatibility(request: AnalyzeRequest):
     - CO₂ reduction potential
     - Cost savings
     - Regulatory considerations
+
+    When Gemini is unavailable (quota retries exhausted or circuit breaker
+    open) a locally computed score is returned; `X-Scored-By` tells which.
     """
     try:
-        gemini_client = GeminiClient()
-        result = gemini_client.analyze_waste_compatibility(
+        result = await gemini_client.analyze_waste_compatibility_async(
             request.company_a, 
             request.company_b
         )
+        response.headers["X-Scored-By"] = "llm"
         return result
+    except LLMUnavailableError:
+        response.headers["X-Scored-By"] = "local"
+        LLM_METRICS.record_fallback("local_score")
+        return local_analysis(score_pair(request.company_a, request.company_b))
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -34,3 +49,9 @@ async def analyze_waste_compatibility(request: AnalyzeRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Analysis failed: {str(e)}"
         )
+
+
+@router.get("/cache/stats")
+def analysis_cache_stats():
+    """Size and hit/miss counters of the Gemini analysis cache."""
+    return ANALYSIS_CACHE.stats()
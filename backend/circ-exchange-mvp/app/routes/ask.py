@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from ..models import AskRequest, AskResponse
-from ..services.gemini_client import GeminiClient
+from ..services.gemini_client import GeminiClient, gemini_client_dependency
+from ..services.sse import sse_response
 
 router = APIRouter(prefix="/ask", tags=["ai"])
 
 
 @router.post("/", response_model=AskResponse)
-async def ask_question(request: AskRequest):
+async def ask_question(
+    request: AskRequest, gemini_client: GeminiClient = Depends(gemini_client_dependency)
+):
     """
     Send a user question to Gemini AI for conversational response.
     
@@ -18,8 +21,7 @@ async def ask_question(request: AskRequest):
     - Cost optimization strategies
     """
     try:
-        gemini_client = GeminiClient()
-        response = gemini_client.ask_question(request.question)
+        response = await gemini_client.ask_question_async(request.question)
         return response
     except ValueError as e:
         raise HTTPException(
@@ -31,3 +33,17 @@ async def ask_question(request: AskRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process question: {str(e)}"
         )
+
+
+@router.post("/stream")
+async def ask_question_stream(
+    request: AskRequest, gemini_client: GeminiClient = Depends(gemini_client_dependency)
+):
+    """
+    Same as POST /ask/, streamed as server-sent events.
+
+    Each `data:` event carries {"text": ...} with the next chunk of the answer;
+    the stream ends with an `event: done` frame (or `event: error` if Gemini is
+    unavailable). Disconnecting stops the generation.
+    """
+    return sse_response(gemini_client.stream_question(request.question))
@@ -1,33 +1,63 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 from ..models import Company, MatchResult
-from ..services.gemini_client import GeminiClient
-from ..store import STORE
-from ..matcher import haversine_km
-import json
-from pathlib import Path
+from ..services.gemini_client import ANALYSIS_BATCH_SIZE, get_gemini_client
+from ..services.llm_metrics import LLM_METRICS
+from ..dataset import DEMO_DATASET, cached_response, facets_body, parse_ids
+from ..match_jobs import MATCH_JOBS
+from ..store import STORE, as_company
+from ..prefilter import LLM_SHORTLIST_SIZE, local_analysis, rank_company_pairs
+from ..record_index import ListingQuery, facet_fields, listing_query, paged_records, project
 
 router = APIRouter(prefix="/companies", tags=["companies"])
 
 def load_fake_data():
-    data_file = Path(__file__).parent.parent.parent / "fakeData.json"
-    with open(data_file, "r") as f:
-        return json.load(f)
+    """The parsed demo dataset (cached; re-read only when fakeData.json changes)."""
+    return DEMO_DATASET.snapshot().data
 
 @router.get("/demo", response_model=List[dict])
-async def get_demo_companies():
-    """Get all companies from the demo dataset"""
-    data = load_fake_data()
-    return data["companies"]
+async def get_demo_companies(
+    request: Request,
+    ids: Optional[str] = Query(None, description="Comma-separated ids, e.g. 1,5,9: only these records, in this order"),
+    query: ListingQuery = Depends(listing_query),
+):
+    """
+    Get companies from the demo dataset (ETag / If-None-Match and gzip supported).
+
+    `limit`/`cursor` paginate (the next cursor is in X-Next-Cursor, the match
+    count in X-Total-Count), `type`, `industry`, `city`, `state` and `category`
+    filter, and `fields` returns only the listed (dotted) fields. `ids` fetches
+    given records; only `fields` applies to it.
+    """
+    snapshot = DEMO_DATASET.snapshot()
+    if ids is not None:
+        selected, missing = snapshot.select(parse_ids(ids), query.fields)
+        headers = {"X-Missing-Ids": ",".join(missing)} if missing else None
+        return cached_response(request, selected, headers=headers)
+    if query.is_plain():
+        return cached_response(request, snapshot.companies_body)
+    body, headers = snapshot.page(query)
+    return cached_response(request, body, headers=headers)
+
+@router.get("/demo/facets")
+async def get_demo_facets(request: Request, fields: List[str] = Depends(facet_fields)):
+    """Distinct values with counts per field of the demo dataset, e.g. for dropdowns (ETag supported)"""
+    return cached_response(request, facets_body(DEMO_DATASET.snapshot().index, fields))
+
+@router.get("/facets")
+async def get_company_facets(request: Request, fields: List[str] = Depends(facet_fields)):
+    """Distinct values with counts per field of the stored companies (ETag supported)"""
+    return cached_response(request, facets_body(STORE.company_index, fields))
 
 @router.get("/new")
-async def get_new_companies():
-    """Get companies using the new data structure"""
+async def get_new_companies(response: Response, query: ListingQuery = Depends(listing_query)):
+    """Get companies using the new data structure (same pagination, filters and `fields` as /companies/demo)"""
     try:
-        companies = STORE.list_companies()
-        # Filter for dict objects (new structure)
-        new_companies = [company for company in companies if isinstance(company, dict)]
-        return new_companies
+        # Only dict objects (new structure), straight from the store's index
+        page = STORE.company_page(query, extra_filters={"structure": ["new"]})
+        response.headers.update(page.headers())
+        return paged_records(page, query.fields)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -35,13 +65,12 @@ async def get_new_companies():
         )
 
 @router.get("/demo/{company_id}")
-async def get_demo_company(company_id: int):
+async def get_demo_company(company_id: int, request: Request):
     """Get a specific company from the demo dataset by ID"""
-    data = load_fake_data()
-    company = next((c for c in data["companies"] if c["id"] == company_id), None)
-    if not company:
+    cached = DEMO_DATASET.snapshot().company_bodies.get(str(company_id))
+    if cached is None:
         raise HTTPException(status_code=404, detail="Company not found")
-    return company
+    return cached_response(request, cached)
 
 
 @router.post("/", response_model=Company)
@@ -65,31 +94,47 @@ async def add_company(company: Company):
         )
 
 
+def company_payload(company):
+    """Raw dictionary data if available, otherwise the Company object as a dict."""
+    if isinstance(company, dict):
+        return company
+    return {
+        "id": company.id,
+        "name": company.name,
+        "latitude": company.latitude,
+        "longitude": company.longitude,
+        "waste_streams": [{"name": ws.name, "composition": ws.composition} for ws in company.waste_streams],
+        "needs": [{"name": need.name, "composition": need.composition} for need in company.needs],
+        "quantity": company.quantity,
+        "disposal_cost": company.disposal_cost
+    }
+
+
 @router.get("/")
-async def list_companies():
+async def list_companies(
+    response: Response,
+    ids: Optional[str] = Query(None, description="Comma-separated ids: only these companies, in this order"),
+    query: ListingQuery = Depends(listing_query),
+):
     """
-    List all companies in the database.
+    List companies in the database (or only `ids`; unknown ids are listed in X-Missing-Ids).
+
+    Supports the same pagination, filters and `fields` as /companies/demo.
     """
     try:
-        companies = STORE.list_companies()
-        # Return raw dictionary data if available, otherwise convert Company objects
-        result = []
-        for company in companies:
-            if isinstance(company, dict):
-                result.append(company)
-            else:
-                # Convert Company object to dict
-                result.append({
-                    "id": company.id,
-                    "name": company.name,
-                    "latitude": company.latitude,
-                    "longitude": company.longitude,
-                    "waste_streams": [{"name": ws.name, "composition": ws.composition} for ws in company.waste_streams],
-                    "needs": [{"name": need.name, "composition": need.composition} for need in company.needs],
-                    "quantity": company.quantity,
-                    "disposal_cost": company.disposal_cost
-                })
-        return result
+        if ids is None:
+            page = STORE.company_page(query)
+            response.headers.update(page.headers())
+            return paged_records(page, query.fields, company_payload)
+        wanted = parse_ids(ids)
+        found = [(cid, STORE.get_company(cid)) for cid in wanted]
+        missing = [cid for cid, company in found if company is None]
+        if missing:
+            response.headers["X-Missing-Ids"] = ",".join(missing)
+        records = [company_payload(company) for _, company in found if company is not None]
+        return records if query.fields is None else [project(r, query.fields) for r in records]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -97,60 +142,80 @@ async def list_companies():
         )
 
 
+def ranked_company_pairs():
+    """Every stored company pair, ranked locally (O(N^2): run it off the event loop)."""
+    companies = [c for c in map(as_company, STORE.list_companies()) if c is not None]
+    return rank_company_pairs(companies)
+
+
 @router.get("/matches", response_model=List[MatchResult])
-async def get_matches():
+async def get_matches(
+    shortlist: int = Query(
+        LLM_SHORTLIST_SIZE, ge=0, le=200,
+        description="How many of the best locally scored pairs are sent to Gemini",
+    ),
+    limit: int = Query(10, ge=1, le=100),
+    batch_size: int = Query(
+        ANALYSIS_BATCH_SIZE, ge=1, le=32,
+        description="Company pairs per Gemini prompt (1 disables batching)",
+    ),
+):
     """
-    Find the best matches among all companies using Gemini AI.
-    
+    Find the best matches among all companies.
+
     This endpoint:
-    1. Loops over all company combinations
-    2. Sends each pair to Gemini for analysis
-    3. Collects and ranks results by compatibility score
-    4. Returns top matches
+    1. Scores every company pair locally (composition overlap, distance,
+       quantity fit, disposal cost), oriented producer -> consumer
+    2. Sends only the top `shortlist` pairs to Gemini, `batch_size` pairs
+       per prompt
+    3. Ranks all results by compatibility score; `scored_by` tells which
+       pairs were analyzed by the LLM and which kept their local score
+    4. Returns the top `limit` matches
     """
     try:
-        companies = STORE.list_companies()
-        if len(companies) < 2:
+        pairs = await run_in_threadpool(ranked_company_pairs)
+        if not pairs:
             return []
-        
-        gemini_client = GeminiClient()
+
+        # Only touch the (shared) Gemini client when something is shortlisted
+        gemini_client = get_gemini_client() if shortlist > 0 else None
         matches = []
-        
-        # Analyze all possible pairs
-        for i, company_a in enumerate(companies):
-            for j, company_b in enumerate(companies[i+1:], i+1):
-                try:
-                    # Get Gemini analysis
-                    analysis = gemini_client.analyze_waste_compatibility(company_a, company_b)
-                    
-                    # Calculate distance
-                    distance_km = haversine_km(
-                        company_a.latitude, company_a.longitude,
-                        company_b.latitude, company_b.longitude
-                    )
-                    
-                    # Create match result
-                    match = MatchResult(
-                        company_a=company_a,
-                        company_b=company_b,
-                        compatibility_score=analysis.compatibility_score,
-                        distance_km=distance_km,
-                        chemical_notes=analysis.chemical_notes,
-                        co2_reduction_tons=analysis.co2_reduction_tons,
-                        cost_savings_usd=analysis.cost_savings_usd,
-                        regulatory_notes=analysis.regulatory_notes
-                    )
-                    
-                    matches.append(match)
-                    
-                except Exception as e:
-                    # Skip this pair if analysis fails
-                    continue
-        
-        # Sort by compatibility score (descending) and return top 10
+
+        # Shortlisted pairs are packed batch_size per prompt; prompts run concurrently
+        shortlisted = [(p.producer, p.consumer) for p in pairs[:shortlist]]
+        try:
+            analyses = await gemini_client.analyze_batch_async(shortlisted, batch_size) if shortlisted else []
+        except Exception:
+            analyses = []
+        LLM_METRICS.record_fallback(
+            "local_score", len(shortlisted) - sum(a is not None for a in analyses)
+        )
+
+        # Pairs past the shortlist rank in local-score order, so only `limit` of them can matter
+        for rank, pair in enumerate(pairs[:shortlist + limit]):
+            analysis = analyses[rank] if rank < len(analyses) else None
+            scored_by = "llm"
+            if analysis is None:
+                # Not shortlisted, or the analysis failed: keep the local score
+                analysis, scored_by = local_analysis(pair), "local"
+
+            matches.append(MatchResult(
+                company_a=pair.producer,
+                company_b=pair.consumer,
+                compatibility_score=analysis.compatibility_score,
+                distance_km=pair.distance_km,
+                chemical_notes=analysis.chemical_notes,
+                co2_reduction_tons=analysis.co2_reduction_tons,
+                cost_savings_usd=analysis.cost_savings_usd,
+                regulatory_notes=analysis.regulatory_notes,
+                scored_by=scored_by,
+                local_score=pair.score,
+            ))
+
+        # Sort by compatibility score (descending) and return the top matches
         matches.sort(key=lambda x: x.compatibility_score, reverse=True)
-        return matches[:10]
-        
+        return matches[:limit]
+
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -161,3 +226,41 @@ async def get_matches():
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to find matches: {str(e)}"
         )
+
+
+@router.post("/matches/jobs", status_code=status.HTTP_202_ACCEPTED)
+def create_match_job(
+    shortlist: Optional[int] = Query(
+        None, ge=0,
+        description="How many of the best locally scored pairs go to Gemini (default: all of them)",
+    ),
+    batch_size: int = Query(ANALYSIS_BATCH_SIZE, ge=1, le=32),
+):
+    """
+    Start full-catalog matching in the background.
+
+    Returns a job id right away; poll GET /jobs/{id} for progress, ETA and the
+    current top matches, and read GET /jobs/{id}/results for the ranked list.
+    Progress is checkpointed, so a restarted server resumes the job.
+    """
+    try:
+        if shortlist != 0:
+            # Fail now, not in the worker, if Gemini is not configured
+            get_gemini_client()
+        companies = [c for c in map(as_company, STORE.list_companies()) if c is not None]
+        job_id = MATCH_JOBS.create(companies, shortlist, batch_size)
+        return MATCH_JOBS.status(job_id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.get("/{company_id}")
+async def get_company(company_id: str):
+    """Get one company from the database by id."""
+    company = STORE.get_company(company_id)
+    if company is None:
+        raise HTTPException(status_code=404, detail="Company not found")
+    return company_payload(company)
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from ..match_jobs import MATCH_JOBS
+import json
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, top: int = Query(10, ge=0, le=100)):
+    """
+    Progress of a match job.
+
+    Returns status (queued, running, completed, failed, cancelled), pairs
+    done/total, an ETA once some pairs have been scored, and the best `top`
+    matches found so far.
+    """
+    job = MATCH_JOBS.status(job_id, top=top)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/{job_id}/results")
+def get_job_results(job_id: str, limit: Optional[int] = Query(None, ge=1)):
+    """
+    Ranked matches of a job, streamed as NDJSON (one MatchResult per line).
+
+    Can be read while the job is running; it then holds the pairs scored so far.
+    """
+    if not MATCH_JOBS.exists(job_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    lines = (json.dumps(result) + "\n" for result in MATCH_JOBS.results(job_id, limit=limit))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@router.delete("/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a queued or running job; results scored so far are kept."""
+    if not MATCH_JOBS.exists(job_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job {job_id} not found")
+    return {"id": job_id, "cancelled": MATCH_JOBS.cancel(job_id)}
@@ -217,7 +217,6 @@ def load_sample_data():
     """Load sample data into the store."""
     from .store import STORE
     
-    for company in SAMPLE_COMPANIES:
-        STORE.upsert_company(company)
+    STORE.upsert_companies(SAMPLE_COMPANIES)
     
     return len(SAMPLE_COMPANIES)
@@ -19,8 +19,7 @@ def load_fake_data():
     # Clear existing data
     STORE.clear_all()
     
-    # Load each company
-    for company_data in companies:
-        STORE.upsert_company_from_dict(company_data)
+    # Load all companies in one batch
+    STORE.upsert_companies(companies)
     
     return len(companies)
@@ -0,0 +1,226 @@
+"""
+Content-addressed cache for Gemini compatibility analyses.
+
+Keys are a SHA-256 over the canonical JSON of everything the analysis prompt
+is built from (names, coordinates, normalized compositions, quantity,
+disposal cost) plus the model name and a prompt version, so an edit to
+either company or to the prompt produces a new key. Entries live in SQLite
+(WAL mode, shared by every uvicorn worker on the host) behind a small
+in-process LRU. Entries expire after a TTL, the table is bounded by evicting
+the least recently used rows (in batches, every `max_entries // 20` writes),
+and `invalidate_company` drops every entry involving a company when it is
+upserted. Invalidations bump an epoch that other workers re-read at most every
+`epoch_check_seconds` to drop their LRU copies.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from ..models import Company
+
+# Bump when _build_analysis_prompt changes in a way that invalidates old answers
+PROMPT_VERSION = 1
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent.parent / "llm_cache.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    company_a TEXT NOT NULL,
+    company_b TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_cache_a ON analysis_cache (company_a);
+CREATE INDEX IF NOT EXISTS analysis_cache_b ON analysis_cache (company_b);
+CREATE INDEX IF NOT EXISTS analysis_cache_accessed ON analysis_cache (accessed_at);
+CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('epoch', 0);
+"""
+
+
+def _materials(materials) -> list:
+    return [[m.name, [[k, v] for k, v in m.normalized.items()]] for m in materials]
+
+
+def analysis_cache_key(model_name: str, company_a: Company, company_b: Company) -> str:
+    """Canonical hash of the inputs `_build_analysis_prompt` reads for this pair."""
+    payload = {
+        "v": PROMPT_VERSION,
+        "model": model_name,
+        "a": [company_a.name, company_a.latitude, company_a.longitude,
+              _materials(company_a.waste_streams), company_a.quantity, company_a.disposal_cost],
+        "b": [company_b.name, company_b.latitude, company_b.longitude, _materials(company_b.needs)],
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """In-process LRU in front of a SQLite table of analysis results."""
+
+    def __init__(
+        self,
+        path: str = str(DEFAULT_CACHE_PATH),
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        memory_entries: int = 1024,
+        epoch_check_seconds: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.epoch_check_seconds = epoch_check_seconds
+        # key -> (expires_at, company_a, company_b, value)
+        self._lru: "OrderedDict[str, Tuple[float, str, str, Dict[str, Any]]]" = OrderedDict()
+        self._epoch = 0
+        self._epoch_checked = float("-inf")
+        # Evict every `_evict_every` writes, down to a mark that leaves room for the
+        # writes until the next pass; the first write evicts (older rows may exceed the cap)
+        self._evict_every = max(1, max_entries // 20)
+        self._writes = self._evict_every
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "AnalysisCache":
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH", str(DEFAULT_CACHE_PATH)),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+            memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024")),
+            epoch_check_seconds=float(os.getenv("LLM_CACHE_EPOCH_CHECK_SECONDS", "1.0")),
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened lazily so importing the app never touches the disk
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._epoch = self._read_epoch()
+            self._epoch_checked = time.monotonic()
+        return self._conn
+
+    def _read_epoch(self) -> int:
+        return self._conn.execute("SELECT value FROM cache_meta WHERE name = 'epoch'").fetchone()[0]
+
+    def _sync_epoch(self) -> None:
+        # Our own bumps update `_epoch` directly; other workers' are polled
+        now = time.monotonic()
+        if now - self._epoch_checked < self.epoch_check_seconds:
+            return
+        self._epoch_checked = now
+        # Another worker invalidated something: our LRU may hold dropped entries
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            self._lru.clear()
+            self._epoch = epoch
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            self._sync_epoch()
+            entry = self._lru.get(key)
+            if entry is not None and entry[0] > now:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return entry[3]
+
+            row = db.execute(
+                "SELECT company_a, company_b, value, created_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[3] + self.ttl_seconds <= now:
+                self._lru.pop(key, None)
+                self.misses += 1
+                return None
+            db.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            value = json.loads(row[2])
+            self._remember(key, (row[3] + self.ttl_seconds, row[0], row[1], value))
+            self.disk_hits += 1
+            return value
+
+    def put(self, key: str, company_a: str, company_b: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO analysis_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, company_a, company_b, json.dumps(value), now, now),
+            )
+            self._writes += 1
+            if self._writes >= self._evict_every:
+                self._writes = 0
+                # Size bound: drop expired rows, then the least recently used beyond the
+                # mark; the next `_evict_every - 1` writes then stay within max_entries
+                db.execute("DELETE FROM analysis_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+                db.execute(
+                    "DELETE FROM analysis_cache WHERE key IN ("
+                    "SELECT key FROM analysis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries - self._evict_every + 1,),
+                )
+            self._remember(key, (now + self.ttl_seconds, company_a, company_b, value))
+
+    def _remember(self, key: str, entry: Tuple[float, str, str, Dict[str, Any]]) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_entries:
+            self._lru.popitem(last=False)
+
+    def invalidate_company(self, company_id: str) -> int:
+        """Drop every cached analysis involving `company_id`; returns the rows removed."""
+        with self._lock:
+            db = self._db()
+            removed = db.execute(
+                "DELETE FROM analysis_cache WHERE company_a = ? OR company_b = ?", (company_id, company_id)
+            ).rowcount
+            db.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'epoch'")
+            self._epoch = self._read_epoch()
+            for key in [k for k, e in self._lru.items() if company_id in (e[1], e[2])]:
+                del self._lru[key]
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM analysis_cache")
+            db.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'epoch'")
+            self._epoch = self._read_epoch()
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db().execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": rows,
+            "memory_entries": len(self._lru),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._lru.clear()
+
+
+ANALYSIS_CACHE = AnalysisCache.from_env()
@@ -0,0 +1,71 @@
+"""
+Async execution layer for blocking LLM SDK calls.
+
+`google.generativeai`'s `generate_content` is synchronous; calling it from an
+`async def` endpoint stalls the whole event loop for the length of the call.
+`LLMExecutor.run` moves each call onto a dedicated thread pool and bounds the
+number in flight with a semaphore, so independent analyses run in parallel
+while the loop keeps serving other requests.
+"""
+
+import asyncio
+import contextvars
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Maximum concurrent LLM calls across the process (provider quota permitting)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+
+class LLMExecutor:
+    """Thread pool plus per-event-loop semaphore for blocking LLM calls."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # asyncio.Semaphore binds to the loop it is first used on; keep one per loop
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.in_flight = 0
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Created on first use (and again after shutdown, e.g. a restarted test app)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm")
+        return self._pool
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return sem
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run `fn(*args, **kwargs)` on the LLM pool without blocking the event loop."""
+        async with self._semaphore():
+            self.in_flight += 1
+            try:
+                # Carry context variables (e.g. the endpoint LLM metrics are attributed to)
+                ctx = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor(), partial(ctx.run, fn, *args, **kwargs)
+                )
+            finally:
+                self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+LLM_EXECUTOR = LLMExecutor()
@@ -0,0 +1,259 @@
+"""
+Cost and latency instrumentation for LLM calls.
+
+`GeminiClient` records every provider call here: latency, prompt/response
+tokens (from the response's usage metadata, estimated when the provider gives
+none), outcome, cache lookups, unparseable answers and fallback responses.
+Calls are attributed to the HTTP endpoint that caused them: `EndpointMiddleware`
+keeps the request scope in a context variable and FastAPI fills in the matched
+route, so `/jobs/{job_id}` is one endpoint, not one per id. Work outside a
+request (match jobs) names itself with `metrics_endpoint`.
+
+`GET /metrics` serves it all in the Prometheus text format, including the
+per-endpoint token and cost rollups (`LLM_PRICE_*_PER_MTOK` set the prices).
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .resilience import estimate_tokens
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_request_scope: ContextVar[Optional[dict]] = ContextVar("llm_request_scope", default=None)
+_endpoint_override: ContextVar[Optional[str]] = ContextVar("llm_endpoint", default=None)
+
+
+class EndpointMiddleware:
+    """ASGI middleware that makes the current request visible to `current_endpoint`."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+
+@contextmanager
+def metrics_endpoint(name: str) -> Iterator[None]:
+    """Attribute LLM calls made inside the block to `name`."""
+    token = _endpoint_override.set(name)
+    try:
+        yield
+    finally:
+        _endpoint_override.reset(token)
+
+
+def current_endpoint() -> str:
+    """"METHOD /route/{template}" of the request being served, or "other"."""
+    name = _endpoint_override.get()
+    if name is not None:
+        return name
+    scope = _request_scope.get()
+    if scope is None:
+        return "other"
+    # FastAPI stores the matched route in the (shared) scope once routing is done
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}".strip()
+
+
+def usage_tokens(response: Any, prompt: str, text: str) -> Tuple[int, int, bool]:
+    """(prompt tokens, response tokens, estimated?) for one provider answer."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    if isinstance(prompt_tokens, int) and isinstance(response_tokens, int) and prompt_tokens > 0:
+        return prompt_tokens, response_tokens, False
+    return estimate_tokens(prompt), estimate_tokens(text) if text else 0, True
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels: Any) -> str:
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class LLMMetrics:
+    """Thread-safe counters and histograms for LLM calls."""
+
+    def __init__(self, price_input_per_mtok: float = 0.10, price_output_per_mtok: float = 0.40) -> None:
+        self.price_input_per_mtok = price_input_per_mtok
+        self.price_output_per_mtok = price_output_per_mtok
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_env(cls) -> "LLMMetrics":
+        return cls(
+            price_input_per_mtok=float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.10")),
+            price_output_per_mtok=float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.40")),
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls: Dict[Tuple[str, str, str], int] = {}
+            self.latency: Dict[str, _Histogram] = {}
+            self.prompt_token_hist: Dict[str, _Histogram] = {}
+            self.tokens: Dict[Tuple[str, str], List[int]] = {}  # -> [prompt, response]
+            self.estimated: Dict[str, int] = {}
+            self.cost: Dict[str, float] = {}
+            self.parse_failures: Dict[str, int] = {}
+            self.fallbacks: Dict[Tuple[str, str], int] = {}
+            self.cache: Dict[Tuple[str, str, str], int] = {}
+
+    def cost_usd(self, prompt_tokens: int, response_tokens: int) -> float:
+        return (prompt_tokens * self.price_input_per_mtok + response_tokens * self.price_output_per_mtok) / 1e6
+
+    def record_call(
+        self,
+        operation: str,
+        seconds: float,
+        outcome: str = "ok",
+        prompt_tokens: int = 0,
+        response_tokens: int = 0,
+        estimated: bool = False,
+    ) -> None:
+        """One provider call (including its rate-limit waits and retries)."""
+        endpoint = current_endpoint()
+        with self._lock:
+            key = (endpoint, operation, outcome)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.latency.setdefault(operation, _Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if outcome != "ok":
+                return
+            self.prompt_token_hist.setdefault(operation, _Histogram(TOKEN_BUCKETS)).observe(prompt_tokens)
+            tokens = self.tokens.setdefault((endpoint, operation), [0, 0])
+            tokens[0] += prompt_tokens
+            tokens[1] += response_tokens
+            if estimated:
+                self.estimated[operation] = self.estimated.get(operation, 0) + 1
+            self.cost[endpoint] = self.cost.get(endpoint, 0.0) + self.cost_usd(prompt_tokens, response_tokens)
+
+    def record_parse_failure(self, operation: str, n: int = 1) -> None:
+        if n:
+            with self._lock:
+                self.parse_failures[operation] = self.parse_failures.get(operation, 0) + n
+
+    def record_fallback(self, kind: str, n: int = 1) -> None:
+        """A response served without a usable LLM answer (local score, default analysis, apology)."""
+        if n:
+            endpoint = current_endpoint()
+            with self._lock:
+                key = (endpoint, kind)
+                self.fallbacks[key] = self.fallbacks.get(key, 0) + n
+
+    def record_cache(self, operation: str, hits: int, misses: int) -> None:
+        endpoint = current_endpoint()
+        with self._lock:
+            for result, n in (("hit", hits), ("miss", misses)):
+                if n:
+                    key = (endpoint, operation, result)
+                    self.cache[key] = self.cache.get(key, 0) + n
+
+    def rollups(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint calls, tokens, cost, cache hits and fallbacks."""
+        out: Dict[str, Dict[str, Any]] = {}
+
+        def entry(endpoint: str) -> Dict[str, Any]:
+            return out.setdefault(endpoint, {
+                "calls": 0, "failed_calls": 0, "prompt_tokens": 0, "response_tokens": 0,
+                "cost_usd": 0.0, "cache_hits": 0, "cache_misses": 0, "fallbacks": 0,
+            })
+
+        with self._lock:
+            for (endpoint, _, outcome), n in self.calls.items():
+                entry(endpoint)["calls" if outcome == "ok" else "failed_calls"] += n
+            for (endpoint, _), (prompt, response) in self.tokens.items():
+                entry(endpoint)["prompt_tokens"] += prompt
+                entry(endpoint)["response_tokens"] += response
+            for endpoint, cost in self.cost.items():
+                entry(endpoint)["cost_usd"] = round(cost, 6)
+            for (endpoint, _, result), n in self.cache.items():
+                entry(endpoint)["cache_hits" if result == "hit" else "cache_misses"] += n
+            for (endpoint, _), n in self.fallbacks.items():
+                entry(endpoint)["fallbacks"] += n
+        return out
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, hists: Dict[str, _Histogram]) -> None:
+            for operation, h in sorted(hists.items()):
+                cumulative = 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(operation=operation, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(operation=operation)} {h.sum}")
+                lines.append(f"{name}_count{_labels(operation=operation)} {h.count}")
+
+        with self._lock:
+            family("llm_requests_total", "counter", "LLM provider calls by endpoint, operation and outcome")
+            for (endpoint, operation, outcome), n in sorted(self.calls.items()):
+                lines.append(f"llm_requests_total{_labels(endpoint=endpoint, operation=operation, outcome=outcome)} {n}")
+            family("llm_request_duration_seconds", "histogram",
+                   "LLM call latency, including rate-limit waits and retries")
+            histogram("llm_request_duration_seconds", self.latency)
+            family("llm_prompt_tokens", "histogram", "Prompt tokens per successful LLM call")
+            histogram("llm_prompt_tokens", self.prompt_token_hist)
+            for name, index, help_text in (("llm_prompt_tokens_total", 0, "Prompt tokens"),
+                                           ("llm_response_tokens_total", 1, "Response tokens")):
+                family(name, "counter", f"{help_text} by endpoint and operation")
+                for (endpoint, operation), tokens in sorted(self.tokens.items()):
+                    lines.append(f"{name}{_labels(endpoint=endpoint, operation=operation)} {tokens[index]}")
+            family("llm_estimated_token_calls_total", "counter",
+                   "Calls whose token counts were estimated (no usage metadata)")
+            for operation, n in sorted(self.estimated.items()):
+                lines.append(f"llm_estimated_token_calls_total{_labels(operation=operation)} {n}")
+            family("llm_cost_usd_total", "counter", "Estimated LLM spend by endpoint")
+            for endpoint, cost in sorted(self.cost.items()):
+                lines.append(f"llm_cost_usd_total{_labels(endpoint=endpoint)} {cost:.6f}")
+            family("llm_parse_failures_total", "counter", "LLM answers that could not be parsed")
+            for operation, n in sorted(self.parse_failures.items()):
+                lines.append(f"llm_parse_failures_total{_labels(operation=operation)} {n}")
+            family("llm_fallback_responses_total", "counter", "Responses served without a usable LLM answer")
+            for (endpoint, kind), n in sorted(self.fallbacks.items()):
+                lines.append(f"llm_fallback_responses_total{_labels(endpoint=endpoint, kind=kind)} {n}")
+            family("llm_cache_lookups_total", "counter", "Analysis cache lookups by result")
+            for (endpoint, operation, result), n in sorted(self.cache.items()):
+                lines.append(
+                    f"llm_cache_lookups_total{_labels(endpoint=endpoint, operation=operation, result=result)} {n}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+LLM_METRICS = LLMMetrics.from_env()
@@ -0,0 +1,267 @@
+"""
+LLM providers behind `GeminiClient`.
+
+A provider exposes the slice of the `google.generativeai` model API the client
+uses: `generate_content(prompt, stream=False)` returning a response with
+`.text` (or, when streaming, an iterable of such chunks), plus `name` for
+cache keys and `close()`. `LLM_PROVIDER` selects one:
+
+- `gemini` (default): Google Gemini, configured from `GOOGLE_API_KEY`;
+- `fake`: a local stand-in for load testing with no network. Answers are
+  schema-valid and derived deterministically from the prompt, while latency,
+  error rate and quota throttling are configurable (`FAKE_LLM_*`), so the
+  concurrency, caching and rate-limiting paths can be benchmarked offline.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Iterator, List, Optional, Tuple
+
+from google.api_core import exceptions as google_exceptions
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "gemini-flash-lite-latest"
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "exponential", "lognormal")
+
+_configured_key: Optional[str] = None
+
+
+def configure_genai(api_key: str) -> None:
+    """`genai.configure` once per key; reconfiguring drops the SDK's cached gRPC clients."""
+    global _configured_key
+    import google.generativeai as genai
+
+    if api_key != _configured_key:
+        genai.configure(api_key=api_key)
+        _configured_key = api_key
+
+
+def reset_genai() -> None:
+    """Forget the configured key so the next client configures the SDK again."""
+    global _configured_key
+    _configured_key = None
+
+
+class LLMProvider:
+    """Interface of a text-generation backend."""
+
+    name: str = "provider"
+
+    def generate_content(self, prompt: str, stream: bool = False) -> Any:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release network resources (app shutdown)."""
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through `google.generativeai`."""
+
+    def __init__(self, model_name: str = MODEL_NAME, api_key: Optional[str] = None) -> None:
+        import google.generativeai as genai
+
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable is required")
+        configure_genai(api_key)
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt: str, stream: bool = False) -> Any:
+        return self.model.generate_content(prompt, stream=stream)
+
+    def close(self) -> None:
+        # The SDK creates the transport on the first call, so there may be none yet
+        transport_client = getattr(self.model, "_client", None)
+        if transport_client is not None:
+            try:
+                transport_client.transport.close()
+            except Exception as e:
+                logger.warning(f"Error closing Gemini transport: {e}")
+
+
+class TextResponse:
+    """A generated answer (or one streamed chunk of it) with the SDK's `.text`."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+def _digest(*parts: str) -> int:
+    return int.from_bytes(hashlib.sha256("\n".join(parts).encode("utf-8")).digest()[:8], "big")
+
+
+def fake_analysis(producer: str, consumer: str) -> dict:
+    """Analysis fields derived from the company names alone, so a pair gets the
+    same answer whether it was asked for on its own or inside a batch."""
+    h = _digest(producer, consumer)
+    score = h % 101
+    return {
+        "compatibility_score": score,
+        "chemical_notes": f"Simulated analysis of {producer} -> {consumer}.",
+        "co2_reduction_tons": round(score * ((h >> 8) % 50 + 1) / 10, 1),
+        "cost_savings_usd": float(score * ((h >> 16) % 1000 + 100)),
+        "regulatory_notes": "Simulated answer; no regulatory review.",
+    }
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline stand-in for Gemini.
+
+    - Analysis prompts (single or batched) get a JSON answer from `fake_analysis`;
+      any other prompt gets a canned sentence chosen by its hash.
+    - Each call sleeps for a latency drawn from `latency` (constant, uniform,
+      exponential or lognormal around `latency_ms`, width `latency_spread`).
+    - A fraction `error_rate` of calls raises 503 ServiceUnavailable.
+    - Above `requests_per_minute` (enforced over a sliding `quota_window_seconds`),
+      calls raise 429 TooManyRequests, like a provider-side quota.
+
+    Latency and errors come from an RNG seeded with `seed`, so a run is reproducible.
+    """
+
+    def __init__(
+        self,
+        name: str = "fake-llm",
+        latency: str = "constant",
+        latency_ms: float = 0.0,
+        latency_spread: float = 0.5,
+        error_rate: float = 0.0,
+        requests_per_minute: Optional[float] = None,
+        quota_window_seconds: float = 60.0,
+        seed: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {latency!r}; use one of {LATENCY_DISTRIBUTIONS}")
+        self.name = name
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.quota_window_seconds = quota_window_seconds
+        self._rng = random.Random(seed)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._window: Deque[float] = deque()
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    @classmethod
+    def from_env(cls) -> "FakeProvider":
+        rpm = os.getenv("FAKE_LLM_REQUESTS_PER_MINUTE")
+        return cls(
+            latency=os.getenv("FAKE_LLM_LATENCY", "constant"),
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+            latency_spread=float(os.getenv("FAKE_LLM_LATENCY_SPREAD", "0.5")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            requests_per_minute=float(rpm) if rpm else None,
+            quota_window_seconds=float(os.getenv("FAKE_LLM_QUOTA_WINDOW_SECONDS", "60")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+        )
+
+    def _draw_latency(self) -> float:
+        """Seconds for the next call."""
+        mean = self.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        if self.latency == "uniform":
+            return self._rng.uniform(mean * (1 - self.latency_spread), mean * (1 + self.latency_spread))
+        if self.latency == "exponential":
+            return self._rng.expovariate(1.0 / mean)
+        if self.latency == "lognormal":
+            # latency_ms is the median; the spread is sigma of the underlying normal
+            return self._rng.lognormvariate(math.log(mean), self.latency_spread)
+        return mean
+
+    def _admit(self) -> Tuple[float, bool]:
+        """Count the call against the quota; returns (latency, fail) drawn under the lock."""
+        with self._lock:
+            self.calls += 1
+            if self.requests_per_minute is not None:
+                now = self._clock()
+                window = self.quota_window_seconds
+                while self._window and now - self._window[0] >= window:
+                    self._window.popleft()
+                if len(self._window) >= self.requests_per_minute * window / 60.0:
+                    self.throttled += 1
+                    raise google_exceptions.TooManyRequests("Simulated quota exceeded")
+                self._window.append(now)
+            latency = self._draw_latency()
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return latency, fail
+
+    def generate_content(self, prompt: str, stream: bool = False) -> Any:
+        latency, fail = self._admit()
+        if not stream:
+            self._sleep(latency)
+            if fail:
+                raise google_exceptions.ServiceUnavailable("Simulated provider error")
+            return TextResponse(self.answer(prompt))
+        # Failures surface before the first chunk, as a refused stream would
+        if fail:
+            self._sleep(latency)
+            raise google_exceptions.ServiceUnavailable("Simulated provider error")
+        return self._stream(self.answer(prompt), latency)
+
+    def _stream(self, text: str, latency: float) -> Iterator[TextResponse]:
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
+                  for i in range(0, len(words), 4)]
+        for chunk in chunks:
+            self._sleep(latency / len(chunks))
+            yield TextResponse(chunk)
+
+    def answer(self, prompt: str) -> str:
+        """The deterministic answer to `prompt`."""
+        opportunities = re.findall(r'Opportunity "(p\d+)" -> Consumer: (.*)', prompt)
+        if opportunities:
+            # Batched prompt: each producer block lists its opportunities after it
+            items = []
+            for block in prompt.split("\n---\n"):
+                producer = re.search(r"Producer: (.*)", block)
+                for pair_id, consumer in re.findall(r'Opportunity "(p\d+)" -> Consumer: (.*)', block):
+                    item = {"pair_id": pair_id}
+                    item.update(fake_analysis(producer.group(1).strip() if producer else "", consumer.strip()))
+                    items.append(item)
+            return json.dumps(items)
+        company_a = re.search(r"Company A: (.*)", prompt)
+        company_b = re.search(r"Company B: (.*)", prompt)
+        if company_a and company_b and "compatibility_score" in prompt:
+            return json.dumps(fake_analysis(company_a.group(1).strip(), company_b.group(1).strip()))
+        return FAKE_ANSWERS[_digest(prompt) % len(FAKE_ANSWERS)]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors, "throttled": self.throttled}
+
+
+FAKE_ANSWERS: List[str] = [
+    "Simulated answer: pair waste streams with nearby consumers whose needs match their composition.",
+    "Simulated answer: local reuse cuts disposal costs and transport emissions at the same time.",
+    "Simulated answer: check permits for hazardous components before any exchange.",
+]
+
+
+def provider_from_env() -> LLMProvider:
+    """The provider named by `LLM_PROVIDER` (gemini or fake)."""
+    kind = os.getenv("LLM_PROVIDER", "gemini").lower()
+    if kind == "fake":
+        return FakeProvider.from_env()
+    if kind == "gemini":
+        return GeminiProvider(os.getenv("LLM_MODEL", MODEL_NAME))
+    raise ValueError(f"Unknown LLM_PROVIDER {kind!r}; use 'gemini' or 'fake'")
@@ -0,0 +1,235 @@
+"""
+Client-side rate limiting, retries and circuit breaking for LLM calls.
+
+`LLMGuard.call` wraps one provider request:
+
+- two token buckets (requests and tokens per minute) hold the call until it
+  fits the quota, so bursts queue locally instead of being throttled remotely;
+- retryable errors (429, 5xx, timeouts) are retried with capped exponential
+  backoff and full jitter, so throttled callers spread out instead of
+  retrying in lockstep;
+- a circuit breaker opens after consecutive failed calls and fails fast with
+  `LLMUnavailableError` until a cool-down has passed, then lets one probe
+  through. Callers serve cached or locally computed scores meanwhile.
+
+Calls run on the LLM thread pool, so waiting here never blocks the event loop.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class LLMUnavailableError(RuntimeError):
+    """The provider could not answer: retries exhausted or the circuit is open."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Failing fast while the circuit breaker is open."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for quota accounting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` tokens/minute."""
+
+    def __init__(
+        self,
+        per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, n: float = 1.0) -> float:
+        """Take `n` tokens, sleeping until they are available; returns the time waited."""
+        n = min(n, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    self.waited_seconds += waited
+                    return waited
+                delay = (n - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` straight failures -> half-open after `reset_seconds`."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one probe at a time."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    self.times_opened += 1
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+class LLMGuard:
+    """Rate limits, retries and circuit breaking around provider calls."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute, clock=clock, sleep=sleep)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self._sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMGuard":
+        return cls(
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+            tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            ),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)."""
+        return random.uniform(0.0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def call(self, fn: Callable[[], T], tokens: int = 1) -> T:
+        """Run `fn()` within the quota; raises LLMUnavailableError when it cannot succeed."""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+        self.calls += 1
+        attempt = 0
+        while True:
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+            try:
+                result = fn()
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(f"LLM call failed after {attempt} attempts: {e}") from e
+                self.retries += 1
+                self._sleep(self.backoff(attempt))
+                continue
+            except Exception:
+                # Not a capacity problem (bad request, parse error...): do not trip the breaker
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "rate_limited_seconds": round(self.requests.waited_seconds + self.tokens.waited_seconds, 3),
+        }
+
+
+LLM_GUARD = LLMGuard.from_env()
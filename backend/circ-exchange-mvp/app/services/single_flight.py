@@ -0,0 +1,59 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+When several requests ask for the same thing at once (the same `/analyze/`
+pair, the same `/ask/` question), only the first starts a Gemini call; the
+others await the same task and receive the same result or exception. The
+call runs as its own task, so a caller that disconnects does not cancel it
+for the others.
+"""
+
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Per-event-loop map of canonical request key -> in-flight task."""
+
+    def __init__(self) -> None:
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.calls = 0
+        self.deduplicated = 0
+
+    def _tasks(self) -> Dict[str, asyncio.Task]:
+        loop = asyncio.get_running_loop()
+        tasks = self._inflight.get(loop)
+        if tasks is None:
+            tasks = self._inflight[loop] = {}
+        return tasks
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await `fn()`, sharing one call among concurrent callers with the same key."""
+        tasks = self._tasks()
+        task = tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            tasks[key] = task
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+        else:
+            self.deduplicated += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return sum(len(tasks) for tasks in self._inflight.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "in_flight": self.in_flight(),
+        }
+
+
+SINGLE_FLIGHT = SingleFlight()
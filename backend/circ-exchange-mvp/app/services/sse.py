@@ -0,0 +1,72 @@
+"""
+Server-sent-event streaming of LLM output.
+
+`sse_stream` pulls chunks from a blocking generator (e.g.
+`GeminiClient.stream_question`) on the LLM thread pool and forwards each one as
+a `data:` event as soon as it arrives, followed by a final `done` event. If the
+client disconnects, Starlette cancels the response and the generator is closed,
+which cancels the provider stream.
+"""
+
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from fastapi.responses import StreamingResponse
+
+from .llm_executor import LLM_EXECUTOR
+from .resilience import LLMUnavailableError
+
+_END = object()
+
+
+class _BlockingStream:
+    """A generator pulled from pool threads; close waits for an in-progress pull."""
+
+    def __init__(self, chunks: Iterator[str]) -> None:
+        self._chunks = chunks
+        self._lock = threading.Lock()
+
+    def pull(self):
+        with self._lock:
+            return next(self._chunks, _END)
+
+    def close(self) -> None:
+        with self._lock:
+            self._chunks.close()
+
+
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """One SSE frame; data is JSON so newlines in the text survive framing."""
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+async def sse_stream(chunks: Iterator[str]) -> AsyncIterator[str]:
+    """Forward text chunks as SSE frames without blocking the event loop."""
+    stream = _BlockingStream(chunks)
+    try:
+        while True:
+            try:
+                chunk = await LLM_EXECUTOR.run(stream.pull)
+            except LLMUnavailableError as e:
+                yield sse_event({"detail": str(e)}, event="error")
+                return
+            if chunk is _END:
+                break
+            yield sse_event({"text": chunk})
+        yield sse_event({}, event="done")
+    finally:
+        # Runs on completion and when the client goes away mid-stream; closing may
+        # have to wait for a pull still running on the pool, so do it off the loop
+        asyncio.get_running_loop().run_in_executor(None, stream.close)
+
+
+def sse_response(chunks: Iterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        sse_stream(chunks),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,203 @@
+"""
+Grid bucket index over site coordinates for radius-bounded lookups.
+
+Sites are bucketed into fixed-size latitude/longitude cells, so a radius
+query only visits the cells overlapping the circle's bounding box. Each
+site's coordinates, cos(latitude) and unit-sphere xyz vector are cached in
+NumPy arrays at ingest, so the sites inside those cells are filtered with a
+dot-product test and measured with the vectorized `haversine_km_many`.
+"""
+
+from math import asin, ceil, cos, degrees, floor, pi, radians, sin
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .matcher import haversine_km_many, haversine_matrix
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    """Unit-sphere xyz for a latitude/longitude in degrees."""
+    lat_r, lon_r = radians(lat), radians(lon)
+    return cos(lat_r) * cos(lon_r), cos(lat_r) * sin(lon_r), sin(lat_r)
+
+
+def cap_bounds(lat: float, radius_km: float) -> Tuple[float, float, Optional[float]]:
+    """(lat_lo, lat_hi, dlon) of the bounding box of a search circle, in degrees.
+
+    The box spans lon +- dlon; dlon is None when the circle contains a pole and
+    so covers every longitude. lat_lo / lat_hi may lie beyond +-90.
+    """
+    delta = radius_km / EARTH_RADIUS_KM
+    lat_lo, lat_hi = degrees(radians(lat) - delta), degrees(radians(lat) + delta)
+    if lat_lo <= -90.0 or lat_hi >= 90.0 or delta >= pi / 2 or sin(delta) >= cos(radians(lat)):
+        return lat_lo, lat_hi, None
+    return lat_lo, lat_hi, degrees(asin(sin(delta) / cos(radians(lat))))
+
+
+class GridIndex:
+    """Spatial hash of site ids keyed by (lat cell, lon cell)."""
+
+    def __init__(self, cell_deg: float = 0.5) -> None:
+        self.cell_deg = cell_deg
+        self._lat_cells = int(ceil(180.0 / cell_deg))
+        self._lon_cells = int(ceil(360.0 / cell_deg))
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        # Coordinate cache: one slot per site, reused after removals
+        self._slots: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._lat = np.zeros(0)
+        self._lon = np.zeros(0)
+        self._cos_lat = np.zeros(0)
+        self._xyz = np.zeros((0, 3))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._slots
+
+    def _lat_cell(self, lat: float) -> int:
+        return min(int(floor((lat + 90.0) / self.cell_deg)), self._lat_cells - 1)
+
+    def _lon_cell(self, lon: float) -> int:
+        return int(floor((lon + 180.0) / self.cell_deg)) % self._lon_cells
+
+    def _cell_of(self, slot: int) -> Tuple[int, int]:
+        return self._lat_cell(float(self._lat[slot])), self._lon_cell(float(self._lon[slot]))
+
+    def _allocate(self, key: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+            return slot
+        slot = len(self._keys)
+        self._keys.append(key)
+        if slot >= self._lat.size:
+            capacity = max(16, 2 * self._lat.size)
+            self._lat = np.resize(self._lat, capacity)
+            self._lon = np.resize(self._lon, capacity)
+            self._cos_lat = np.resize(self._cos_lat, capacity)
+            self._xyz = np.resize(self._xyz, (capacity, 3))
+        return slot
+
+    def upsert(self, key: str, lat: float, lon: float) -> None:
+        self.remove(key)
+        slot = self._allocate(key)
+        self._slots[key] = slot
+        self._lat[slot] = lat
+        self._lon[slot] = lon
+        self._cos_lat[slot] = cos(radians(lat))
+        self._xyz[slot] = unit_vector(lat, lon)
+        self._cells.setdefault(self._cell_of(slot), set()).add(slot)
+
+    def remove(self, key: str) -> None:
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        cell = self._cell_of(slot)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(slot)
+            if not bucket:
+                del self._cells[cell]
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._slots.clear()
+        self._keys.clear()
+        self._free.clear()
+
+    def location(self, key: str) -> Optional[Tuple[float, float]]:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return float(self._lat[slot]), float(self._lon[slot])
+
+    def _candidate_cells(self, lat: float, lon: float, radius_km: float) -> Iterator[Tuple[int, int]]:
+        """Occupied cells that intersect the bounding box of the search circle."""
+        lat_lo, lat_hi, dlon = cap_bounds(lat, radius_km)
+        lat_range = range(self._lat_cell(max(lat_lo, -90.0)), self._lat_cell(min(lat_hi, 90.0)) + 1)
+
+        if dlon is None:
+            lon_cells = None
+        else:
+            first = int(floor((lon - dlon + 180.0) / self.cell_deg))
+            last = int(floor((lon + dlon + 180.0) / self.cell_deg))
+            if last - first + 1 >= self._lon_cells:
+                lon_cells = None
+            else:
+                lon_cells = {c % self._lon_cells for c in range(first, last + 1)}
+
+        n_box = len(lat_range) * (self._lon_cells if lon_cells is None else len(lon_cells))
+        if n_box > len(self._cells):
+            # Sparse grid: cheaper to filter the occupied cells than to probe the box
+            for cell in list(self._cells):
+                if cell[0] in lat_range and (lon_cells is None or cell[1] in lon_cells):
+                    yield cell
+            return
+        for lat_cell in lat_range:
+            for lon_cell in (range(self._lon_cells) if lon_cells is None else lon_cells):
+                if (lat_cell, lon_cell) in self._cells:
+                    yield (lat_cell, lon_cell)
+
+    def _candidate_slots(self, cells: Iterable[Tuple[int, int]]) -> np.ndarray:
+        slots: List[int] = []
+        for cell in cells:
+            slots.extend(self._cells[cell])
+        return np.array(slots, dtype=np.int64)
+
+    def _in_cap(self, slots: np.ndarray, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Cheap dot-product pre-filter on the cached unit vectors (conservative)."""
+        delta = radius_km / EARTH_RADIUS_KM
+        if delta >= pi:
+            return slots
+        dots = self._xyz[slots] @ np.array(unit_vector(lat, lon))
+        return slots[dots >= cos(delta) - 1e-9]
+
+    def _as_dict(self, slots: np.ndarray, dists: np.ndarray, radius_km: float) -> Dict[str, float]:
+        keep = dists <= radius_km
+        return dict(zip([self._keys[s] for s in slots[keep].tolist()], dists[keep].tolist()))
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Dict[str, float]:
+        """Map of site id -> great-circle distance for every site within `radius_km`."""
+        slots = self._candidate_slots(self._candidate_cells(lat, lon, radius_km))
+        slots = self._in_cap(slots, lat, lon, radius_km)
+        if slots.size == 0:
+            return {}
+        dists = haversine_km_many(lat, lon, self._lat[slots], self._lon[slots], self._cos_lat[slots])
+        return self._as_dict(slots, dists, radius_km)
+
+    def within_many(self, keys: Iterable[str], radius_km: float) -> Iterator[Tuple[str, Dict[str, float]]]:
+        """`within` for many indexed sites, yielded in cell order.
+
+        Sources sharing a grid cell are answered together: their candidate cells are
+        gathered once and measured with one many-to-many distance matrix. Keys that
+        are not indexed are skipped.
+        """
+        groups: Dict[Tuple[int, int], List[int]] = {}
+        for key in dict.fromkeys(keys):
+            slot = self._slots.get(key)
+            if slot is not None:
+                groups.setdefault(self._cell_of(slot), []).append(slot)
+
+        for cell in sorted(groups):
+            sources = np.array(groups[cell], dtype=np.int64)
+            cells: Set[Tuple[int, int]] = set()
+            for slot in sources.tolist():
+                cells.update(self._candidate_cells(float(self._lat[slot]), float(self._lon[slot]), radius_km))
+            slots = self._candidate_slots(cells)
+            if slots.size == 0:
+                dists = np.zeros((sources.size, 0))
+            else:
+                dists = haversine_matrix(
+                    self._lat[sources], self._lon[sources], self._lat[slots], self._lon[slots],
+                    self._cos_lat[sources], self._cos_lat[slots],
+                )
+            for row, slot in enumerate(sources.tolist()):
+                yield self._keys[slot], self._as_dict(slots, dists[row], radius_km)
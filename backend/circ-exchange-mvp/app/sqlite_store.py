@@ -0,0 +1,375 @@
+"""
+SQLite (WAL) backend for the store, shared by every API worker.
+
+`InMemoryStore` keeps one private copy of the data per process. `SqliteStore`
+makes a SQLite file the source of truth instead: writes go to the database in
+one transaction per batch (one prepared statement per table, `executemany`),
+and every process keeps its in-memory dicts and indexes (composition matrix,
+grids, match view, listing index) as a cache of it.
+
+Each write also records `(kind, id)` in a change log whose version only grows;
+a record keeps one log entry, its latest. `sync()` applies the entries newer
+than the last one this process has seen, so a worker picks up the others'
+writes with one indexed query. `StoreSyncMiddleware` calls it before every
+request. WAL mode lets those readers run while another worker writes.
+
+The companies table carries secondary indexes on type, industry, state/city
+and material name (case-folded, like `RecordIndex`): `company_page` answers
+listing filters on those fields from the shared database, so a page never
+depends on how far this worker's copy has caught up. Both tables also index
+(latitude, longitude): `companies_within` / `facilities_within` fetch the rows
+inside the search circle's bounding box with one range query and measure them
+with `haversine_km_many`.
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .matcher import haversine_km_many
+from .models import Company, Facility
+from .record_index import ListingQuery, Page, company_index_values, encode_cursor
+from .spatial import cap_bounds
+from .store import InMemoryStore, company_coordinates
+
+DEFAULT_STORE_PATH = Path(__file__).parent.parent / "store.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    type TEXT COLLATE NOCASE,
+    industry TEXT COLLATE NOCASE,
+    city TEXT COLLATE NOCASE,
+    state TEXT COLLATE NOCASE,
+    latitude REAL,
+    longitude REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS companies_seq ON companies (seq);
+CREATE INDEX IF NOT EXISTS companies_type ON companies (type);
+CREATE INDEX IF NOT EXISTS companies_industry ON companies (industry);
+CREATE INDEX IF NOT EXISTS companies_place ON companies (state, city);
+CREATE INDEX IF NOT EXISTS companies_position ON companies (latitude, longitude);
+CREATE TABLE IF NOT EXISTS company_materials (
+    company_id TEXT NOT NULL,
+    material TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (company_id, material)
+);
+CREATE INDEX IF NOT EXISTS company_materials_material ON company_materials (material);
+CREATE TABLE IF NOT EXISTS facilities (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS facilities_seq ON facilities (seq);
+CREATE INDEX IF NOT EXISTS facilities_position ON facilities (latitude, longitude);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    UNIQUE (kind, id)
+);
+"""
+
+# A new record goes after the existing ones; an update keeps its position
+_UPSERT_COMPANY = """
+INSERT INTO companies (id, seq, kind, type, industry, city, state, latitude, longitude, data)
+VALUES (?, (SELECT COALESCE(MAX(seq) + 1, 0) FROM companies), ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    kind = excluded.kind, type = excluded.type, industry = excluded.industry,
+    city = excluded.city, state = excluded.state, latitude = excluded.latitude,
+    longitude = excluded.longitude, data = excluded.data
+"""
+_UPSERT_FACILITY = """
+INSERT INTO facilities (id, seq, latitude, longitude, data)
+VALUES (?, (SELECT COALESCE(MAX(seq) + 1, 0) FROM facilities), ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    latitude = excluded.latitude, longitude = excluded.longitude, data = excluded.data
+"""
+# REPLACE drops the record's previous entry, so the log holds one entry per record
+_LOG_CHANGE = "INSERT OR REPLACE INTO changes (kind, id) VALUES (?, ?)"
+
+# Ids per `IN (...)` lookup, below SQLite's bound-parameter limit
+_CHUNK = 500
+
+# Listing filter -> companies column (`structure` is the stored kind, new or model)
+_FILTER_COLUMNS = {"type": "type", "industry": "industry", "city": "city", "state": "state", "structure": "kind"}
+
+# Slack (degrees) on the bounding-box bounds, so rounding never drops a site on its edge
+_BOX_MARGIN_DEG = 1e-9
+
+
+def _company_row(company: Union[Company, dict]) -> Tuple[tuple, List[Tuple[str, str]]]:
+    """(companies row, company_materials rows) of a Company model or a fakeData.json dict."""
+    if isinstance(company, dict):
+        company_id, kind, data = str(company.get("id", "")), "new", json.dumps(company)
+    else:
+        company_id, kind, data = company.id, "model", company.model_dump_json()
+    # Case-folded like the RecordIndex keys, so filters match the same records
+    values = {name: [v.casefold() for v in vals] for name, vals in company_index_values(company).items()}
+    first = {name: (vals[0] if vals else None) for name, vals in values.items()}
+    lat, lon = company_coordinates(company) or (None, None)
+    row = (company_id, kind, first.get("type"), first.get("industry"), first.get("city"),
+           first.get("state"), lat, lon, data)
+    return row, [(company_id, material) for material in dict.fromkeys(values.get("material", []))]
+
+
+def _box_where(lat: float, lon: float, radius_km: float) -> Tuple[str, List[float]]:
+    """WHERE clause selecting the (latitude, longitude) bounding box of a search circle.
+
+    Longitudes are taken to lie in [-180, 180]; a box crossing the antimeridian
+    is split in two ranges.
+    """
+    lat_lo, lat_hi, dlon = cap_bounds(lat, radius_km)
+    where = "latitude BETWEEN ? AND ?"
+    params = [lat_lo - _BOX_MARGIN_DEG, lat_hi + _BOX_MARGIN_DEG]
+    if dlon is None or 2 * dlon >= 360.0:
+        return where, params
+    lon_lo, lon_hi = lon - dlon - _BOX_MARGIN_DEG, lon + dlon + _BOX_MARGIN_DEG
+    if lon_lo < -180.0:
+        ranges = [(lon_lo + 360.0, 180.0), (-180.0, lon_hi)]
+    elif lon_hi > 180.0:
+        ranges = [(lon_lo, 180.0), (-180.0, lon_hi - 360.0)]
+    else:
+        ranges = [(lon_lo, lon_hi)]
+    where += " AND (" + " OR ".join("longitude BETWEEN ? AND ?" for _ in ranges) + ")"
+    return where, params + [bound for pair in ranges for bound in pair]
+
+
+def _decode_company(kind: str, data: str) -> Union[Company, dict]:
+    return json.loads(data) if kind == "new" else Company.model_validate_json(data)
+
+
+class SqliteStore(InMemoryStore):
+    """`InMemoryStore` whose data lives in a shared SQLite database."""
+
+    shared = True
+
+    def __init__(self, path: str = str(DEFAULT_STORE_PATH)) -> None:
+        super().__init__()
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # Newest change-log version applied to the in-memory copy
+        self.version = 0
+        # Whether the initial load (which notifies no listeners) has happened
+        self.loaded = False
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write(self, statements: Sequence[Tuple[str, List[tuple]]]) -> None:
+        """Run `executemany` for each (sql, rows) in one transaction, then catch up."""
+        with self._lock:
+            db = self._db()
+            if not self.loaded:
+                # Load what is already there first, so that this write notifies listeners
+                self.sync()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    if rows:
+                        db.executemany(sql, rows)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            self.sync()
+
+    # ---------- Writes ----------
+
+    def upsert_companies(self, companies: Iterable[Union[Company, dict]]) -> None:
+        # The last version of a company wins, as with one upsert after another
+        latest = {}
+        for company in companies:
+            row, company_materials = _company_row(company)
+            latest[row[0]] = (row, company_materials)
+        rows = [row for row, _ in latest.values()]
+        materials = [m for _, company_materials in latest.values() for m in company_materials]
+        ids = [(company_id,) for company_id in latest]
+        self._write([
+            (_UPSERT_COMPANY, rows),
+            ("DELETE FROM company_materials WHERE company_id = ?", ids),
+            ("INSERT OR IGNORE INTO company_materials (company_id, material) VALUES (?, ?)", materials),
+            (_LOG_CHANGE, [("company", company_id) for (company_id,) in ids]),
+        ])
+
+    def upsert_company(self, company: Company) -> None:
+        self.upsert_companies([company])
+
+    def upsert_company_from_dict(self, company_dict: dict) -> None:
+        self.upsert_companies([company_dict])
+
+    def upsert_facilities(self, facilities: Iterable[Facility]) -> None:
+        rows = [(f.id, f.latitude, f.longitude, f.model_dump_json()) for f in facilities]
+        self._write([
+            (_UPSERT_FACILITY, rows),
+            (_LOG_CHANGE, [("facility", row[0]) for row in rows]),
+        ])
+
+    def upsert_facility(self, facility: Facility) -> None:
+        self.upsert_facilities([facility])
+
+    def clear_all(self) -> None:
+        """Clear all data from the store (in every process sharing the database)."""
+        with self._lock:
+            db = self._db()
+            if not self.loaded:
+                self.sync()
+            db.execute("BEGIN IMMEDIATE")
+            for table in ("companies", "company_materials", "facilities", "changes"):
+                db.execute(f"DELETE FROM {table}")
+            # The log's versions keep growing, so other processes see the clear as new
+            db.execute(_LOG_CHANGE, ("clear", ""))
+            db.execute("COMMIT")
+            self.sync()
+
+    # ---------- Catching up ----------
+
+    def _fetch(self, db: sqlite3.Connection, sql: str, ids: List[str]) -> Dict[str, tuple]:
+        rows: Dict[str, tuple] = {}
+        for start in range(0, len(ids), _CHUNK):
+            chunk = ids[start:start + _CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            for row in db.execute(sql.format(placeholders), chunk):
+                rows[row[0]] = row
+        return rows
+
+    def sync(self) -> int:
+        """Apply the changes made since the last sync (by any process); returns how many."""
+        with self._lock:
+            db = self._db()
+            # One read transaction: the log and the records come from the same snapshot
+            db.execute("BEGIN")
+            try:
+                changes = db.execute(
+                    "SELECT version, kind, id FROM changes WHERE version > ? ORDER BY version",
+                    (self.version,),
+                ).fetchall()
+                if not changes:
+                    self.loaded = True
+                    return 0
+                latest = changes[-1][0]
+                kinds = [kind for _, kind, _ in changes]
+                if "clear" in kinds:
+                    # A clear empties the log first, so it is the oldest entry we can see
+                    changes = changes[kinds.index("clear") + 1:]
+                companies = self._fetch(
+                    db, "SELECT id, seq, kind, data FROM companies WHERE id IN ({})",
+                    [i for _, kind, i in changes if kind == "company"],
+                )
+                facilities = self._fetch(
+                    db, "SELECT id, seq, data FROM facilities WHERE id IN ({})",
+                    [i for _, kind, i in changes if kind == "facility"],
+                )
+            finally:
+                db.execute("COMMIT")
+
+            # Loading the whole dataset into a fresh process is not an update:
+            # listeners (cache invalidation) only hear about later changes
+            notify, self.loaded = self.loaded, True
+            if "clear" in kinds:
+                InMemoryStore.clear_all(self)
+            # Entries are in version order: replaying them keeps the cache's insertion order
+            for _, kind, record_id in changes:
+                if kind == "company" and record_id in companies:
+                    _, seq, company_kind, data = companies[record_id]
+                    self.company_order[record_id] = seq
+                    self.companies[record_id] = _decode_company(company_kind, data)
+                    self._index_company(record_id, self.companies[record_id], notify=notify)
+                elif kind == "facility" and record_id in facilities:
+                    _, seq, data = facilities[record_id]
+                    self.facility_order[record_id] = seq
+                    InMemoryStore.upsert_facility(self, Facility.model_validate_json(data))
+            self.version = latest
+            return len(changes)
+
+    # ---------- Spatial lookups from the shared database ----------
+
+    def _within(self, table: str, known: Dict[str, Any], lat: float, lon: float,
+                radius_km: float) -> Dict[str, float]:
+        """Sites of `table` within `radius_km`, prefiltered by the position index.
+
+        Sites another worker wrote since the last sync are left out, so callers
+        only get ids they can look up (`StoreSyncMiddleware` syncs per request).
+        """
+        where, params = _box_where(lat, lon, radius_km)
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT id, latitude, longitude FROM {table} WHERE {where} ORDER BY seq", params
+            ).fetchall()
+        rows = [row for row in rows if row[0] in known]
+        if not rows:
+            return {}
+        dists = haversine_km_many(lat, lon, [row[1] for row in rows], [row[2] for row in rows])
+        return {row[0]: dist for row, dist in zip(rows, dists.tolist()) if dist <= radius_km}
+
+    def facilities_within(self, lat: float, lon: float, radius_km: float) -> Dict[str, float]:
+        """Map of facility id -> distance (km), answered by the database's position index."""
+        return self._within("facilities", self.facilities, lat, lon, radius_km)
+
+    def companies_within(self, lat: float, lon: float, radius_km: float) -> Dict[str, float]:
+        """Map of company id -> distance (km), answered by the database's position index."""
+        return self._within("companies", self.companies, lat, lon, radius_km)
+
+    # ---------- Listings from the shared database ----------
+
+    def company_page(self, query: ListingQuery, extra_filters: Optional[Dict[str, List[str]]] = None) -> Page:
+        """`InMemoryStore.company_page`, with the filters answered by the database's indexes.
+
+        Listings without filters, or filtering on a field the tables do not index
+        (category, location), are served by the in-process index.
+        """
+        filters = {**query.filters, **(extra_filters or {})}
+        if not filters or not all(name in _FILTER_COLUMNS or name == "material" for name in filters):
+            return super().company_page(query, extra_filters)
+
+        where, params = [], []
+        for name, values in sorted(filters.items()):
+            placeholders = ",".join("?" * len(values))
+            if name == "material":
+                where.append(f"id IN (SELECT company_id FROM company_materials WHERE material IN ({placeholders}))")
+            else:
+                where.append(f"{_FILTER_COLUMNS[name]} IN ({placeholders})")
+            params += values
+        sql_where = " AND ".join(where)
+        after = -1 if query.after is None else query.after
+        limit = -1 if query.limit is None else query.limit + 1
+        with self._lock:
+            db = self._db()
+            rows = db.execute(
+                f"SELECT id, seq FROM companies WHERE {sql_where} AND seq > ? ORDER BY seq LIMIT ?",
+                (*params, after, limit),
+            ).fetchall()
+            if any(company_id not in self.companies for company_id, _ in rows):
+                # Written by another worker since the last sync
+                self.sync()
+            # Cached until the index changes, as RecordIndex does for its own counts
+            total = self.company_index.memo(
+                ("sql-count", sql_where, tuple(params)),
+                lambda: db.execute(f"SELECT COUNT(*) FROM companies WHERE {sql_where}", params).fetchone()[0],
+            )
+        more = query.limit is not None and len(rows) > query.limit
+        rows = rows[:query.limit] if more else rows
+        found: List[Tuple[int, Any]] = [(seq, self.companies[cid]) for cid, seq in rows if cid in self.companies]
+        seqs = [seq for seq, _ in found]
+        next_cursor = encode_cursor(seqs[-1]) if seqs and more else None
+        return Page(seqs, [record for _, record in found], next_cursor, total)
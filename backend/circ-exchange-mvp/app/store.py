@@ -1,38 +1,207 @@
-from typing import Dict, List, Optional, Union
-from .models import Facility, Company
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+from .composition import VOCAB
+from .models import Facility, Company, Material
+from .engine import MatchEngine
+from .spatial import GridIndex
+from .match_view import MatchView
+from .record_index import ListingQuery, Page, RecordIndex
+
+
+def company_coordinates(company: Union[Company, dict]) -> Optional[Tuple[float, float]]:
+    """(lat, lon) for a Company model or a fakeData.json style company dict."""
+    if isinstance(company, dict):
+        coords = (company.get("location") or {}).get("coordinates") or {}
+        lat, lng = coords.get("lat"), coords.get("lng")
+        if lat is None or lng is None:
+            return None
+        return float(lat), float(lng)
+    return company.latitude, company.longitude
+
+
+def _material(stream: dict, key: str) -> Material:
+    # Specs like "< 25%" are not proportions; keep only numeric components
+    comp = {
+        k: float(v) for k, v in (stream.get(key) or {}).items()
+        if isinstance(v, (int, float)) and not isinstance(v, bool)
+    }
+    return Material(name=stream.get("material", ""), composition=comp)
+
+
+def intern_company(company: Union[Company, dict]) -> None:
+    """Add a stored company's component names to the shared vocabulary."""
+    if isinstance(company, dict):
+        for stream, key in (("waste_stream", "composition"), ("material_needs", "composition_needed")):
+            for name in ((company.get(stream) or {}).get(key) or {}):
+                VOCAB.intern(name)
+        return
+    for material in company.waste_streams + company.needs:
+        material.intern()
+
+
+def as_company(company: Union[Company, dict]) -> Optional[Company]:
+    """Company model view of a fakeData.json style dict (None without coordinates).
+
+    A producer's waste stream becomes its only waste stream, with the disposal cost
+    per ton; a consumer's material needs become its only need. `quantity` is the
+    stream's tonnage on either side.
+    """
+    if not isinstance(company, dict):
+        return company
+    coords = company_coordinates(company)
+    if coords is None:
+        return None
+    waste = company.get("waste_stream") or {}
+    need = company.get("material_needs") or {}
+    stream = waste or need
+    disposal = (waste.get("current_disposal") or {}).get("cost_per_ton")
+    return Company(
+        id=str(company.get("id", "")),
+        name=company.get("name", ""),
+        latitude=coords[0],
+        longitude=coords[1],
+        waste_streams=[_material(waste, "composition")] if waste else [],
+        needs=[_material(need, "composition_needed")] if need else [],
+        quantity=stream.get("quantity_tons_year"),
+        disposal_cost=disposal,
+    )
+
 
 class InMemoryStore:
+    # Whether other processes write to the same data (then call `sync` before reads)
+    shared = False
+
     def __init__(self) -> None:
         self.facilities: Dict[str, Facility] = {}
         self.companies: Dict[str, Company] = {}
+        # Composition matrix used by /match, kept in sync on every facility upsert
+        self.engine = MatchEngine()
+        # Spatial indexes for radius-bounded candidate lookups
+        self.facility_grid = GridIndex()
+        self.company_grid = GridIndex()
+        # Insertion order of facilities, the final tie-break when ranking matches
+        self.facility_order: Dict[str, int] = {}
+        # Materialized top-K match lists, patched on every facility upsert
+        self.match_view = MatchView(self)
+        # Insertion order of companies and the filter/pagination index over them
+        self.company_order: Dict[str, int] = {}
+        self.company_index = RecordIndex()
+        # Called with the company id after every company upsert (e.g. cache invalidation)
+        self.company_listeners: List[Callable[[str], None]] = []
+
+    def sync(self) -> int:
+        """Pick up changes made by other processes (none: this store is the only copy)."""
+        return 0
+
+    def close(self) -> None:
+        pass
 
     def upsert_facility(self, facility: Facility) -> None:
         self.facilities[facility.id] = facility
+        self.facility_order.setdefault(facility.id, len(self.facility_order))
+        self.engine.upsert(facility)
+        self.facility_grid.upsert(facility.id, facility.latitude, facility.longitude)
+        self.match_view.on_upsert(facility)
+
+    def upsert_facilities(self, facilities: Iterable[Facility]) -> None:
+        for facility in facilities:
+            self.upsert_facility(facility)
 
     def list_facilities(self) -> List[Facility]:
         return list(self.facilities.values())
 
     def get_facility(self, facility_id: str) -> Optional[Facility]:
         return self.facilities.get(facility_id)
-    
+
+    def facilities_within(self, lat: float, lon: float, radius_km: float) -> Dict[str, float]:
+        """Facility id -> distance (km) for every facility within `radius_km`."""
+        return self.facility_grid.within(lat, lon, radius_km)
+
     def upsert_company(self, company: Company) -> None:
         self.companies[company.id] = company
+        self._index_company(company.id, company)
+
+    def upsert_companies(self, companies: Iterable[Union[Company, dict]]) -> None:
+        """Add Company models and/or fakeData.json style dicts."""
+        for company in companies:
+            if isinstance(company, dict):
+                self.upsert_company_from_dict(company)
+            else:
+                self.upsert_company(company)
 
     def list_companies(self) -> List[Company]:
         return list(self.companies.values())
 
     def get_company(self, company_id: str) -> Optional[Company]:
         return self.companies.get(company_id)
-    
+
+    def company_page(self, query: ListingQuery, extra_filters: Optional[Dict[str, List[str]]] = None) -> Page:
+        """One page of the stored companies matching the query's filters."""
+        return self.company_index.query(query, extra_filters)
+
+    def companies_within(self, lat: float, lon: float, radius_km: float) -> Dict[str, float]:
+        """Company id -> distance (km) for every company within `radius_km`."""
+        return self.company_grid.within(lat, lon, radius_km)
+
     def upsert_company_from_dict(self, company_dict: dict) -> None:
         """Add a company from dictionary data (new structure)."""
         # Store the raw dictionary data for now
         company_id = str(company_dict.get('id', ''))
         self.companies[company_id] = company_dict
-    
+        self._index_company(company_id, company_dict)
+
+    def _index_company(self, company_id: str, company: Union[Company, dict], notify: bool = True) -> None:
+        seq = self.company_order.setdefault(company_id, len(self.company_order))
+        intern_company(company)
+        self.company_index.put(seq, company)
+        coords = company_coordinates(company)
+        if coords is None:
+            self.company_grid.remove(company_id)
+        else:
+            self.company_grid.upsert(company_id, *coords)
+        if notify:
+            for listener in self.company_listeners:
+                listener(company_id)
+
     def clear_all(self) -> None:
         """Clear all data from the store."""
         self.facilities.clear()
         self.companies.clear()
+        self.engine.clear()
+        self.facility_grid.clear()
+        self.company_grid.clear()
+        self.company_order.clear()
+        self.company_index.clear()
+        self.facility_order.clear()
+        self.match_view.clear()
+
+class StoreSyncMiddleware:
+    """ASGI middleware that brings `store` up to date before each request."""
+
+    def __init__(self, app, store: InMemoryStore) -> None:
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            # sync() reads the database; keep it off the event loop
+            await run_in_threadpool(self.store.sync)
+        await self.app(scope, receive, send)
+
+
+def store_from_env() -> InMemoryStore:
+    """STORE_BACKEND=memory (default) or sqlite (shared by workers; file at STORE_PATH)."""
+    backend = os.getenv("STORE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        from .sqlite_store import DEFAULT_STORE_PATH, SqliteStore
+
+        return SqliteStore(os.getenv("STORE_PATH", str(DEFAULT_STORE_PATH)))
+    if backend != "memory":
+        raise ValueError(f"Unknown STORE_BACKEND {backend!r} (expected memory or sqlite)")
+    return InMemoryStore()
+
 
-STORE = InMemoryStore()
+STORE = store_from_env()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request Gemini client setup, fresh client vs. shared client.
+
+Before the shared client, every /analyze, /ask and /companies/matches request
+built a new GeminiClient, which re-ran `genai.configure` and so discarded the
+SDK's cached gRPC client. This measures the local part of that setup (no
+network: a dummy key is used and no request is sent). In production the
+fresh-client path also pays a new channel + TLS handshake on its first call,
+which the shared client avoids entirely.
+
+Usage: python benchmarks/bench_client_setup.py [n_requests]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai  # noqa: E402
+from google.generativeai import client as genai_client  # noqa: E402
+
+from app.services import gemini_client  # noqa: E402
+
+
+def fresh_request():
+    # What each request used to do
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    model = genai.GenerativeModel(gemini_client.MODEL_NAME)
+    return model, genai_client.get_default_generative_client()
+
+
+def shared_request():
+    client = gemini_client.get_gemini_client()
+    return client.model, genai_client.get_default_generative_client()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    os.environ.setdefault("GOOGLE_API_KEY", "bench-dummy-key")
+
+    for label, fn in (("fresh client", fresh_request), ("shared client", shared_request)):
+        fn()  # warm imports
+        transports = []  # keep them alive so ids are not reused
+        start = time.perf_counter()
+        for _ in range(n):
+            transports.append(fn()[1])
+        ms = (time.perf_counter() - start) * 1000 / n
+        distinct = len({id(t) for t in transports})
+        print(f"  {label:<14} {ms:8.4f} ms/request   distinct gRPC clients {distinct}")
+    gemini_client.close_gemini_client()
+
+
+if __name__ == "__main__":
+    main()
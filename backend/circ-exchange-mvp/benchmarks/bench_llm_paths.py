@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the LLM analysis paths against the offline fake provider.
+
+No network and no API key: `FakeProvider` answers every prompt after a
+lognormal latency (median `latency_ms`), so this measures what the client-side
+machinery buys. It reports:
+
+- sequential single-pair calls vs. the same pairs on the LLM pool, unbatched
+  and batched (`LLM_MAX_CONCURRENCY` bounds the pool);
+- the same batch again with the analysis cache warm;
+- identical concurrent questions coalesced by single-flight;
+- a provider quota below the offered load, with and without the client-side
+  token bucket pacing requests (throttled calls are retried with backoff).
+
+Usage: python benchmarks/bench_llm_paths.py [n_pairs] [latency_ms]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Company  # noqa: E402
+from app.services import gemini_client  # noqa: E402
+from app.services.gemini_client import GeminiClient  # noqa: E402
+from app.services.llm_cache import AnalysisCache  # noqa: E402
+from app.services.llm_provider import FakeProvider  # noqa: E402
+from app.services.resilience import CircuitBreaker, LLMGuard  # noqa: E402
+
+
+def make_pairs(n):
+    producers = [
+        Company(id=f"p{i}", name=f"Producer {i}", latitude=29.0 + i * 0.01, longitude=-95.0,
+                waste_streams=[{"name": "slag", "composition": {"CaO": 0.4 + i % 5 * 0.1, "SiO2": 0.3}}],
+                quantity=100 + i)
+        for i in range(max(1, n // 4))
+    ]
+    consumers = [
+        Company(id=f"c{j}", name=f"Consumer {j}", latitude=29.5, longitude=-95.0 + j * 0.01,
+                needs=[{"name": "lime", "composition": {"CaO": 0.6, "SiO2": 0.4}}])
+        for j in range(4)
+    ]
+    return [(p, c) for p in producers for c in consumers][:n]
+
+
+def fresh(latency_ms, guard=None, **provider_kwargs):
+    gemini_client.ANALYSIS_CACHE = AnalysisCache(path=":memory:")
+    gemini_client.LLM_GUARD = guard or LLMGuard(requests_per_minute=1e9, tokens_per_minute=1e12)
+    return GeminiClient(FakeProvider(latency="lognormal", latency_ms=latency_ms, latency_spread=0.3,
+                                     **provider_kwargs))
+
+
+def timed(label, fn, calls):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34} {elapsed * 1000:9.1f} ms   provider calls {calls():4d}")
+    return result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    pairs = make_pairs(n)
+    # Unanswered pairs are counted below; skip the per-call error logs
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+    print(f"{len(pairs)} pairs, lognormal provider latency, median {latency_ms:.0f} ms")
+
+    client = fresh(latency_ms)
+    timed("sequential, one prompt per pair",
+          lambda: [client.analyze_waste_compatibility(a, b) for a, b in pairs], lambda: client.model.calls)
+
+    client = fresh(latency_ms)
+    timed("pool, one prompt per pair",
+          lambda: asyncio.run(client.analyze_batch_async(pairs, batch_size=1)), lambda: client.model.calls)
+
+    client = fresh(latency_ms)
+    timed("pool, 8 pairs per prompt",
+          lambda: asyncio.run(client.analyze_batch_async(pairs, batch_size=8)), lambda: client.model.calls)
+    timed("pool, 8 pairs per prompt, warm cache",
+          lambda: asyncio.run(client.analyze_batch_async(pairs, batch_size=8)), lambda: client.model.calls)
+
+    client = fresh(latency_ms)
+
+    async def same_question():
+        return await asyncio.gather(*(client.ask_question_async("How do I reuse slag?") for _ in range(n)))
+
+    timed(f"{n} identical concurrent questions", lambda: asyncio.run(same_question()), lambda: client.model.calls)
+
+    # Provider quota of 600 requests/minute enforced per second (10/s), below what the pool offers
+    for label, rpm in (("quota 600/min, no client pacing", 1e9), ("quota 600/min, paced to 540/min", 540)):
+        guard = LLMGuard(requests_per_minute=rpm, tokens_per_minute=1e12, max_retries=5,
+                         backoff_base=0.05, backoff_max=0.5,
+                         breaker=CircuitBreaker(failure_threshold=1000))
+        # Start with an empty provider window and a token bucket holding a 10-request burst
+        guard.requests._tokens = min(guard.requests.capacity, 10)
+        client = fresh(latency_ms, guard=guard, requests_per_minute=600, quota_window_seconds=1.0)
+        results = timed(label, lambda: asyncio.run(client.analyze_batch_async(pairs[:40], batch_size=1)),
+                        lambda: client.model.calls)
+        print(f"  {'':<34} throttled (429) {client.model.throttled}, retries {guard.retries}, "
+              f"unanswered {sum(r is None for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
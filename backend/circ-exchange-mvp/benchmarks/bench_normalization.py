@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark: re-normalizing compositions per comparison vs. normalizing once at ingest.
+
+Scores every source waste against every candidate need three ways and counts
+how many times `_normalize_comp` runs on the query path:
+
+  1. dict path     - `weighted_jaccard` on raw dicts (old /match inner loop)
+  2. cached path   - `Material.normalized` + `NormalizedComposition.weighted_jaccard`
+  3. matrix path   - `MatchEngine.best_matches` over the composition matrix
+
+then issues /match queries through the app (bypass, view refresh and fresh view
+reads), which should not re-normalize anything either.
+
+Usage: python benchmarks/bench_normalization.py [n_facilities]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import composition, matcher  # noqa: E402
+from app.engine import MatchEngine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Facility, Material  # noqa: E402
+from app.store import STORE  # noqa: E402
+
+COMPONENTS = ["CaO", "SiO2", "Fe2O3", "Al2O3", "MgO", "FeO", "Polyethylene",
+              "Polypropylene", "Water", "C", "Fe", "Mn", "Si", "Cellulose", "Lignin"]
+
+
+class NormalizeCounter:
+    """Wraps `_normalize_comp` in both modules that call it and counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self._original = matcher._normalize_comp
+
+    def __call__(self, comp):
+        self.calls += 1
+        return self._original(comp)
+
+    def __enter__(self):
+        matcher._normalize_comp = self
+        composition._normalize_comp = self
+        return self
+
+    def __exit__(self, *exc):
+        matcher._normalize_comp = self._original
+        composition._normalize_comp = self._original
+
+
+def make_facilities(n, seed=42):
+    rng = random.Random(seed)
+
+    def material(name):
+        keys = rng.sample(COMPONENTS, rng.randint(2, 6))
+        return Material(name=name, composition={k: rng.uniform(1, 100) for k in keys})
+
+    return [
+        Facility(
+            id=f"f{i}", name=f"Facility {i}",
+            latitude=rng.uniform(26, 36), longitude=rng.uniform(-106, -94),
+            waste_streams=[material(f"w{i}.{j}") for j in range(rng.randint(1, 3))],
+            needs=[material(f"n{i}.{j}") for j in range(rng.randint(1, 3))],
+        )
+        for i in range(n)
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    facilities = make_facilities(n)
+    sources = facilities[:20]
+    print(f"📊 {n} facilities, {len(sources)} source queries")
+
+    def dict_path():
+        for src in sources:
+            for cand in facilities:
+                for w in src.waste_streams:
+                    for need in cand.needs:
+                        matcher.weighted_jaccard(w.composition, need.composition)
+
+    def cached_path():
+        for src in sources:
+            for cand in facilities:
+                for w in src.waste_streams:
+                    for need in cand.needs:
+                        w.normalized.weighted_jaccard(need.normalized)
+
+    engine = MatchEngine()
+    for f in facilities:
+        engine.upsert(f)
+
+    def matrix_path():
+        for src in sources:
+            engine.best_matches(src.id)
+
+    for label, fn in [("dict path", dict_path), ("cached path", cached_path),
+                      ("matrix path", matrix_path)]:
+        with NormalizeCounter() as counter:
+            elapsed = timed(fn)
+        print(f"  {label:<12} {elapsed * 1000:9.1f} ms   _normalize_comp calls: {counter.calls}")
+
+    client = TestClient(app)
+    STORE.clear_all()
+    client.post("/facilities/bulk", json=[f.model_dump() for f in facilities])
+
+    def route(query):
+        def run():
+            for src in sources:
+                client.get(f"/match/{src.id}{query}")
+        return run
+
+    print("  /match route")
+    for label, fn in [("bypass", route("?radius_km=800")), ("view refresh", route("")),
+                      ("view fresh", route(""))]:
+        with NormalizeCounter() as counter:
+            elapsed = timed(fn)
+        print(f"  {label:<12} {elapsed * 1000:9.1f} ms   _normalize_comp calls: {counter.calls}")
+    STORE.clear_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# Keep the Gemini analysis cache and match-job checkpoints off the working tree during tests
+os.environ.setdefault("LLM_CACHE_PATH", ":memory:")
+os.environ.setdefault("MATCH_JOBS_PATH", ":memory:")
@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+from app.dataset import DEFAULT_DATASET_PATH, JsonFileDataset
+from app.main import app
+from app.sample_data_new import load_fake_data
+from app.store import STORE
+
+
+client = TestClient(app)
+
+
+def test_demo_endpoints_serve_cached_bytes_with_etag():
+    with open(DEFAULT_DATASET_PATH) as f:
+        companies = json.load(f)["companies"]
+
+    r = client.get("/companies/demo", headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200 and r.json() == companies
+    assert "Content-Encoding" not in r.headers
+    etag = r.headers["ETag"]
+
+    r = client.get("/companies/demo", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b"" and r.headers["ETag"] == etag
+
+    r = client.get("/companies/demo", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip" and r.json() == companies
+    gz_etag = r.headers["ETag"]
+    assert gz_etag != etag
+    assert client.get("/companies/demo", headers={"If-None-Match": f"W/{gz_etag}"}).status_code == 304
+
+    # A malformed q-value is not a server error: the body is just sent uncompressed
+    r = client.get("/companies/demo", headers={"Accept-Encoding": "gzip;q=abc"})
+    assert r.status_code == 200 and "Content-Encoding" not in r.headers and r.json() == companies
+    r = client.get("/companies/demo", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in r.headers
+
+    first = companies[0]
+    r = client.get(f"/companies/demo/{first['id']}")
+    assert r.json() == first
+    r2 = client.get(f"/companies/demo/{first['id']}", headers={"If-None-Match": r.headers["ETag"]})
+    assert r2.status_code == 304
+    assert client.get("/companies/demo/999999").status_code == 404
+
+
+def test_dataset_reloads_only_when_file_changes(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps({"companies": [{"id": 1, "name": "A"}]}))
+    dataset = JsonFileDataset(path)
+
+    snap = dataset.snapshot()
+    assert dataset.snapshot() is snap and dataset.loads == 1
+    assert gzip.decompress(snap.companies_body.gzipped) == snap.companies_body.body
+
+    # Touched but unchanged: re-read, same ETag
+    os.utime(path, ns=(0, 10**9))
+    assert dataset.snapshot().companies_body.etag == snap.companies_body.etag and dataset.loads == 2
+
+    path.write_text(json.dumps({"companies": [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}]}))
+    os.utime(path, ns=(0, 2 * 10**9))
+    new = dataset.snapshot()
+    assert [c["id"] for c in new.companies] == [1, 2]
+    assert new.companies_body.etag != snap.companies_body.etag
+    assert set(new.company_bodies) == {"1", "2"}
+
+
+def test_demo_multi_id_fetch_in_request_order():
+    r = client.get("/companies/demo?ids=5,1,999,5,", headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200
+    assert [c["id"] for c in r.json()] == [5, 1]
+    assert r.headers["X-Missing-Ids"] == "999"
+    etag = r.headers["ETag"]
+    assert client.get("/companies/demo?ids=5,1,999", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/companies/demo?ids=1,5", headers={"If-None-Match": etag}).status_code == 200
+
+    too_many = ",".join(str(i) for i in range(1001))
+    assert client.get(f"/companies/demo?ids={too_many}").status_code == 400
+
+
+def test_store_and_facility_lookups_by_id():
+    load_fake_data()
+    r = client.get("/companies/?ids=3,1,nope")
+    assert [c["id"] for c in r.json()] == [3, 1] and r.headers["X-Missing-Ids"] == "nope"
+    assert client.get("/companies/3").json()["id"] == 3
+    assert client.get("/companies/nope").status_code == 404
+
+    STORE.clear_all()
+    for fid in ("f1", "f2"):
+        client.post("/facilities", json={
+            "id": fid, "name": fid, "latitude": 29.7, "longitude": -95.3,
+            "waste_streams": [{"name": "slag", "composition": {"CaO": 1.0}}],
+        })
+    assert client.get("/facilities/f2").json()["id"] == "f2"
+    assert client.get("/facilities/f9").status_code == 404
+    r = client.get("/facilities?ids=f2,f9,f1")
+    assert [f["id"] for f in r.json()] == ["f2", "f1"] and r.headers["X-Missing-Ids"] == "f9"
@@ -0,0 +1,178 @@
+import math
+import random
+
+from app.engine import MatchEngine
+from app.matcher import weighted_jaccard
+from app.models import Facility, Material
+
+
+COMPONENTS = ["CaO", "SiO2", "Fe2O3", "Al2O3", "MgO", "Polyethylene", "Water", "C"]
+
+
+def _random_material(rng: random.Random, name: str) -> Material:
+    keys = rng.sample(COMPONENTS, rng.randint(1, 4))
+    # Mix 0..1 and 0..100 scales, plus the occasional negative value
+    scale = rng.choice([1.0, 100.0])
+    return Material(name=name, composition={k: rng.uniform(-0.1, 1.0) * scale for k in keys})
+
+
+def _random_facilities(seed: int, n: int):
+    rng = random.Random(seed)
+    facilities = []
+    for i in range(n):
+        facilities.append(
+            Facility(
+                id=f"f{i}",
+                name=f"F{i}",
+                latitude=rng.uniform(25, 35),
+                longitude=rng.uniform(-100, -90),
+                waste_streams=[_random_material(rng, f"w{i}.{j}") for j in range(rng.randint(0, 3))],
+                needs=[_random_material(rng, f"n{i}.{j}") for j in range(rng.randint(0, 3))],
+            )
+        )
+    return facilities
+
+
+def _reference_best(source: Facility, facilities):
+    """The original pure-Python waste x need loop from /match."""
+    results = []
+    for cand in facilities:
+        if cand.id == source.id:
+            continue
+        best_sim, best_pair = 0.0, (None, None)
+        for w_idx, w in enumerate(source.waste_streams):
+            for n_idx, n in enumerate(cand.needs):
+                sim = weighted_jaccard(w.composition, n.composition)
+                if sim > best_sim:
+                    best_sim, best_pair = sim, (w_idx, n_idx)
+        if best_sim > 0:
+            results.append((cand.id, best_sim) + best_pair)
+    return results
+
+
+def test_best_matches_equal_scalar_loop():
+    facilities = _random_facilities(seed=7, n=60)
+    engine = MatchEngine()
+    for f in facilities:
+        engine.upsert(f)
+
+    by_id = {f.id: f for f in facilities}
+    for source in facilities:
+        expected = _reference_best(source, facilities)
+        actual = engine.best_matches(source.id)
+        assert [r[0] for r in actual] == [r[0] for r in expected]
+        for (cand_id, sim, w_idx, n_idx), (_, ref_sim, _, _) in zip(actual, expected):
+            assert math.isclose(sim, ref_sim, rel_tol=1e-9, abs_tol=1e-12)
+            # Exact ties may be broken differently by rounding, but the pair must be optimal
+            pair_sim = weighted_jaccard(
+                source.waste_streams[w_idx].composition, by_id[cand_id].needs[n_idx].composition
+            )
+            assert math.isclose(pair_sim, ref_sim, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_upsert_replaces_rows():
+    engine = MatchEngine()
+    src = Facility(id="s", name="S", latitude=0, longitude=0,
+                   waste_streams=[Material(name="w", composition={"a": 1.0})])
+    cand = Facility(id="c", name="C", latitude=0, longitude=0,
+                    needs=[Material(name="n", composition={"a": 1.0})])
+    engine.upsert(src)
+    engine.upsert(cand)
+    assert engine.best_matches("s") == [("c", 1.0, 0, 0)]
+
+    engine.upsert(cand.model_copy(update={"needs": [Material(name="n", composition={"b": 1.0})]}))
+    assert engine.best_matches("s") == []
+
+
+def test_inverted_index_tracks_upserts():
+    engine = MatchEngine()
+    src = Facility(id="s", name="S", latitude=0, longitude=0,
+                   waste_streams=[Material(name="w", composition={"CaO": 0.6, "SiO2": 0.4})])
+    a = Facility(id="a", name="A", latitude=0, longitude=0,
+                 needs=[Material(name="n", composition={"cao": 1.0})])
+    b = Facility(id="b", name="B", latitude=0, longitude=0,
+                 needs=[Material(name="n", composition={"Water": 1.0, "SiO2": 0.0})])
+    for f in (src, a, b):
+        engine.upsert(f)
+
+    # Zero-weight components are not posted, so b shares nothing with s
+    assert engine.overlapping_facilities("s") == {"a"}
+    assert [m[0] for m in engine.best_matches("s")] == ["a"]
+
+    engine.upsert(a.model_copy(update={"needs": [Material(name="n", composition={"water": 1.0})]}))
+    assert engine.overlapping_facilities("s") == set()
+
+    stats = {s["component"]: s for s in engine.component_stats()}
+    assert stats["water"]["need_facilities"] == 2
+    assert stats["cao"]["waste_materials"] == 1
+    assert stats["cao"]["need_materials"] == 0
+
+
+def test_weighted_minhash_collision_rate_tracks_jaccard():
+    from app.composition import NormalizedComposition
+    from app.lsh import WeightedMinHasher
+
+    hasher = WeightedMinHasher(n_hashes=2000, seed=5)
+    a = NormalizedComposition.from_mapping({"x": 0.7, "y": 0.3}, intern=True)
+    b = NormalizedComposition.from_mapping({"x": 0.4, "z": 0.6}, intern=True)
+    agreement = (hasher.signature(a) == hasher.signature(b)).mean()
+    assert abs(agreement - a.weighted_jaccard(b)) < 0.05
+    assert (hasher.signature(a) == hasher.signature(a)).all()
+
+
+def test_lsh_candidates_are_rescored_exactly():
+    facilities = _random_facilities(seed=3, n=40)
+    engine = MatchEngine()
+    for f in facilities:
+        engine.upsert(f)
+
+    exact = dict(zip(*engine.similarities("f0")))
+    cands = engine.lsh.candidates("f0", bands=64)
+    approx_ids, approx_sims = engine.similarities("f0", cands)
+    assert set(approx_ids) <= set(exact)
+    for facility_id, sim in zip(approx_ids, approx_sims.tolist()):
+        assert sim == exact[facility_id]
+
+    # A need identical to a source waste always collides in every band
+    twin = Facility(id="twin", name="Twin", latitude=0, longitude=0,
+                    needs=[facilities[0].waste_streams[0]])
+    engine.upsert(twin)
+    assert "twin" in engine.lsh.candidates("f0", bands=4)
+
+
+def test_upserts_patch_the_compiled_matrix():
+    facilities = _random_facilities(seed=11, n=80)
+    engine = MatchEngine()
+    for f in facilities:
+        engine.upsert(f)
+    engine.similarities(facilities[0].id)
+    compiled = engine._compiled
+
+    # Mirrors the engine's contents in store insertion order
+    current = {f.id: f for f in facilities}
+    rng = random.Random(5)
+    for step in range(40):
+        f = rng.choice(facilities)
+        needs = [_random_material(rng, f"u{step}.{j}") for j in range(rng.randint(0, 3))]
+        current[f.id] = f.model_copy(update={"needs": needs})
+        engine.upsert(current[f.id])
+        if step % 7 == 0:
+            removed = rng.choice(facilities).id
+            engine.remove(removed)
+            current.pop(removed, None)
+    current["new"] = Facility(id="new", name="New", latitude=0, longitude=0,
+                              needs=[Material(name="n", composition={"Slag": 1.0, "CaO": 0.5})])
+    engine.upsert(current["new"])
+
+    # Patched in place (no rebuild), and identical to an engine built from scratch
+    assert engine._compiled is compiled
+    fresh = MatchEngine()
+    for f in current.values():
+        fresh.upsert(f)
+    for source_id in current:
+        ids, sims = engine.similarities(source_id)
+        fresh_ids, fresh_sims = fresh.similarities(source_id)
+        assert ids == fresh_ids
+        assert sims.tolist() == fresh_sims.tolist()
+        for facility_id in ids:
+            assert engine.best_pair(source_id, facility_id) == fresh.best_pair(source_id, facility_id)
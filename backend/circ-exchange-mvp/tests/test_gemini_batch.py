@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from app.models import Company
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient
+from app.services.llm_cache import AnalysisCache
+from app.services.llm_metrics import LLM_METRICS
+from app.services.resilience import LLMUnavailableError
+
+SINGLE = ('{"compatibility_score": 40, "chemical_notes": "single", "co2_reduction_tons": 0.0, '
+          '"cost_savings_usd": 0.0, "regulatory_notes": "r"}')
+
+
+def _company(cid, wastes=(), needs=()):
+    return Company(
+        id=cid, name=cid.upper(), latitude=29.7, longitude=-95.3,
+        waste_streams=[{"name": f"{cid}-waste", "composition": c} for c in wastes],
+        needs=[{"name": f"{cid}-need", "composition": c} for c in needs],
+    )
+
+
+def _item(pair_id, score):
+    return {"pair_id": pair_id, "compatibility_score": score, "chemical_notes": "batched",
+            "co2_reduction_tons": 1.0, "cost_savings_usd": 2.0, "regulatory_notes": "r"}
+
+
+class _Model:
+    """Answers batched prompts with a canned array and single prompts with SINGLE."""
+
+    def __init__(self, items):
+        self.items = items
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        text = "```json\n" + json.dumps(self.items) + "\n```" if "pair_id" in prompt else SINGLE
+        return type("R", (), {"text": text})()
+
+
+def _client(items, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.gemini_client.ANALYSIS_CACHE", AnalysisCache(path=str(tmp_path / "c.db")))
+    client = GeminiClient.__new__(GeminiClient)
+    client.model_name = "test-model"
+    client.model = _Model(items)
+    return client
+
+
+def _pairs():
+    slag, ash = _company("slag", wastes=[{"CaO": 1.0}]), _company("ash", wastes=[{"SiO2": 1.0}])
+    cement, brick = _company("cement", needs=[{"CaO": 1.0}]), _company("brick", needs=[{"SiO2": 1.0}])
+    return [(slag, cement), (ash, brick), (slag, brick), (ash, cement)]
+
+
+def test_batch_parses_items_and_falls_back_per_pair(tmp_path, monkeypatch):
+    # After sorting by producer: p0=(ash, brick), p1=(ash, cement), p2=(slag, cement), p3=(slag, brick)
+    items = [_item("p0", 70), _item("p1", 150), _item("p2", 90), {"pair_id": "p9"}, "junk"]
+    client = _client(items, tmp_path, monkeypatch)
+    LLM_METRICS.reset()
+    results = client.analyze_batch(_pairs(), batch_size=4)
+
+    assert [r.compatibility_score for r in results] == [90, 70, 40, 40]
+    # The per-pair fallbacks do not look the cache up a second time
+    assert gemini_client.ANALYSIS_CACHE.stats()["misses"] == 4
+    assert LLM_METRICS.rollups()["other"]["cache_misses"] == 4
+    assert [r.chemical_notes for r in results] == ["batched", "batched", "single", "single"]
+    # One batched prompt plus single calls for the invalid p1 and the missing p3
+    assert len(client.model.prompts) == 3
+    batch_prompt = client.model.prompts[0]
+    assert batch_prompt.count("Producer: SLAG") == 1 and batch_prompt.count("Producer: ASH") == 1
+
+    # Everything is now cached: no further prompts
+    again = client.analyze_batch(_pairs(), batch_size=4)
+    assert again == results and len(client.model.prompts) == 3
+
+
+def test_batch_async_splits_by_batch_size(tmp_path, monkeypatch):
+    client = _client([_item("p0", 60), _item("p1", 61)], tmp_path, monkeypatch)
+    results = asyncio.run(client.analyze_batch_async(_pairs(), batch_size=2))
+    assert len(client.model.prompts) == 2
+    assert all(r.chemical_notes == "batched" for r in results)
+    # Each prompt covers one producer's two pairs
+    assert all(p.count("Producer:") == 1 for p in client.model.prompts)
+
+
+def test_batch_stops_after_a_failed_chunk(tmp_path, monkeypatch):
+    client = _client([], tmp_path, monkeypatch)
+    calls = []
+
+    def unavailable(prompt, output_tokens=400, operation="analyze"):
+        calls.append(operation)
+        raise LLMUnavailableError("rate limited")
+
+    client._generate = unavailable
+    results = client.analyze_batch(_pairs(), batch_size=2)
+    # The first chunk fails: the second one is never sent
+    assert calls == ["analyze_batch"]
+    assert results == [None, None, None, None]
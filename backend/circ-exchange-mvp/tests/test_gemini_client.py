@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import AskResponse
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient, gemini_client_dependency
+
+
+client = TestClient(app)
+
+
+def test_shared_client_is_created_once(monkeypatch):
+    configured = []
+    monkeypatch.setenv("GOOGLE_API_KEY", "dummy")
+    monkeypatch.setattr("google.generativeai.configure", lambda **kw: configured.append(kw))
+    gemini_client.close_gemini_client()
+
+    first = gemini_client.get_gemini_client()
+    assert gemini_client.get_gemini_client() is first
+    assert GeminiClient().model_name == first.model_name  # same key: no reconfigure
+    assert configured == [{"api_key": "dummy"}]
+
+    gemini_client.close_gemini_client()
+    assert gemini_client.get_gemini_client() is not first
+    assert len(configured) == 2
+    gemini_client.close_gemini_client()
+
+
+def test_ask_uses_dependency(monkeypatch):
+    class FakeClient:
+        async def ask_question_async(self, question):
+            return AskResponse(answer=f"echo: {question}")
+
+    app.dependency_overrides[gemini_client_dependency] = FakeClient
+    try:
+        r = client.post("/ask/", json={"question": "hi"})
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 200 and r.json() == {"answer": "echo: hi"}
+
+
+def test_missing_key_is_400(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    gemini_client.close_gemini_client()
+    r = client.post("/ask/", json={"question": "hi"})
+    assert r.status_code == 400
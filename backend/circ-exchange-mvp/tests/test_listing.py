@@ -0,0 +1,167 @@
+import json
+import random
+
+from fastapi.testclient import TestClient
+
+from app.dataset import DEFAULT_DATASET_PATH
+from app.main import app
+from app.record_index import ListingQuery, RecordIndex, project
+from app.sample_data_new import load_fake_data
+from app.store import STORE
+
+
+client = TestClient(app)
+
+with open(DEFAULT_DATASET_PATH) as f:
+    COMPANIES = json.load(f)["companies"]
+
+
+def walk(url):
+    """All pages of a listing, following X-Next-Cursor."""
+    pages, cursor = [], None
+    while True:
+        r = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert r.status_code == 200
+        pages.append(r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages, int(r.headers["X-Total-Count"])
+
+
+def test_demo_pages_cover_the_dataset_once():
+    pages, total = walk("/companies/demo?limit=25")
+    assert total == len(COMPANIES)
+    assert [len(p) for p in pages[:-1]] == [25] * (len(pages) - 1)
+    assert [c["id"] for page in pages for c in page] == [c["id"] for c in COMPANIES]
+
+
+def test_demo_filters_are_indexed_and_case_insensitive():
+    pages, total = walk("/companies/demo?type=CONSUMER&city=houston,pasadena&limit=2")
+    got = [c["id"] for page in pages for c in page]
+    expected = [
+        c["id"] for c in COMPANIES
+        if c["type"] == "consumer" and c["location"]["city"] in ("Houston", "Pasadena")
+    ]
+    assert got == expected and total == len(expected)
+
+    category = COMPANIES[0]["waste_stream"]["category"]
+    r = client.get(f"/companies/demo?category={category}&type=producer")
+    assert r.json() and all(c["waste_stream"]["category"] == category for c in r.json())
+
+    r = client.get("/companies/demo?industry=no-such-industry")
+    assert r.json() == [] and r.headers["X-Total-Count"] == "0" and "X-Next-Cursor" not in r.headers
+
+
+def test_demo_sparse_fieldsets():
+    r = client.get("/companies/demo?limit=3&fields=id,name,location.coordinates,nope")
+    first = COMPANIES[0]
+    assert r.json()[0] == {
+        "id": first["id"], "name": first["name"],
+        "location": {"coordinates": first["location"]["coordinates"]},
+    }
+    r = client.get("/companies/demo?ids=2,1&fields=id")
+    assert r.json() == [{"id": 2}, {"id": 1}]
+    # Different projections are different representations
+    etag = r.headers["ETag"]
+    assert client.get("/companies/demo?ids=2,1&fields=id,name", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/companies/demo?ids=2,1&fields=id", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_bad_listing_parameters_are_rejected():
+    assert client.get("/companies/demo?cursor=not-a-cursor").status_code == 400
+    assert client.get("/companies/demo?fields=,").status_code == 400
+    assert client.get("/companies/demo?limit=0").status_code == 422
+    assert client.get("/companies/?limit=100000").status_code == 422
+
+
+def test_store_listings_paginate_and_filter():
+    STORE.clear_all()
+    load_fake_data()
+    pages, total = walk("/companies/?limit=50&fields=id")
+    assert total == len(COMPANIES)
+    assert [c for page in pages for c in page] == [{"id": c["id"]} for c in COMPANIES]
+
+    r = client.get("/companies/new?type=consumer&limit=5")
+    assert len(r.json()) == 5 and all(c["type"] == "consumer" for c in r.json())
+    assert r.headers["X-Total-Count"] == str(sum(c["type"] == "consumer" for c in COMPANIES))
+
+    # Re-upserting keeps the position; the index follows the new values
+    STORE.upsert_company_from_dict({**COMPANIES[0], "type": "consumer"})
+    r = client.get("/companies/new?type=consumer&limit=1&fields=id")
+    assert r.json() == [{"id": COMPANIES[0]["id"]}]
+    STORE.clear_all()
+
+
+def test_record_index_intersects_posting_lists():
+    index = RecordIndex()
+    for seq, (kind, city) in enumerate([("producer", "A"), ("consumer", "A"), ("producer", "B"), ("producer", "A")]):
+        index.put(seq, {"type": kind, "location": {"city": city}})
+    page = index.query(ListingQuery(limit=1, filters={"type": ["producer"], "city": ["a"]}))
+    assert page.seqs == [0] and page.total == 2 and page.next_cursor
+    assert project({"a": {"b": 1, "c": 2}}, ["a.b", "a.b.x"]) == {"a": {"b": 1}}
+
+
+def test_record_index_pages_equal_a_full_scan():
+    rng = random.Random(3)
+    index = RecordIndex()
+    records = {}
+    for _ in range(400):
+        seq = rng.randrange(300)
+        records[seq] = {"type": rng.choice(["producer", "consumer"]), "industry": rng.choice("abcde"),
+                        "location": {"city": rng.choice("XYZ")}}
+        index.put(seq, records[seq])
+
+    for _ in range(30):
+        filters = {"type": [rng.choice(["producer", "consumer"])], "industry": rng.sample("abcdef", 2)}
+        if rng.random() < 0.5:
+            filters["city"] = [rng.choice("xyzw")]
+        expected = [
+            seq for seq in sorted(records)
+            if records[seq]["type"] in filters["type"] and records[seq]["industry"] in filters["industry"]
+            and ("city" not in filters or records[seq]["location"]["city"].casefold() in filters["city"])
+        ]
+        seen, after = [], None
+        while True:
+            page = index.query(ListingQuery(limit=7, after=after, filters=filters))
+            assert page.total == len(expected)
+            seen += page.seqs
+            if not page.next_cursor:
+                break
+            after = page.seqs[-1]
+        assert seen == expected
+
+
+def test_demo_facets_count_distinct_values():
+    r = client.get("/companies/demo/facets?fields=type,location,material")
+    facets = r.json()
+    assert list(facets) == ["type", "location", "material"]
+    assert {f["value"]: f["count"] for f in facets["type"]} == {
+        kind: sum(c["type"] == kind for c in COMPANIES) for kind in ("producer", "consumer")
+    }
+    houston = next(f for f in facets["location"] if f["value"] == "Houston, TX")
+    assert houston["count"] == sum(c["location"]["city"] == "Houston" for c in COMPANIES)
+    materials = {c[key]["material"] for c in COMPANIES for key in ("waste_stream", "material_needs") if key in c}
+    assert [f["value"] for f in facets["material"]] == sorted(materials, key=str.casefold)
+
+    etag = r.headers["ETag"]
+    assert client.get("/companies/demo/facets?fields=type,location,material",
+                      headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/companies/demo/facets?fields=nope").status_code == 400
+
+
+def test_store_facets_follow_upserts():
+    STORE.clear_all()
+    assert client.get("/companies/facets?fields=city").json() == {"city": []}
+    load_fake_data()
+    r = client.get("/companies/facets?fields=city")
+    etag = r.headers["ETag"]
+    before = {f["value"]: f["count"] for f in r.json()["city"]}
+
+    moved = {**COMPANIES[0], "location": {**COMPANIES[0]["location"], "city": "Nowhere"}}
+    STORE.upsert_company_from_dict(moved)
+    r = client.get("/companies/facets?fields=city", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    after = {f["value"]: f["count"] for f in r.json()["city"]}
+    old_city = COMPANIES[0]["location"]["city"]
+    assert after["Nowhere"] == 1 and after.get(old_city, 0) == before[old_city] - 1
+    STORE.clear_all()
@@ -0,0 +1,109 @@
+import time
+
+from app.models import Company
+from app.services.gemini_client import GeminiClient
+from app.services.llm_cache import AnalysisCache, analysis_cache_key
+
+
+def _company(cid, comp, **kwargs):
+    return Company(
+        id=cid, name=cid, latitude=29.7, longitude=-95.3,
+        waste_streams=[{"name": "w", "composition": comp}],
+        needs=[{"name": "n", "composition": comp}],
+        **kwargs,
+    )
+
+
+class _Reply:
+    text = ('{"compatibility_score": 80, "chemical_notes": "c", "co2_reduction_tons": 1.0, '
+            '"cost_savings_usd": 2.0, "regulatory_notes": "r"}')
+
+
+class _Model:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        return _Reply()
+
+
+def _client(cache, monkeypatch):
+    monkeypatch.setattr("app.services.gemini_client.ANALYSIS_CACHE", cache)
+    client = GeminiClient.__new__(GeminiClient)
+    client.model_name = "test-model"
+    client.model = _Model()
+    return client
+
+
+def test_key_is_canonical():
+    a = _company("a", {"CaO": 50, "SiO2": 50})
+    b = _company("b", {"cao": 0.5, "sio2": 0.5})
+    # Percentages and proportions normalize to the same prompt inputs
+    assert analysis_cache_key("m", a, b) == analysis_cache_key("m", _company("a", {"CaO": 0.5, "SiO2": 0.5}), b)
+    assert analysis_cache_key("m", a, b) != analysis_cache_key("m2", a, b)
+    assert analysis_cache_key("m", a, b) != analysis_cache_key("m", _company("a", {"CaO": 0.6, "SiO2": 0.4}), b)
+
+
+def test_client_hits_cache_and_invalidates(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(path=path)
+    client = _client(cache, monkeypatch)
+    a, b = _company("a", {"x": 1.0}), _company("b", {"x": 1.0})
+
+    first = client.analyze_waste_compatibility(a, b)
+    second = client.analyze_waste_compatibility(a, b)
+    assert first == second and client.model.calls == 1
+    assert cache.stats()["memory_hits"] == 1
+
+    # A second process sharing the file sees the entry on disk
+    other = AnalysisCache(path=path, epoch_check_seconds=0.05)
+    assert other.get(analysis_cache_key("test-model", a, b)) == first.model_dump()
+    assert other.stats()["disk_hits"] == 1
+
+    # Invalidation in one worker drops the LRU copy in the other at its next epoch check
+    assert cache.invalidate_company("b") == 1
+    time.sleep(0.06)
+    assert other.get(analysis_cache_key("test-model", a, b)) is None
+    client.analyze_waste_compatibility(a, b)
+    assert client.model.calls == 2
+
+
+def test_unparseable_answers_are_not_cached(tmp_path, monkeypatch):
+    cache = AnalysisCache(path=str(tmp_path / "c.sqlite3"))
+    client = _client(cache, monkeypatch)
+    client.model.generate_content = lambda prompt: type("R", (), {"text": "no json"})()
+    a, b = _company("a", {"x": 1.0}), _company("b", {"x": 1.0})
+    assert client.analyze_waste_compatibility(a, b).compatibility_score == 50
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_and_size_bound(tmp_path):
+    cache = AnalysisCache(path=str(tmp_path / "c.sqlite3"), ttl_seconds=0.05, max_entries=2, memory_entries=1)
+    for i in range(3):
+        cache.put(f"k{i}", "a", "b", {"i": i})
+    assert cache.stats()["entries"] == 2
+    assert cache.get("k0") is None
+    assert cache.get("k2") == {"i": 2}
+    time.sleep(0.06)
+    assert cache.get("k2") is None
+
+
+def test_lookups_and_writes_avoid_per_call_maintenance(tmp_path):
+    cache = AnalysisCache(path=str(tmp_path / "c.sqlite3"), max_entries=40, memory_entries=100)
+    statements = []
+    cache.put("k", "a", "b", {"v": 1})
+    cache._db().set_trace_callback(statements.append)
+
+    # Memory hits do not read the epoch (it is cached and polled at most once a second)
+    for _ in range(5):
+        assert cache.get("k") == {"v": 1}
+    assert statements == []
+
+    # Eviction runs once per max_entries // 20 writes, and the table stays within the cap
+    for i in range(60):
+        cache.put(f"k{i}", "a", "b", {"v": i})
+        assert cache.stats()["entries"] <= 40
+    evictions = [s for s in statements if s.startswith("DELETE FROM analysis_cache WHERE key IN")]
+    assert len(evictions) == 30
+    assert cache.get("k59") == {"v": 59}
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.llm_executor import LLMExecutor
+
+
+def test_run_bounds_concurrency_and_runs_in_parallel():
+    executor = LLMExecutor(max_concurrency=3)
+    lock = threading.Lock()
+    active, peak = 0, 0
+
+    def call(i):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.1)
+        with lock:
+            active -= 1
+        return i
+
+    async def main():
+        return await asyncio.gather(*(executor.run(call, i) for i in range(9)))
+
+    start = time.perf_counter()
+    assert asyncio.run(main()) == list(range(9))
+    elapsed = time.perf_counter() - start
+    assert peak == 3
+    # Three waves of 0.1s rather than nine sequential calls
+    assert elapsed < 0.6
+    executor.shutdown()
+
+
+def test_event_loop_stays_responsive():
+    executor = LLMExecutor(max_concurrency=1)
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await asyncio.gather(executor.run(time.sleep, 0.2), ticker())
+
+    asyncio.run(main())
+    # The blocking call ran off-loop, so the ticker kept its cadence
+    assert ticks[-1] - ticks[0] < 0.19
+    executor.shutdown()
+
+
+def test_run_propagates_errors():
+    executor = LLMExecutor(max_concurrency=2)
+
+    def boom():
+        raise RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(executor.run(boom))
+    executor.shutdown()
@@ -0,0 +1,137 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient, gemini_client_dependency
+from app.services.llm_cache import AnalysisCache
+from app.services.llm_metrics import LLM_METRICS, LLMMetrics
+from app.services.llm_provider import FakeProvider, TextResponse
+from app.services.resilience import LLMGuard
+
+
+client = TestClient(app)
+
+COMPANY_A = {"id": "a", "name": "A", "latitude": 29.7, "longitude": -95.3,
+             "waste_streams": [{"name": "slag", "composition": {"CaO": 1.0}}]}
+COMPANY_B = {"id": "b", "name": "B", "latitude": 29.8, "longitude": -95.3,
+             "needs": [{"name": "lime", "composition": {"CaO": 1.0}}]}
+
+
+class Usage:
+    prompt_token_count = 1000
+    candidates_token_count = 500
+
+
+class MeteredProvider(FakeProvider):
+    """Fake answers that carry usage metadata like Gemini's."""
+
+    def generate_content(self, prompt, stream=False):
+        response = super().generate_content(prompt, stream)
+        if not stream:
+            response.usage_metadata = Usage()
+        return response
+
+
+def _use(monkeypatch, tmp_path, provider):
+    LLM_METRICS.reset()
+    monkeypatch.setattr(gemini_client, "ANALYSIS_CACHE", AnalysisCache(path=str(tmp_path / "c.db")))
+    monkeypatch.setattr(gemini_client, "LLM_GUARD", LLMGuard(requests_per_minute=6000, max_retries=0))
+    fake = GeminiClient(provider)
+    app.dependency_overrides[gemini_client_dependency] = lambda: fake
+    return fake
+
+
+def _sample(text, line_prefix):
+    return [line for line in text.splitlines() if line.startswith(line_prefix)]
+
+
+def test_analyze_calls_tokens_cost_and_cache_per_endpoint(monkeypatch, tmp_path):
+    _use(monkeypatch, tmp_path, MeteredProvider())
+    try:
+        for _ in range(2):
+            assert client.post("/analyze/", json={"company_a": COMPANY_A, "company_b": COMPANY_B}).status_code == 200
+    finally:
+        app.dependency_overrides.clear()
+
+    text = client.get("/metrics").text
+    labels = 'endpoint="POST /analyze/",operation="analyze"'
+    assert f'llm_requests_total{{{labels},outcome="ok"}} 1' in text
+    assert f"llm_prompt_tokens_total{{{labels}}} 1000" in text
+    assert f"llm_response_tokens_total{{{labels}}} 500" in text
+    assert f'llm_cache_lookups_total{{{labels},result="hit"}} 1' in text
+    assert 'llm_request_duration_seconds_count{operation="analyze"} 1' in text
+    assert 'llm_prompt_tokens_bucket{operation="analyze",le="1000"} 1' in text
+
+    usage = LLM_METRICS.rollups()["POST /analyze/"]
+    # 1000 prompt tokens at $0.10/M + 500 response tokens at $0.40/M
+    assert usage["calls"] == 1 and usage["cost_usd"] == 0.0003
+    assert usage["cache_hits"] == 1 and usage["cache_misses"] == 1
+
+
+def test_parse_failures_and_fallbacks_are_counted(monkeypatch, tmp_path):
+    class Garbled(FakeProvider):
+        def generate_content(self, prompt, stream=False):
+            return TextResponse("no json here")
+
+    _use(monkeypatch, tmp_path, Garbled())
+    try:
+        r = client.post("/analyze/", json={"company_a": COMPANY_A, "company_b": COMPANY_B})
+        assert r.json()["chemical_notes"] == "Unable to parse detailed analysis"
+    finally:
+        app.dependency_overrides.clear()
+
+    _use(monkeypatch, tmp_path, FakeProvider(error_rate=1.0))
+    try:
+        assert client.post("/ask/", json={"question": "hi"}).json()["answer"].startswith("I'm sorry")
+        r = client.post("/analyze/", json={"company_a": COMPANY_A, "company_b": COMPANY_B})
+        assert r.headers["X-Scored-By"] == "local"
+    finally:
+        app.dependency_overrides.clear()
+
+    text = client.get("/metrics").text
+    assert 'llm_requests_total{endpoint="POST /ask/",operation="ask",outcome="unavailable"} 1' in text
+    assert 'llm_fallback_responses_total{endpoint="POST /ask/",kind="apology"} 1' in text
+    assert 'llm_fallback_responses_total{endpoint="POST /analyze/",kind="local_score"} 1' in text
+    assert LLM_METRICS.rollups()["POST /ask/"]["failed_calls"] == 1
+
+
+def test_streamed_answers_are_metered(monkeypatch, tmp_path):
+    _use(monkeypatch, tmp_path, FakeProvider())
+    try:
+        r = client.post("/ask/stream", json={"question": "How do I reuse slag?"})
+        assert "event: done" in r.text
+    finally:
+        app.dependency_overrides.clear()
+    text = client.get("/metrics").text
+    assert 'llm_requests_total{endpoint="POST /ask/stream",operation="ask_stream",outcome="ok"} 1' in text
+    assert 'llm_estimated_token_calls_total{operation="ask_stream"} 1' in text
+
+
+def test_stream_failing_midway_is_metered_as_error(monkeypatch, tmp_path):
+    class Interrupted(FakeProvider):
+        def generate_content(self, prompt, stream=False):
+            def chunks():
+                yield TextResponse("Partial ")
+                raise RuntimeError("stream reset")
+            return chunks()
+
+    _use(monkeypatch, tmp_path, Interrupted())
+    try:
+        r = client.post("/ask/stream", json={"question": "How do I reuse slag?"})
+        assert "event: error" in r.text
+    finally:
+        app.dependency_overrides.clear()
+    text = client.get("/metrics").text
+    assert 'llm_requests_total{endpoint="POST /ask/stream",operation="ask_stream",outcome="error"} 1' in text
+    assert 'outcome="ok"' not in text
+
+
+def test_latency_histogram_is_cumulative():
+    metrics = LLMMetrics()
+    for seconds in (0.01, 0.2, 0.2, 100.0):
+        metrics.record_call("ask", seconds)
+    text = metrics.render()
+    assert 'llm_request_duration_seconds_bucket{operation="ask",le="0.05"} 1' in text
+    assert 'llm_request_duration_seconds_bucket{operation="ask",le="0.25"} 3' in text
+    assert 'llm_request_duration_seconds_bucket{operation="ask",le="+Inf"} 4' in text
+    assert metrics.rollups()["other"]["calls"] == 4
@@ -0,0 +1,160 @@
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as google_exceptions
+
+from app.main import app
+from app.models import Company
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient
+from app.services.llm_cache import AnalysisCache
+from app.services.llm_provider import FakeProvider, fake_analysis, provider_from_env
+from app.services.resilience import LLMGuard
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def _company(cid, wastes=(), needs=()):
+    return Company(
+        id=cid, name=cid.upper(), latitude=29.7, longitude=-95.3,
+        waste_streams=[{"name": "w", "composition": c} for c in wastes],
+        needs=[{"name": "n", "composition": c} for c in needs],
+    )
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    clock = FakeClock()
+    monkeypatch.setattr(gemini_client, "LLM_GUARD", LLMGuard(
+        requests_per_minute=6000, max_retries=1, clock=clock, sleep=clock.sleep,
+    ))
+    monkeypatch.setattr(gemini_client, "ANALYSIS_CACHE", AnalysisCache(path=str(tmp_path / "c.db")))
+    return clock
+
+
+def test_fake_answers_are_deterministic_and_batch_consistent(offline):
+    client = GeminiClient(FakeProvider())
+    producer = _company("slag", wastes=[{"CaO": 1.0}])
+    consumers = [_company(f"c{i}", needs=[{"CaO": 1.0}]) for i in range(3)]
+
+    single = client.analyze_waste_compatibility(producer, consumers[0])
+    assert single.model_dump() == fake_analysis("SLAG", "C0")
+
+    gemini_client.ANALYSIS_CACHE.clear()
+    batched = client.analyze_batch([(producer, c) for c in consumers], batch_size=3)
+    assert client.model.calls == 2  # one single prompt, one batched prompt
+    assert batched[0] == single
+    assert [b.compatibility_score for b in batched] == [
+        fake_analysis("SLAG", c.name)["compatibility_score"] for c in consumers
+    ]
+
+
+def test_fake_errors_go_through_retries(offline):
+    client = GeminiClient(FakeProvider(error_rate=1.0))
+    result = client.analyze_batch([(_company("a", wastes=[{"X": 1.0}]), _company("b", needs=[{"X": 1.0}]))])
+    assert result == [None]
+    assert client.model.errors == 2  # first attempt + one retry
+    assert gemini_client.LLM_GUARD.stats()["failures"] == 1
+
+
+def test_out_of_range_answer_falls_back_to_default(offline, monkeypatch):
+    def out_of_range(producer, consumer):
+        return dict(fake_analysis(producer, consumer), compatibility_score=105)
+
+    monkeypatch.setattr("app.services.llm_provider.fake_analysis", out_of_range)
+    client = GeminiClient(FakeProvider())
+    producer = _company("slag", wastes=[{"CaO": 1.0}])
+    consumers = [_company(f"c{i}", needs=[{"CaO": 1.0}]) for i in range(3)]
+
+    single = client.analyze_waste_compatibility(producer, consumers[0])
+    assert single.compatibility_score == 50
+    assert gemini_client.ANALYSIS_CACHE.stats()["entries"] == 0
+
+    batched = client.analyze_batch([(producer, c) for c in consumers], batch_size=3)
+    assert [b.compatibility_score for b in batched] == [50, 50, 50]
+    assert gemini_client.ANALYSIS_CACHE.stats()["entries"] == 0
+
+
+def test_batch_keeps_going_when_one_pair_fails(offline, monkeypatch):
+    client = GeminiClient(FakeProvider())
+    producer = _company("slag", wastes=[{"CaO": 1.0}])
+    consumers = [_company(f"c{i}", needs=[{"CaO": 1.0}]) for i in range(3)]
+    monkeypatch.setattr(client, "_analyze_chunk", lambda pairs: {})
+    single = client._analyze_uncached
+
+    def flaky(key, company_a, company_b):
+        if company_b.id == "c1":
+            raise RuntimeError("boom")
+        return single(key, company_a, company_b)
+
+    monkeypatch.setattr(client, "_analyze_uncached", flaky)
+    batched = client.analyze_batch([(producer, c) for c in consumers], batch_size=3)
+    assert batched[1] is None
+    assert [b.compatibility_score for b in (batched[0], batched[2])] == [
+        fake_analysis("SLAG", c.name)["compatibility_score"] for c in (consumers[0], consumers[2])
+    ]
+
+
+def test_fake_quota_throttles_per_minute():
+    clock = FakeClock()
+    provider = FakeProvider(requests_per_minute=2, clock=clock, sleep=clock.sleep)
+    provider.generate_content("q1")
+    provider.generate_content("q2")
+    with pytest.raises(google_exceptions.TooManyRequests):
+        provider.generate_content("q3")
+    clock.now += 60
+    assert provider.generate_content("q3").text
+    assert provider.throttled == 1
+
+
+@pytest.mark.parametrize("latency", ["constant", "uniform", "exponential", "lognormal"])
+def test_fake_latency_distributions(latency):
+    clock = FakeClock()
+    provider = FakeProvider(latency=latency, latency_ms=100, latency_spread=0.5, seed=1,
+                            clock=clock, sleep=clock.sleep)
+    for i in range(400):
+        provider.generate_content(f"q{i}")
+    median = sorted(clock.slept)[200]
+    assert 0.05 < median < 0.15
+    if latency == "constant":
+        assert set(clock.slept) == {0.1}
+    # Same seed, same draws
+    again = FakeClock()
+    replay = FakeProvider(latency=latency, latency_ms=100, latency_spread=0.5, seed=1,
+                          clock=again, sleep=again.sleep)
+    for i in range(400):
+        replay.generate_content(f"q{i}")
+    assert again.slept == clock.slept
+
+
+def test_provider_selected_by_config(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_ERROR_RATE", "0.25")
+    provider = provider_from_env()
+    assert isinstance(provider, FakeProvider) and provider.error_rate == 0.25
+
+    monkeypatch.delenv("FAKE_LLM_ERROR_RATE")
+    gemini_client.close_gemini_client()
+    try:
+        client = TestClient(app)
+        r = client.post("/ask/", json={"question": "How do I reuse slag?"})
+        assert r.status_code == 200 and r.json()["answer"].startswith("Simulated answer")
+        r = client.post("/ask/stream", json={"question": "How do I reuse slag?"})
+        assert "event: done" in r.text
+    finally:
+        gemini_client.close_gemini_client()
+
+    monkeypatch.setenv("LLM_PROVIDER", "other")
+    with pytest.raises(ValueError):
+        provider_from_env()
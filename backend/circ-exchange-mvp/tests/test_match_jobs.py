@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app import match_jobs
+from app.main import app
+from app.match_jobs import MatchJobManager
+from app.models import AnalyzeResponse, Company
+from app.routes import companies as companies_routes
+from app.services.gemini_client import GeminiClient
+from app.store import STORE
+
+
+
+client = TestClient(app)
+
+
+def _company(cid, lat, lon, wastes=(), needs=()):
+    return Company(
+        id=cid, name=cid.upper(), latitude=lat, longitude=lon,
+        waste_streams=[{"name": f"{cid}-w{i}", "composition": c} for i, c in enumerate(wastes)],
+        needs=[{"name": f"{cid}-n{i}", "composition": c} for i, c in enumerate(needs)],
+    )
+
+
+def _seed():
+    STORE.clear_all()
+    STORE.upsert_company(_company("slag", 29.76, -95.37, wastes=[{"CaO": 0.5, "SiO2": 0.5}]))
+    STORE.upsert_company(_company("cement", 29.80, -95.30, needs=[{"CaO": 0.6, "SiO2": 0.4}]))
+    STORE.upsert_company(_company("far", 40.7, -74.0, needs=[{"CaO": 0.6, "SiO2": 0.4}]))
+    STORE.upsert_company(_company("plastic", 29.7, -95.4, wastes=[{"PE": 1.0}]))
+
+
+class FakeGemini(GeminiClient):
+    calls = []
+
+    def __init__(self):
+        self.model_name = "fake"
+
+    def analyze_batch(self, pairs, batch_size=8):
+        FakeGemini.calls.append([(a.id, b.id) for a, b in pairs])
+        return [
+            AnalyzeResponse(
+                compatibility_score=90 - len(a.id), chemical_notes="ok", co2_reduction_tons=1.0,
+                cost_savings_usd=2.0, regulatory_notes="none",
+            )
+            for a, b in pairs
+        ]
+
+
+def _wait(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.status(job_id)
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_match_job_route_progress_and_results(monkeypatch):
+    _seed()
+    FakeGemini.calls = []
+    monkeypatch.setattr(companies_routes, "get_gemini_client", FakeGemini)
+    monkeypatch.setattr("app.match_jobs.get_gemini_client", FakeGemini)
+
+    r = client.post("/companies/matches/jobs?shortlist=2&batch_size=2")
+    assert r.status_code == 202
+    job_id = r.json()["id"]
+
+    job = _wait(companies_routes.MATCH_JOBS, job_id)
+    assert job["status"] == "completed" and job["done"] == job["total"] == 4 and job["progress"] == 1.0
+    # Only the two best local pairs went to the LLM, in one batch
+    assert FakeGemini.calls == [[("slag", "cement"), ("slag", "far")]]
+
+    r = client.get(f"/jobs/{job_id}?top=3")
+    assert [m["scored_by"] for m in r.json()["top"]] == ["llm", "llm", "local"]
+
+    r = client.get(f"/jobs/{job_id}/results")
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in r.text.splitlines()]
+    scores = [m["compatibility_score"] for m in results]
+    assert len(results) == 4 and scores == sorted(scores, reverse=True)
+
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.get("/jobs/nope/results").status_code == 404
+
+
+def test_match_job_resumes_from_checkpoint(tmp_path, monkeypatch):
+    _seed()
+    FakeGemini.calls = []
+    monkeypatch.setattr("app.match_jobs.get_gemini_client", FakeGemini)
+    path = str(tmp_path / "jobs.sqlite3")
+    companies = STORE.list_companies()
+
+    # No workers: the job is only checkpointed; score one chunk by hand, then "crash"
+    first = MatchJobManager(path, workers=0)
+    job_id = first.create(companies, shortlist=None, batch_size=1)
+    first._prepare(job_id)
+    first._run_chunk(job_id, [0])
+    assert first.status(job_id)["done"] == 1
+    first.shutdown()
+
+    # A new process rebuilds the pairs from the checkpoint and finishes the rest
+    second = MatchJobManager(path, workers=2)
+    assert second.resume() == 1
+    job = _wait(second, job_id)
+    second.shutdown()
+    assert job["status"] == "completed" and job["done"] == job["total"] == 4
+    scored = sorted(pair for call in FakeGemini.calls for pair in call)
+    assert scored == sorted([("slag", "cement"), ("slag", "far"), ("plastic", "cement"), ("plastic", "far")])
+    assert len(FakeGemini.calls) == 4  # the checkpointed pair was not analyzed again
+
+
+def test_cancelled_job_stops():
+    _seed()
+    manager = MatchJobManager(":memory:", workers=0)
+    job_id = manager.create(STORE.list_companies(), shortlist=0, batch_size=8)
+    manager._prepare(job_id)
+    assert manager.cancel(job_id)
+    manager._run_chunk(job_id, [0, 1, 2, 3])
+    job = manager.status(job_id)
+    assert job["status"] == "cancelled" and job["done"] == 0
+    assert not manager.cancel(job_id)
+
+
+def test_create_returns_before_ranking(monkeypatch):
+    _seed()
+    release = threading.Event()
+    rank = match_jobs.rank_company_pairs
+
+    def slow_rank(companies):
+        release.wait(5.0)
+        return rank(companies)
+
+    monkeypatch.setattr(match_jobs, "rank_company_pairs", slow_rank)
+    manager = MatchJobManager(":memory:", workers=1)
+    try:
+        job_id = manager.create(STORE.list_companies(), shortlist=0, batch_size=8)
+        job = manager.status(job_id)
+        assert job["status"] == "queued" and job["total"] == 0 and job["progress"] == 0.0
+        release.set()
+        job = _wait(manager, job_id)
+        assert job["status"] == "completed" and job["done"] == job["total"] == 4
+    finally:
+        release.set()
+        manager.shutdown()
+
+
+def test_results_are_read_in_pages(monkeypatch):
+    _seed()
+    monkeypatch.setattr(match_jobs, "_RESULTS_PAGE", 3)
+    manager = MatchJobManager(":memory:", workers=0)
+    companies = STORE.list_companies() + [
+        _company(f"c{i}", 29.7 + i / 100, -95.3, needs=[{"CaO": 0.5, "SiO2": 0.5}]) for i in range(4)
+    ]
+    job_id = manager.create(companies, shortlist=0, batch_size=8)
+    manager._prepare(job_id)
+    total = manager.status(job_id)["total"]
+    manager._run_chunk(job_id, list(range(total)))
+
+    with manager._lock:
+        expected = [json.loads(r) for (r,) in manager._db().execute(
+            "SELECT result FROM job_results WHERE job_id = ? "
+            "ORDER BY compatibility_score DESC, pair_index", (job_id,)
+        )]
+    assert total > 6
+    assert list(manager.results(job_id)) == expected
+    assert list(manager.results(job_id, limit=5)) == expected[:5]
+    assert list(manager.results(job_id, limit=6)) == expected[:6]
+
+
+def test_job_interrupted_before_ranking_fails_on_resume(tmp_path):
+    _seed()
+    path = str(tmp_path / "jobs.sqlite3")
+    first = MatchJobManager(path, workers=0)
+    job_id = first.create(STORE.list_companies(), shortlist=0, batch_size=8)
+    first.shutdown()
+
+    second = MatchJobManager(path, workers=0)
+    assert second.resume() == 0
+    job = second.status(job_id)
+    second.shutdown()
+    assert job["status"] == "failed" and "create the job again" in job["error"]
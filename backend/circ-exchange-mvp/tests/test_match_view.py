@@ -0,0 +1,58 @@
+import random
+
+from app.match_view import rank_candidates
+from app.models import Facility, Material
+from app.store import InMemoryStore
+
+
+COMPONENTS = ["CaO", "SiO2", "Fe2O3", "Al2O3", "MgO", "Water"]
+
+
+def _facility(rng: random.Random, facility_id: str) -> Facility:
+    def material(name):
+        keys = rng.sample(COMPONENTS, rng.randint(1, 3))
+        return Material(name=name, composition={k: rng.uniform(0.1, 1.0) for k in keys})
+
+    return Facility(
+        id=facility_id,
+        name=facility_id,
+        latitude=rng.uniform(29.0, 33.0),
+        longitude=rng.uniform(-98.0, -94.0),
+        waste_streams=[material("w") for _ in range(rng.randint(0, 2))],
+        needs=[material("n") for _ in range(rng.randint(0, 2))],
+    )
+
+
+def _recompute(store: InMemoryStore, source_id: str):
+    view = store.match_view
+    source = store.get_facility(source_id)
+    nearby = store.facilities_within(source.latitude, source.longitude,
+                                     view.radius_km * view.radius_factor)
+    return rank_candidates(store, source_id, nearby, view.radius_km, view.k)
+
+
+def test_incremental_view_matches_recompute():
+    rng = random.Random(11)
+    store = InMemoryStore()
+    store.match_view.k = 5  # small K so truncation and staleness are exercised
+    store.match_view.radius_km = 150.0
+    ids = [f"f{i}" for i in range(60)]
+    for facility_id in ids:
+        store.upsert_facility(_facility(rng, facility_id))
+    for facility_id in ids:
+        store.match_view.lookup(facility_id, 5)
+
+    saw_stale = False
+    for _ in range(80):
+        store.upsert_facility(_facility(rng, rng.choice(ids)))
+        status = store.match_view.status()
+        saw_stale = saw_stale or status["stale"] > 0
+        for facility_id in ids:
+            if store.match_view.is_fresh(facility_id):
+                # Fresh lists must equal a from-scratch ranking without recomputation
+                assert store.match_view._entries[facility_id] == _recompute(store, facility_id)
+        for facility_id in rng.sample(ids, 10):
+            assert store.match_view.lookup(facility_id, 5) == _recompute(store, facility_id)
+
+    assert saw_stale
+    assert store.match_view.version > len(ids)
@@ -38,3 +38,67 @@ def test_score_match_clipping():
     assert score_match(1.0, 0.0, 500.0) == 1.0
     # sim=0, distance large -> score clipped to 0
     assert score_match(0.0, 10000.0, 500.0) == 0.0
+
+
+def test_normalized_composition_matches_weighted_jaccard():
+    from app.composition import NormalizedComposition
+
+    pairs = [
+        ({"x": 60, "y": 40}, {"x": 0.6, "y": 0.4}),
+        ({"x": 0.7, "y": 0.3}, {"X": 0.4, "z": 0.6}),
+        ({"A": -5, "B": 50, "C": 50}, {"b": 1.0}),
+        ({}, {"x": 1.0}),
+    ]
+    for a, b in pairs:
+        na, nb = NormalizedComposition.from_mapping(a), NormalizedComposition.from_mapping(b)
+        assert math.isclose(na.weighted_jaccard(nb), weighted_jaccard(a, b), rel_tol=1e-12)
+
+
+def test_material_normalizes_once():
+    import pytest
+    from app.models import Material
+
+    m = Material(name="slag", composition={"CaO": 45, "SiO2": 55})
+    norm = m.normalized
+    assert m.normalized is norm
+    assert dict(norm.items()) == {"CaO": 0.45, "SiO2": 0.55}
+    with pytest.raises(AttributeError):
+        norm.total = 2.0
+    with pytest.raises(ValueError):
+        norm.values[0] = 1.0
+
+    # Replacing the composition invalidates the cached representation
+    copy = m.model_copy(update={"composition": {"CaO": 1.0}})
+    assert dict(copy.normalized.items()) == {"CaO": 1.0}
+    assert m.normalized is norm
+
+
+def test_payloads_do_not_grow_the_vocabulary():
+    from app.composition import VOCAB, NormalizedComposition
+    from app.engine import MatchEngine
+    from app.models import Facility, Material
+
+    stored = NormalizedComposition.from_mapping({"CaO": 1.0}, intern=True)
+    size = len(VOCAB)
+    payload = Material(name="q", composition={"CaO": 0.5, "Unobtainium-7": 0.5})
+    norm = payload.normalized
+    assert len(VOCAB) == size and VOCAB.lookup("unobtainium-7") is None
+    assert {k.lower(): v for k, v in norm.items()} == {"cao": 0.5, "unobtainium-7": 0.5}
+    assert [name for _, name, _ in norm.extra] == ["Unobtainium-7"]
+
+    # Unknown components never overlap, but still weigh in the union
+    assert math.isclose(norm.weighted_jaccard(stored), weighted_jaccard(payload.composition, {"cao": 1.0}))
+    # Two payloads still overlap on a shared unknown name, even one interned in between
+    other = NormalizedComposition.from_mapping({"unobtainium-7": 1.0})
+    VOCAB.intern("unobtainium-7")
+    late = NormalizedComposition.from_mapping({"unobtainium-7": 1.0})
+    expected = weighted_jaccard(payload.composition, {"unobtainium-7": 1.0})
+    for comp in (other, late):
+        assert math.isclose(norm.weighted_jaccard(comp), expected)
+
+    # Storing a record interns its names
+    facility = Facility(id="v", name="V", latitude=0, longitude=0,
+                        needs=[Material(name="n", composition={"Vibranium": 1.0})])
+    assert facility.needs[0].normalized.extra
+    MatchEngine().upsert(facility)
+    assert VOCAB.lookup("vibranium") is not None and not facility.needs[0].normalized.extra
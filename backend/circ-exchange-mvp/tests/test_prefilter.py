@@ -0,0 +1,106 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import AnalyzeResponse, Company
+from app.prefilter import rank_company_pairs
+from app.routes import companies as companies_routes
+from app.services.gemini_client import GeminiClient
+from app.store import STORE, as_company
+
+
+client = TestClient(app)
+
+
+def _company(cid, lat, lon, wastes=(), needs=(), **kwargs):
+    return Company(
+        id=cid, name=cid.upper(), latitude=lat, longitude=lon,
+        waste_streams=[{"name": f"{cid}-w{i}", "composition": c} for i, c in enumerate(wastes)],
+        needs=[{"name": f"{cid}-n{i}", "composition": c} for i, c in enumerate(needs)],
+        **kwargs,
+    )
+
+
+def _seed():
+    STORE.clear_all()
+    STORE.upsert_company(_company("slag", 29.76, -95.37, wastes=[{"CaO": 0.5, "SiO2": 0.5}], quantity=100))
+    STORE.upsert_company(_company("cement", 29.80, -95.30, needs=[{"CaO": 0.6, "SiO2": 0.4}], quantity=80))
+    STORE.upsert_company(_company("far", 40.7, -74.0, needs=[{"CaO": 0.6, "SiO2": 0.4}], quantity=80))
+    STORE.upsert_company(_company("plastic", 29.7, -95.4, wastes=[{"PE": 1.0}]))
+
+
+def test_rank_company_pairs_orients_and_orders():
+    _seed()
+    pairs = rank_company_pairs(STORE.list_companies())
+    # Only waste -> need directions survive; the two producers never pair up
+    assert {(p.producer.id, p.consumer.id) for p in pairs} == {
+        ("slag", "cement"), ("slag", "far"), ("plastic", "cement"), ("plastic", "far"),
+    }
+    assert [p.score for p in pairs] == sorted((p.score for p in pairs), reverse=True)
+    assert (pairs[0].producer.id, pairs[0].consumer.id) == ("slag", "cement")
+
+
+def test_as_company_from_fake_data_dict():
+    company = as_company({
+        "id": 3, "name": "Refinery", "type": "producer",
+        "location": {"coordinates": {"lat": 29.7, "lng": -95.2}},
+        "waste_stream": {
+            "material": "Sulfur", "quantity_tons_year": 500,
+            "composition": {"S": 99, "Moisture": "< 1%"},
+            "current_disposal": {"cost_per_ton": 40},
+        },
+    })
+    assert company.id == "3" and company.quantity == 500 and company.disposal_cost == 40
+    assert company.waste_streams[0].composition == {"S": 99.0}
+    assert company.needs == []
+
+
+def test_matches_only_sends_shortlist_to_llm(monkeypatch):
+    _seed()
+    calls = []
+
+    class FakeGemini(GeminiClient):
+        def __init__(self):
+            self.model_name = "fake"
+
+        def analyze_batch(self, pairs, batch_size=8):
+            calls.extend((a.id, b.id) for a, b in pairs)
+            return [
+                AnalyzeResponse(
+                    compatibility_score=99, chemical_notes="ok", co2_reduction_tons=1.0,
+                    cost_savings_usd=2.0, regulatory_notes="none",
+                )
+                for _ in pairs
+            ]
+
+    monkeypatch.setattr(companies_routes, "get_gemini_client", FakeGemini)
+    r = client.get("/companies/matches?shortlist=1&limit=10")
+    assert r.status_code == 200
+    data = r.json()
+    assert calls == [("slag", "cement")]
+    assert [m["scored_by"] for m in data] == ["llm", "local", "local", "local"]
+    assert data[0]["compatibility_score"] == 99
+
+    # No shortlist: no client is needed at all
+    r = client.get("/companies/matches?shortlist=0&limit=2")
+    assert r.status_code == 200
+    assert [m["scored_by"] for m in r.json()] == ["local", "local"]
+
+
+def test_matches_rank_pairs_off_the_event_loop(monkeypatch):
+    _seed()
+    loops = []
+
+    def ranking(companies):
+        try:
+            loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            loops.append(None)
+        return rank_company_pairs(companies)
+
+    monkeypatch.setattr(companies_routes, "rank_company_pairs", ranking)
+    r = client.get("/companies/matches?shortlist=0&limit=2")
+    assert r.status_code == 200 and len(r.json()) == 2
+    # Called from a worker thread, not a coroutine on the server's loop
+    assert loops == [None]
@@ -0,0 +1,120 @@
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as google_exceptions
+
+from app.main import app
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient, gemini_client_dependency
+from app.services.llm_cache import AnalysisCache
+from app.services.resilience import (
+    CircuitBreaker, CircuitOpenError, LLMGuard, LLMUnavailableError, TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_paces_to_quota():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=60, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        assert bucket.acquire() == 0.0  # the burst allowance
+    for _ in range(10):
+        bucket.acquire()
+    # Beyond the burst, one request per second
+    assert clock.now == pytest.approx(10.0)
+
+
+def test_retries_with_backoff_then_succeeds():
+    clock = FakeClock()
+    guard = LLMGuard(requests_per_minute=6000, max_retries=3, clock=clock, sleep=clock.sleep)
+    attempts = []
+
+    def flaky():
+        attempts.append(clock.now)
+        if len(attempts) < 3:
+            raise google_exceptions.ResourceExhausted("429")
+        return "ok"
+
+    assert guard.call(flaky) == "ok"
+    assert len(attempts) == 3 and guard.retries == 2
+    assert guard.breaker.state == "closed"
+    # Full jitter stays under the exponential cap
+    assert attempts[1] - attempts[0] <= 0.5 + 0.01 and attempts[2] - attempts[1] <= 1.0 + 0.02
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=clock)
+    guard = LLMGuard(requests_per_minute=6000, max_retries=0, breaker=breaker, clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise google_exceptions.ServiceUnavailable("503")
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            guard.call(down)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        guard.call(down)
+    assert len(calls) == 2 and guard.rejected == 1
+
+    # After the cool-down one probe goes through; a failed probe re-opens
+    clock.now += 30
+    assert breaker.state == "half_open"
+    with pytest.raises(LLMUnavailableError):
+        guard.call(down)
+    assert breaker.state == "open" and breaker.times_opened == 2
+
+    clock.now += 30
+    assert guard.call(lambda: "back") == "back"
+    assert breaker.state == "closed"
+
+
+def test_non_retryable_errors_do_not_trip_breaker():
+    guard = LLMGuard(max_retries=3, breaker=CircuitBreaker(failure_threshold=1))
+
+    def bad():
+        raise google_exceptions.InvalidArgument("bad prompt")
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        guard.call(bad)
+    assert guard.retries == 0 and guard.breaker.state == "closed"
+
+
+def test_analyze_serves_local_score_while_circuit_open(monkeypatch, tmp_path):
+    guard = LLMGuard(breaker=CircuitBreaker(failure_threshold=1, reset_seconds=60))
+    guard.breaker.record_failure()
+    monkeypatch.setattr(gemini_client, "LLM_GUARD", guard)
+    monkeypatch.setattr(gemini_client, "ANALYSIS_CACHE", AnalysisCache(path=str(tmp_path / "c.db")))
+
+    class Model:
+        def generate_content(self, prompt):
+            raise AssertionError("provider must not be called while the circuit is open")
+
+    fake = GeminiClient.__new__(GeminiClient)
+    fake.model_name = "test-model"
+    fake.model = Model()
+    app.dependency_overrides[gemini_client_dependency] = lambda: fake
+    company = {"id": "a", "name": "A", "latitude": 29.7, "longitude": -95.3,
+               "waste_streams": [{"name": "slag", "composition": {"CaO": 1.0}}]}
+    consumer = {"id": "b", "name": "B", "latitude": 29.8, "longitude": -95.3,
+                "needs": [{"name": "lime", "composition": {"CaO": 1.0}}]}
+    try:
+        r = TestClient(app).post("/analyze/", json={"company_a": company, "company_b": consumer})
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 200
+    assert r.headers["X-Scored-By"] == "local"
+    assert r.json()["chemical_notes"].startswith("Locally scored")
+    assert guard.rejected == 1
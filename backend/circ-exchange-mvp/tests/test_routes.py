@@ -11,7 +11,7 @@ client = TestClient(app)
 
 def setup_module(module):
     # Seed two simple facilities
-    STORE.facilities.clear()
+    STORE.clear_all()
     f1 = {
         "id": "t1",
         "name": "T1",
@@ -59,3 +59,173 @@ def test_explain_requires_key():
     }
     r = client.post("/explain", json=explain_req)
     assert r.status_code == 400
+
+
+def test_match_skips_candidates_outside_search_radius():
+    far = {
+        "id": "t3",
+        "name": "T3",
+        "latitude": 47.6,
+        "longitude": -122.3,
+        "waste_streams": [],
+        "needs": [{"name": "needA", "composition": {"a": 1.0}}],
+    }
+    client.post("/facilities", json=far)
+
+    # Houston -> Seattle is ~2,700 km: outside 500 km * 2 but inside 2000 km * 2
+    ids = [c["facility_id"] for c in client.get("/match/t1?radius_km=500").json()["candidates"]]
+    assert ids == ["t2"]
+    ids = [c["facility_id"] for c in client.get("/match/t1?radius_km=2000").json()["candidates"]]
+    assert ids == ["t2", "t3"]
+
+
+def test_component_stats():
+    r = client.get("/components/stats")
+    assert r.status_code == 200
+    stats = {s["component"]: s for s in r.json()["components"]}
+    assert stats["a"]["waste_facilities"] == 1
+    assert stats["a"]["need_facilities"] >= 1
+
+
+def test_match_top_k_is_prefix_of_full_ranking():
+    extra = [
+        {
+            "id": f"k{i}",
+            "name": f"K{i}",
+            "latitude": 29.8 + i * 0.05,
+            "longitude": -95.3,
+            "waste_streams": [],
+            "needs": [{"name": "needA", "composition": {"a": 1.0, "b": i / 10}}],
+        }
+        for i in range(8)
+    ]
+    client.post("/facilities/bulk", json=extra)
+
+    full = client.get("/match/t1?top_k=50").json()["candidates"]
+    keys = [(-c["score"], c["distance_km"]) for c in full]
+    assert keys == sorted(keys)
+    for k in (1, 3, 5):
+        top = client.get(f"/match/t1?top_k={k}").json()["candidates"]
+        assert top == full[:k]
+
+
+def test_match_batch_streams_ndjson():
+    r = client.post("/match/batch", json={"facility_ids": ["t1", "t2", "nope"], "top_k": 3})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = {row["facility_id"]: row for row in map(json.loads, r.text.splitlines())}
+    assert "error" in lines["nope"]
+    for facility_id in ("t1", "t2"):
+        single = client.get(f"/match/{facility_id}?top_k=3").json()["candidates"]
+        assert lines[facility_id]["candidates"] == single
+
+    r = client.post("/match/batch", json={"facility_ids": "all"})
+    assert len(r.text.splitlines()) == len(client.get("/facilities").json())
+
+
+def test_match_served_from_materialized_view():
+    client.get("/match/t1")
+    r = client.get("/match/t1")
+    assert r.headers["X-Match-View"] == "fresh"
+    assert client.get("/match/t1?radius_km=800").headers["X-Match-View"] == "bypass"
+
+    status_before = client.get("/match/view/status").json()
+    client.post("/facilities", json=client.get("/facilities").json()[1])
+    status_after = client.get("/match/view/status").json()
+    assert status_after["version"] == status_before["version"] + 1
+    assert client.get("/match/t1").json() == r.json()
+
+
+def test_match_does_not_renormalize_compositions(monkeypatch):
+    from app import composition, matcher
+
+    calls = []
+    original = matcher._normalize_comp
+
+    def counting(comp):
+        calls.append(comp)
+        return original(comp)
+
+    monkeypatch.setattr(composition, "_normalize_comp", counting)
+    monkeypatch.setattr(matcher, "_normalize_comp", counting)
+    client.post("/facilities", json=client.get("/facilities").json()[1])  # ingest normalizes; /match must not
+    calls.clear()
+    for query in ("/match/t1", "/match/t1", "/match/t1?radius_km=800"):
+        assert client.get(query).json()["candidates"]
+    assert calls == []
+
+
+def test_match_approx_mode():
+    exact = client.get("/match/t1?radius_km=800").json()["candidates"]
+    r = client.get("/match/t1?radius_km=800&mode=approx&bands=64")
+    assert r.status_code == 200
+    approx = r.json()["candidates"]
+    assert {c["facility_id"] for c in approx} <= {c["facility_id"] for c in exact}
+    assert client.get("/match/t1?mode=approx&bands=0").status_code == 422
+
+
+def _reference_match(source, facilities, radius_km, top_k):
+    """The original /match loop: best pair by weighted_jaccard, sorted by score desc, distance asc.
+
+    Similarities come from the normalized compositions the route compares; the raw-dict
+    `weighted_jaccard` sums in hash order, so it only agrees to the last bits.
+    Returns (facility_id, score, distance_km, composition_similarity) per candidate.
+    """
+    import math
+
+    from app.composition import NormalizedComposition
+    from app.matcher import haversine_km, score_match, weighted_jaccard
+
+    ranked = []
+    for cand in facilities:
+        if cand["id"] == source["id"]:
+            continue
+        dist = haversine_km(source["latitude"], source["longitude"], cand["latitude"], cand["longitude"])
+        best_sim = 0.0
+        for w in source["waste_streams"]:
+            for n in cand["needs"]:
+                sim = NormalizedComposition.from_mapping(w["composition"]).weighted_jaccard(
+                    NormalizedComposition.from_mapping(n["composition"])
+                )
+                assert math.isclose(sim, weighted_jaccard(w["composition"], n["composition"]), rel_tol=1e-12)
+                best_sim = max(best_sim, sim)
+        if best_sim > 0:
+            ranked.append((cand["id"], score_match(best_sim, dist, radius_km), dist, best_sim))
+    ranked.sort(key=lambda r: (-r[1], r[2]))
+    return ranked[:top_k]
+
+
+def test_match_order_equals_original_loop_on_permuted_ties():
+    import random
+
+    rng = random.Random(3)
+    # Few distinct compositions, listed in shuffled key order: equal scores are common
+    bases = [{"a": .7, "b": .2, "c": .1}, {"a": .1, "b": .2, "c": .7}, {"a": .35, "d": .65}, {"c": 3, "d": 97}]
+
+    def shuffled(comp):
+        keys = list(comp)
+        rng.shuffle(keys)
+        return {k: comp[k] for k in keys}
+
+    facilities = [
+        {
+            "id": f"p{i}", "name": f"P{i}",
+            "latitude": 29 + rng.uniform(-3, 3), "longitude": -95 + rng.uniform(-3, 3),
+            "waste_streams": [{"name": "w", "composition": shuffled(rng.choice(bases))}],
+            "needs": [{"name": "n", "composition": shuffled(rng.choice(bases))} for _ in range(rng.randint(1, 2))],
+        }
+        for i in range(80)
+    ]
+    STORE.clear_all()
+    client.post("/facilities/bulk", json=facilities)
+    try:
+        for source in facilities:
+            # Most candidates lie beyond radius_km, where scores differ only by similarity
+            got = client.get(f"/match/{source['id']}?radius_km=100&top_k=15&radius_factor=10").json()
+            expected = _reference_match(source, facilities, 100, 15)
+            assert [
+                (c["facility_id"], c["score"], c["distance_km"], c["composition_similarity"])
+                for c in got["candidates"]
+            ] == expected
+    finally:
+        setup_module(None)
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from app.services.gemini_client import GeminiClient
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_result():
+    flight = SingleFlight()
+    started = []
+
+    async def work(value):
+        started.append(value)
+        await asyncio.sleep(0.05)
+        return {"value": value}
+
+    async def main():
+        results = await asyncio.gather(
+            *(flight.run("k", lambda: work(1)) for _ in range(5)),
+            flight.run("other", lambda: work(2)),
+        )
+        # Finished keys are forgotten: a later call runs again
+        await flight.run("k", lambda: work(3))
+        return results
+
+    results = asyncio.run(main())
+    assert started == [1, 2, 3]
+    assert results[:5] == [{"value": 1}] * 5 and results[0] is results[4]
+    assert flight.stats() == {"calls": 3, "deduplicated": 4, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter_and_leader_cancel_is_isolated():
+    flight = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("quota")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 7
+
+    async def main():
+        errors = await asyncio.gather(*(flight.run("e", boom) for _ in range(3)), return_exceptions=True)
+        leader = asyncio.ensure_future(flight.run("s", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.run("s", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return errors, await follower
+
+    errors, value = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert value == 7
+
+
+def test_gemini_ask_coalesces_identical_questions(monkeypatch):
+    import app.services.gemini_client as gemini_module
+
+    flight = SingleFlight()
+    monkeypatch.setattr(gemini_module, "SINGLE_FLIGHT", flight)
+    calls = []
+
+    class Model:
+        def generate_content(self, prompt):
+            calls.append(prompt)
+            time.sleep(0.05)
+            return type("R", (), {"text": "answer"})()
+
+    client = GeminiClient.__new__(GeminiClient)
+    client.model_name = "test-model"
+    client.model = Model()
+
+    async def main():
+        return await asyncio.gather(
+            client.ask_question_async("What is slag?"),
+            client.ask_question_async("what  is SLAG?"),
+            client.ask_question_async("What is fly ash?"),
+        )
+
+    answers = asyncio.run(main())
+    assert [a.answer for a in answers] == ["answer"] * 3
+    assert len(calls) == 2
+    assert flight.stats()["deduplicated"] == 1
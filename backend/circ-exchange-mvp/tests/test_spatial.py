@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.matcher import HAVERSINE_ATOL_KM, HAVERSINE_RTOL, haversine_km, haversine_km_many, haversine_matrix
+from app.spatial import GridIndex
+
+
+def _brute_force(points, lat, lon, radius_km):
+    return {
+        key: haversine_km(lat, lon, p_lat, p_lon)
+        for key, (p_lat, p_lon) in points.items()
+        if haversine_km(lat, lon, p_lat, p_lon) <= radius_km
+    }
+
+
+def test_within_matches_brute_force():
+    rng = random.Random(3)
+    points = {f"p{i}": (rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(2000)}
+    grid = GridIndex(cell_deg=2.0)
+    for key, (lat, lon) in points.items():
+        grid.upsert(key, lat, lon)
+
+    # Include queries near the poles and across the antimeridian
+    queries = [(89.5, 10.0), (-88.0, -170.0), (10.0, 179.9), (-5.0, -179.5)]
+    queries += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(30)]
+    for lat, lon in queries:
+        for radius in (50.0, 500.0, 3000.0):
+            got = grid.within(lat, lon, radius)
+            expected = _brute_force(points, lat, lon, radius)
+            assert set(got) == set(expected)
+            for key, dist in got.items():
+                assert dist == pytest.approx(expected[key], rel=HAVERSINE_RTOL, abs=HAVERSINE_ATOL_KM)
+
+
+def test_upsert_moves_and_remove():
+    grid = GridIndex()
+    grid.upsert("a", 29.76, -95.37)
+    assert set(grid.within(29.76, -95.37, 10.0)) == {"a"}
+
+    grid.upsert("a", 40.71, -74.0)
+    assert grid.within(29.76, -95.37, 10.0) == {}
+    assert set(grid.within(40.71, -74.0, 10.0)) == {"a"}
+
+    grid.remove("a")
+    assert len(grid) == 0
+    assert grid.within(40.71, -74.0, 10.0) == {}
+
+
+def test_within_many_matches_within():
+    rng = random.Random(5)
+    grid = GridIndex(cell_deg=1.0)
+    for i in range(500):
+        grid.upsert(f"p{i}", rng.uniform(20, 50), rng.uniform(-120, -70))
+    grid.remove("p7")
+    grid.upsert("p7b", 35.0, -95.0)  # reuses the freed slot
+
+    keys = [f"p{i}" for i in range(0, 500, 3)] + ["p7b", "missing"]
+    results = dict(grid.within_many(keys, 400.0))
+    assert set(results) == set(keys) - {"missing"}
+    for key, nearby in results.items():
+        assert nearby == grid.within(*grid.location(key), 400.0)
+
+
+def test_vectorized_haversine_agrees_with_scalar():
+    rng = random.Random(9)
+    lats = [rng.uniform(-90, 90) for _ in range(300)]
+    lons = [rng.uniform(-180, 180) for _ in range(300)]
+    matrix = haversine_matrix(lats[:20], lons[:20], lats, lons)
+    for i in range(20):
+        many = haversine_km_many(lats[i], lons[i], lats, lons)
+        expected = [haversine_km(lats[i], lons[i], lat, lon) for lat, lon in zip(lats, lons)]
+        np.testing.assert_allclose(many, expected, rtol=HAVERSINE_RTOL, atol=HAVERSINE_ATOL_KM)
+        np.testing.assert_allclose(matrix[i], expected, rtol=HAVERSINE_RTOL, atol=HAVERSINE_ATOL_KM)
@@ -0,0 +1,155 @@
+import json
+
+import pytest
+
+from app.dataset import DEFAULT_DATASET_PATH
+from app.matcher import HAVERSINE_ATOL_KM, HAVERSINE_RTOL
+from app.models import Company, Facility
+from app.record_index import ListingQuery
+from app.sqlite_store import SqliteStore
+from app.store import InMemoryStore
+
+with open(DEFAULT_DATASET_PATH) as f:
+    COMPANIES = json.load(f)["companies"]
+
+
+def company(cid, lat=29.7, waste="slag"):
+    return Company(id=cid, name=cid, latitude=lat, longitude=-95.3,
+                   waste_streams=[{"name": waste, "composition": {"CaO": 1.0}}])
+
+
+def test_workers_share_one_dataset(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    a, b = SqliteStore(path), SqliteStore(path)
+    assert a._db().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    a.upsert_companies(COMPANIES)
+    a.upsert_company(company("m1"))
+    assert b.get_company("m1") is None
+    assert b.sync() == len(COMPANIES) + 1
+    assert [str(c["id"]) for c in b.list_companies()[:3]] == [str(c["id"]) for c in COMPANIES[:3]]
+    assert b.get_company("m1").waste_streams[0].name == "slag"
+    assert b.companies_within(29.7, -95.3, 1.0).keys() >= {"m1"}
+    assert b.sync() == 0
+
+    # An update keeps its position; the other worker's listeners hear about it
+    heard = []
+    b.company_listeners.append(heard.append)
+    a.upsert_company(company("m1", waste="fly ash"))
+    b.sync()
+    assert heard == ["m1"] and b.get_company("m1").waste_streams[0].name == "fly ash"
+    assert list(b.companies)[-1] == "m1" and len(b.companies) == len(COMPANIES) + 1
+
+    a.upsert_facilities([Facility(id="f1", name="f1", latitude=29.7, longitude=-95.3)])
+    b.sync()
+    assert b.get_facility("f1").name == "f1" and b.facilities_within(29.7, -95.3, 1.0) == {"f1": 0.0}
+
+    b.clear_all()
+    a.sync()
+    assert a.list_companies() == [] and a.list_facilities() == []
+    a.close()
+    b.close()
+
+
+def test_restart_loads_without_invalidating(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    first = SqliteStore(path)
+    first.upsert_companies([company("x"), company("y", lat=31.0)])
+    first.close()
+
+    restarted = SqliteStore(path)
+    heard = []
+    restarted.company_listeners.append(heard.append)
+    assert restarted.sync() == 2 and heard == []
+    assert [c.id for c in restarted.list_companies()] == ["x", "y"]
+    restarted.close()
+
+
+def _dump(record):
+    return record if isinstance(record, dict) else record.model_dump()
+
+
+def test_first_write_on_an_empty_database_notifies(tmp_path):
+    store = SqliteStore(str(tmp_path / "store.sqlite3"))
+    heard = []
+    store.company_listeners.append(heard.append)
+    store.upsert_company(company("x"))
+    store.upsert_companies([{"id": 7, "name": "N"}])
+    assert heard == ["x", "7"]
+    store.close()
+
+
+def test_listing_filters_use_the_secondary_indexes(tmp_path):
+    store = SqliteStore(str(tmp_path / "store.sqlite3"))
+    memory = InMemoryStore()
+    records = COMPANIES + [company("m1"), company("m2", waste="Fly Ash")]
+    store.upsert_companies(records)
+    memory.upsert_companies(records)
+
+    material = COMPANIES[0]["waste_stream"]["material"]
+    queries = [
+        ({"type": ["consumer"], "city": ["houston"], "state": ["tx"]}, None),
+        ({"industry": [COMPANIES[0]["industry"].casefold(), COMPANIES[1]["industry"].casefold()]}, None),
+        ({"material": [material.casefold(), "slag"]}, None),
+        ({"type": ["producer"]}, {"structure": ["new"]}),
+        ({"type": ["producer"], "category": [str(COMPANIES[0]["waste_stream"]["category"]).casefold()]}, None),
+    ]
+    for filters, extra in queries:
+        pages, after = [], None
+        while True:
+            query = ListingQuery(limit=5, after=after, filters=filters)
+            page, expected = store.company_page(query, extra), memory.company_page(query, extra)
+            assert (page.seqs, page.next_cursor, page.total) == (expected.seqs, expected.next_cursor, expected.total)
+            assert list(map(_dump, page.records)) == list(map(_dump, expected.records))
+            pages.append(page)
+            if not page.next_cursor:
+                break
+            after = page.seqs[-1]
+        assert sum(len(p.seqs) for p in pages) == pages[0].total > 0
+
+    for sql in ("SELECT id FROM companies WHERE type IN (?) AND city IN (?) ORDER BY seq",
+                "SELECT company_id FROM company_materials WHERE material IN (?)"):
+        plan = str(store._db().execute("EXPLAIN QUERY PLAN " + sql, ["x"] * sql.count("?")).fetchall())
+        assert "USING INDEX" in plan or "USING COVERING INDEX" in plan
+    store.close()
+
+
+def test_spatial_lookups_use_the_position_index(tmp_path, monkeypatch):
+    import random
+
+    from app.store import store_from_env
+
+    monkeypatch.setenv("STORE_BACKEND", "sqlite")
+    monkeypatch.setenv("STORE_PATH", str(tmp_path / "store.sqlite3"))
+    store, memory = store_from_env(), InMemoryStore()
+    assert isinstance(store, SqliteStore)
+
+    rng = random.Random(4)
+    facilities = [
+        Facility(id=f"f{i}", name=f"f{i}", latitude=rng.uniform(-90, 90), longitude=rng.uniform(-180, 180),
+                 waste_streams=[{"name": "w", "composition": {"CaO": 1.0}}],
+                 needs=[{"name": "n", "composition": {"CaO": rng.uniform(0.1, 1.0), "SiO2": 0.5}}])
+        for i in range(400)
+    ]
+    companies = [company(f"c{i}", lat=rng.uniform(-60, 60)) for i in range(50)]
+    for target in (store, memory):
+        target.upsert_facilities(facilities)
+        target.upsert_companies(companies)
+
+    # Include queries near the poles and across the antimeridian
+    queries = [(89.5, 10.0), (-88.0, -170.0), (10.0, 179.9), (-5.0, -179.5), (29.7, -95.3)]
+    queries += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(20)]
+    for lat, lon in queries:
+        for radius in (50.0, 800.0, 5000.0):
+            for kind in ("facilities_within", "companies_within"):
+                got, expected = getattr(store, kind)(lat, lon, radius), getattr(memory, kind)(lat, lon, radius)
+                assert got.keys() == expected.keys()
+                assert got == pytest.approx(expected, rel=HAVERSINE_RTOL, abs=HAVERSINE_ATOL_KM)
+    for facility in facilities[:20]:
+        assert store.match_view.lookup(facility.id, 10) == memory.match_view.lookup(facility.id, 10)
+
+    for table in ("facilities", "companies"):
+        sql = f"SELECT id FROM {table} WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+        plan = str(store._db().execute("EXPLAIN QUERY PLAN " + sql, [0, 1, 0, 1]).fetchall())
+        assert f"{table}_position" in plan
+    store.close()
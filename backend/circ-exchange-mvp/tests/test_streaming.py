@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.gemini_client import GeminiClient, gemini_client_dependency
+from app.services.sse import sse_stream
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StreamingModel:
+    """Yields chunks slowly and records whether the stream was closed early."""
+
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def generate_content(self, prompt, stream=False):
+        assert stream
+        model = self
+
+        def gen():
+            try:
+                for text in model.chunks:
+                    time.sleep(model.delay)
+                    yield _Chunk(text)
+            finally:
+                model.closed.set()
+
+        return gen()
+
+
+def _client(model):
+    client = GeminiClient.__new__(GeminiClient)
+    client.model_name = "test-model"
+    client.model = model
+    return client
+
+
+def _events(body):
+    frames = [f for f in body.split("\n\n") if f]
+    out = []
+    for frame in frames:
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        out.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return out
+
+
+def test_ask_stream_forwards_chunks_as_sse():
+    model = StreamingModel(["Slag ", "can replace\\n", "clinker."])
+    app.dependency_overrides[gemini_client_dependency] = lambda: _client(model)
+    try:
+        r = TestClient(app).post("/ask/stream", json={"question": "slag?"})
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert _events(r.text) == [
+        ("message", {"text": "Slag "}), ("message", {"text": "can replace\\n"}),
+        ("message", {"text": "clinker."}), ("done", {}),
+    ]
+
+
+def test_first_event_arrives_before_generation_finishes():
+    model = StreamingModel(["a", "b", "c", "d"], delay=0.1)
+    chunks = _client(model).stream_question("q")
+
+    async def consume():
+        start = time.perf_counter()
+        frames, first_at = [], None
+        async for frame in sse_stream(chunks):
+            if first_at is None:
+                first_at = time.perf_counter() - start
+            frames.append(frame)
+        return frames, first_at, time.perf_counter() - start
+
+    frames, first_at, total = asyncio.run(consume())
+    assert len(frames) == 5
+    # Time to first byte is one chunk's latency, not the whole generation
+    assert first_at < 0.25 < total
+
+
+def test_abandoned_stream_closes_provider_stream():
+    model = StreamingModel([str(i) for i in range(100)], delay=0.01)
+    chunks = _client(model).stream_question("q")
+
+    async def consume_two():
+        agen = sse_stream(chunks)
+        got = [await agen.__anext__(), await agen.__anext__()]
+        await agen.aclose()  # what Starlette does when the client disconnects
+        return got
+
+    got = asyncio.run(consume_two())
+    assert len(got) == 2
+    assert model.closed.wait(2.0)
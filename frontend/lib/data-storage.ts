@@ -268,33 +268,24 @@ export const searchListings = async (
 }
 
 // Get unique materials and locations for dropdowns from sample data
+// (precomputed facets: distinct values with counts, a few KB instead of the full dataset)
+const getFacetValues = async (field: string): Promise<string[]> => {
+  const response = await fetch(`http://localhost:8001/companies/demo/facets?fields=${field}`, {
+    method: 'GET',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+  })
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${field} facets: ${response.status} ${response.statusText}`)
+  }
+  const facets = await response.json()
+  return (facets[field] || []).map((facet: { value: string; count: number }) => facet.value)
+}
+
 export const getUniqueMaterials = async (): Promise<string[]> => {
   try {
-    const response = await fetch('http://localhost:8001/companies/demo', {
-      method: 'GET',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-    })
-    if (!response.ok) {
-      console.error('Failed to fetch materials:', response.status, response.statusText)
-      return []
-    }
-    
-    const data = await response.json()
-    const companies = Array.isArray(data) ? data : (data.companies || [])
-    
-    const materials = new Set<string>()
-    companies.forEach((company: any) => {
-      if (company.waste_stream?.material) {
-        materials.add(company.waste_stream.material)
-      }
-      if (company.material_needs?.material) {
-        materials.add(company.material_needs.material)
-      }
-    })
-    
-    return Array.from(materials).sort()
+    return await getFacetValues('material')
   } catch (error) {
     console.error('Error fetching materials:', error)
     return []
@@ -303,28 +294,7 @@ export const getUniqueMaterials = async (): Promise<string[]> => {
 
 export const getUniqueLocations = async (): Promise<string[]> => {
   try {
-    const response = await fetch('http://localhost:8001/companies/demo', {
-      method: 'GET',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-    })
-    if (!response.ok) {
-      console.error('Failed to fetch locations:', response.status, response.statusText)
-      return []
-    }
-    
-    const data = await response.json()
-    const companies = Array.isArray(data) ? data : (data.companies || [])
-    
-    const locations = new Set<string>()
-    companies.forEach((company: any) => {
-      if (company.location?.city && company.location?.state) {
-        locations.add(`${company.location.city}, ${company.location.state}`)
-      }
-    })
-    
-    return Array.from(locations).sort()
+    return await getFacetValues('location')
   } catch (error) {
     console.error('Error fetching locations:', error)
     return []